@@ -0,0 +1,306 @@
+"""Event driven simulation of agents trading with the AMM over time
+
+Agents (traders, liquidity providers, arbitrageurs, the oracle) schedule
+timestamped events on a priority queue. The simulator pops events in time
+order and calls the owning agent, which acts on the pool through
+AgentSimulator.execute (a wrapper around perform_action) and schedules its
+next event. Agent policies are pluggable: any object with start(sim, agent_id)
+and on_event(sim, agent_id, payload) methods can take part.
+
+Each agent's coin, long, short and LP share holdings are updated as its
+actions execute, so per-agent P&L is available at any time by marking the
+holdings to the oracle price, without storing the event history.
+
+Example:
+    from amm_core import set_amm_state
+    s_0 = set_amm_state(10000, 100, 100, 0.5, 100)
+    agents = [OracleAgent(), OrderFlowAgent(rate=10), Arbitrageur(rate=1), LiquidityProvider(rate=0.01)]
+    sim = AgentSimulator(s_0, agents, coin_per_pair=100, seed=42)
+    summary = sim.run(until=100_000)
+    summary['pnl']
+"""
+import heapq
+import itertools
+
+import numpy as np
+
+from amm_backtest import RandomOrderFlow
+from amm_core import perform_action, set_amm_state, get_amm_balance, get_amm_spot_prices, get_arbitrage_swap_batch
+
+# Per agent holdings, coin and tokens are net amounts received from the pool
+HOLDING_FIELDS = ('coin', 'long', 'short', 'shares')
+SUMMARY_FIELDS = ('name',) + HOLDING_FIELDS + ('pnl', 'n_events', 'n_actions', 'n_rejected', 'volume')
+
+
+class Agent(object):
+    """Base agent with Poisson event times at given rate, override act"""
+
+    def __init__(self, rate=1., name=None):
+        self.rate = rate
+        self.name = name or type(self).__name__
+
+    def next_delay(self, sim):
+        return sim.rng.exponential(1 / self.rate)
+
+    def start(self, sim, agent_id):
+        sim.schedule_after(self.next_delay(sim), agent_id)
+
+    def on_event(self, sim, agent_id, payload):
+        self.act(sim, agent_id)
+        sim.schedule_after(self.next_delay(sim), agent_id)
+
+    def act(self, sim, agent_id):
+        raise NotImplementedError
+
+
+class OracleAgent(Agent):
+    """Oracle updates at fixed interval, random walk in log odds of long price / coin_per_pair
+
+    With rebalance the pool weights are re-centred on each new oracle price, as
+    the pool controller does on-chain.
+    """
+
+    def __init__(self, interval=1., vol=0.01, rebalance=True, name=None):
+        super().__init__(1 / interval, name)
+        self.interval = interval
+        self.vol = vol
+        self.rebalance = rebalance
+
+    def next_delay(self, sim):
+        return self.interval
+
+    def act(self, sim, agent_id):
+        v = sim.oracle_price / sim.coin_per_pair
+        log_odds = np.log(v / (1 - v)) + self.vol * sim.rng.standard_normal()
+        sim.set_oracle_price(sim.coin_per_pair / (1 + np.exp(-log_odds)), self.rebalance)
+
+
+class OrderFlowAgent(Agent):
+    """Trader following an order flow callable as used by amm_backtest.backtest
+
+    :param order_flow: callable(rng, state, oracle_long_price, coin_per_pair) returning
+        list of [action, a_c, action_params], default RandomOrderFlow with certain trade
+        and no liquidity events
+    """
+
+    def __init__(self, order_flow=None, rate=1., name=None):
+        super().__init__(rate, name)
+        self.order_flow = RandomOrderFlow(trade_prob=1., deposit_prob=0., withdraw_prob=0.) \
+            if order_flow is None else order_flow
+
+    def act(self, sim, agent_id):
+        for action, a_c, params in self.order_flow(sim.rng, sim.state, sim.oracle_price, sim.coin_per_pair):
+            sim.execute(agent_id, action, a_c, **params)
+
+
+class LiquidityProvider(Agent):
+    """Deposits size * pool balance, or withdraws size of its own share of the pool"""
+
+    def __init__(self, rate=0.01, deposit_prob=0.5, size=0.05, name=None):
+        super().__init__(rate, name)
+        self.deposit_prob = deposit_prob
+        self.size = size
+
+    def act(self, sim, agent_id):
+        if sim.rng.random() < self.deposit_prob:
+            sim.execute(agent_id, 'deposit', self.size * get_amm_balance(sim.state))
+        else:
+            a_c = self.size * sim.share_value(sim.holdings[agent_id][3])
+            if a_c > 0:
+                sim.execute(agent_id, 'withdraw', a_c)
+
+
+class Arbitrageur(Agent):
+    """Swaps the long or short token until its marginal price including fee equals the
+    oracle price, choosing the side with the larger profit marked to oracle"""
+
+    def __init__(self, rate=1., min_profit=0., name=None):
+        super().__init__(rate, name)
+        self.min_profit = min_profit
+
+    def act(self, sim, agent_id):
+        best = None
+        for is_long, price in ((True, sim.oracle_price), (False, sim.coin_per_pair - sim.oracle_price)):
+            buy, aI, aO = (float(a) for a in get_arbitrage_swap_batch(
+                sim.state, price, is_long=is_long, sF=sim.sF))
+            profit = aO * price - aI if buy else aO - aI * price
+            if np.isfinite(profit) and profit > self.min_profit and (best is None or profit > best[0]):
+                best = (profit, is_long, bool(buy), aI)
+        if best is not None:
+            _, is_long, buy, aI = best
+            if buy:
+                sim.execute(agent_id, 'swap_from_coin', aI, to_long=is_long, rebalance=True)
+            else:
+                sim.execute(agent_id, 'swap_to_coin', aI, from_long=is_long, rebalance=True)
+
+
+class AgentSimulator(object):
+    """Event heap simulator of agents acting on a single AMM pool
+
+    The initial pool liquidity is held outside the agents as initial_shares,
+    with one share worth one coin of initial pool balance.
+    """
+
+    def __init__(self, initial_state, agents, coin_per_pair=100, oracle_price=None, sF=0,
+                 rebalance_type='oracle', seed=None):
+        """
+        :param initial_state: AMM state
+        :param agents: list of agents, agent_id is the index in this list
+        :param coin_per_pair: coin needed to mint 1 L + 1 S
+        :param oracle_price: initial oracle long price, default AMM long spot price
+        :param sF: swap fee applied to all swaps
+        :param rebalance_type: rebalance type used for deposit and withdraw
+        :param seed: seed for numpy random Generator shared by agents
+        """
+        self.state = list(initial_state)
+        self.agents = list(agents)
+        self.coin_per_pair = coin_per_pair
+        self.oracle_price = get_amm_spot_prices(self.state)[0] if oracle_price is None else oracle_price
+        self.sF = sF
+        self.rebalance_type = rebalance_type
+        self.rng = np.random.default_rng(seed)
+        self.time = 0.
+        self.n_events = 0
+        self.initial_shares = get_amm_balance(self.state)
+        self.total_shares = self.initial_shares
+        self.holdings = [[0., 0., 0., 0.] for _ in self.agents]
+        self.agent_events = [0] * len(self.agents)
+        self.n_actions = [0] * len(self.agents)
+        self.n_rejected = [0] * len(self.agents)
+        self.volume = [0.] * len(self.agents)
+        self._heap = []
+        self._seq = itertools.count()
+        for agent_id, agent in enumerate(self.agents):
+            agent.start(self, agent_id)
+
+    def schedule(self, time, agent_id, payload=None):
+        """Schedule event for agent at absolute time, events at equal times run in schedule order"""
+        heapq.heappush(self._heap, (time, next(self._seq), agent_id, payload))
+
+    def schedule_after(self, delay, agent_id, payload=None):
+        self.schedule(self.time + delay, agent_id, payload)
+
+    def set_oracle_price(self, price, rebalance=True):
+        """Update oracle long price, optionally re-centring pool weights on it"""
+        self.oracle_price = price
+        if rebalance:
+            x_c, x_l, x_s = self.state[:3]
+            self.state = set_amm_state(x_c, x_l, x_s, price / self.coin_per_pair, self.coin_per_pair)
+
+    def share_value(self, shares):
+        """Coin value of LP shares at AMM spot prices"""
+        return shares * get_amm_balance(self.state) / self.total_shares
+
+    def execute(self, agent_id, action, a_c, **params):
+        """Perform action on pool for agent and update its holdings
+
+        Swaps use the simulator swap fee, deposit and withdraw the current oracle
+        price and rebalance_type. Actions that fail, produce an invalid state or
+        withdraw more than the agent's share of the pool are rejected.
+
+        :return: tok_out, avg_price as for perform_action, None if rejected
+        """
+        holding = self.holdings[agent_id]
+        if action in {'swap_from_coin', 'swap_to_coin'}:
+            params.setdefault('sF', self.sF)
+        elif action in {'deposit', 'withdraw'}:
+            params.setdefault('oracle_price', self.oracle_price)
+            params.setdefault('rebalance_type', self.rebalance_type)
+            share_price = get_amm_balance(self.state) / self.total_shares
+            d_shares = a_c / share_price if action == 'deposit' else -a_c / share_price
+            if holding[3] + d_shares < 0:
+                self.n_rejected[agent_id] += 1
+                return None
+        try:
+            new_state, tok_out, avg_price = perform_action(
+                action, self.state, a_c, coin_per_pair=self.coin_per_pair, **params)
+        except (ValueError, ZeroDivisionError):
+            self.n_rejected[agent_id] += 1
+            return None
+        if not all(np.isfinite(new_state)) or min(new_state) <= 0:
+            self.n_rejected[agent_id] += 1
+            return None
+        self.state = new_state
+        self.n_actions[agent_id] += 1
+
+        if action == 'swap_from_coin':
+            holding[0] -= a_c
+            holding[1 if params.get('to_long', True) else 2] += tok_out
+            self.volume[agent_id] += a_c
+        elif action == 'swap_to_coin':
+            holding[1 if params.get('from_long', True) else 2] -= a_c
+            holding[0] += tok_out
+            self.volume[agent_id] += tok_out
+        elif action in {'deposit', 'withdraw'}:
+            holding[0] += -a_c if action == 'deposit' else a_c
+            holding[3] += d_shares
+            self.total_shares += d_shares
+        # mint_redeem only changes pool balances
+        return tok_out, avg_price
+
+    def run(self, until=None, max_events=None, reporter=None, report_every=100_000):
+        """Process events in time order
+
+        :param until: stop before first event after this time
+        :param max_events: stop after this many events
+        :param reporter: optional callable(sim) called every report_every events
+        :param report_every: number of events between reporter calls
+        :return: summary, see summary
+        """
+        heap = self._heap
+        n_run = 0
+        while heap and (max_events is None or n_run < max_events):
+            if until is not None and heap[0][0] > until:
+                break
+            self.time, _, agent_id, payload = heapq.heappop(heap)
+            self.agents[agent_id].on_event(self, agent_id, payload)
+            self.agent_events[agent_id] += 1
+            self.n_events += 1
+            n_run += 1
+            if reporter is not None and self.n_events % report_every == 0:
+                reporter(self)
+        if until is not None:
+            self.time = max(self.time, until)
+        return self.summary()
+
+    def lp_value(self):
+        """Pool value at oracle prices"""
+        x_c, x_l, x_s = self.state[:3]
+        return x_c + x_l * self.oracle_price + x_s * (self.coin_per_pair - self.oracle_price)
+
+    def agent_pnl(self):
+        """P&L of each agent with holdings marked to oracle prices and LP shares
+        to the pool value at oracle prices
+
+        :return: array of shape (n_agents,)
+        """
+        holdings = np.array(self.holdings).reshape(-1, len(HOLDING_FIELDS))
+        prices = np.array([1., self.oracle_price, self.coin_per_pair - self.oracle_price,
+                           self.lp_value() / self.total_shares])
+        return holdings @ prices
+
+    def summary(self):
+        """Current per-agent totals
+
+        :return: dict with keys SUMMARY_FIELDS of arrays of shape (n_agents,), plus
+            time, n_events_total, state, oracle_price and initial_lp_value (value of the
+            initial liquidity at oracle prices)
+        """
+        holdings = np.array(self.holdings).reshape(-1, len(HOLDING_FIELDS))
+        result = {
+            'name': np.array([agent.name for agent in self.agents]),
+            **{name: holdings[:, i] for i, name in enumerate(HOLDING_FIELDS)},
+            'pnl': self.agent_pnl(),
+            'n_events': np.array(self.agent_events),
+            'n_actions': np.array(self.n_actions),
+            'n_rejected': np.array(self.n_rejected),
+            'volume': np.array(self.volume),
+        }
+        result.update({
+            'time': self.time,
+            'n_events_total': self.n_events,
+            'state': list(self.state),
+            'oracle_price': self.oracle_price,
+            'initial_lp_value': self.initial_shares * self.lp_value() / self.total_shares,
+        })
+        return result
@@ -0,0 +1,194 @@
+"""Arbitrage between the AMM pool, mint/redeem at coin_per_pair and the oracle price
+
+For a batch of pool states finds the profit maximizing trade among:
+
+    mint_sell   mint n pairs for n * C coin and sell n long and n short to the pool
+    buy_redeem  buy n long and n short from the pool and redeem for n * C coin
+    long        swap long token with the pool until its marginal price including fee
+                equals the oracle price
+    short       as long for the short token at C - oracle price
+
+Selling n of both tokens to the pool returns  x_c * (1 - A(n) * B(n))  coin with
+    A(n) = (x_l / (x_l + n * (1 - sF))) ^ (w_l / w_c)
+    B(n) = (x_s / (x_s + n * (1 - sF))) ^ (w_s / w_c)
+which is concave in n, and buying is the mirror image, so mint_sell and
+buy_redeem profits are concave and their optimum is found by vectorized
+bisection on the analytic derivative. mint_sell is profitable only if
+(1 - sF) * (P_l + P_s) > C and buy_redeem only if (P_l + P_s) / (1 - sF) < C.
+Mint/redeem trades are risk free, the long/short trades are marked to the
+oracle price.
+
+The long/short trades can be checked against a grid search with
+
+    python amm_arbitrage.py
+"""
+import numpy as np
+
+from amm_core import calc_out_given_in, get_arbitrage_swap_batch, set_amm_state_batch
+
+STRATEGIES = ('none', 'mint_sell', 'buy_redeem', 'long', 'short')
+# Ignore mint/redeem opportunities smaller than rounding error at zero size
+MIN_MARGIN = 1e-9
+
+
+def _bisect_decreasing(g, lo, hi, n_iter=100):
+    """Vectorized root of decreasing function g on [lo, hi] with g(lo) > 0 > g(hi)"""
+    for _ in range(n_iter):
+        mid = 0.5 * (lo + hi)
+        positive = g(mid) > 0
+        lo = np.where(positive, mid, lo)
+        hi = np.where(positive, hi, mid)
+    return 0.5 * (lo + hi)
+
+
+def mint_sell_arbitrage(x_c, x_l, x_s, w_c, w_l, w_s, C, sF=0, n_iter=100):
+    """Optimal number of pairs to mint and sell to pool, and coin profit
+
+    :return: pairs n (0 where unprofitable), profit
+    """
+    r_l = w_l / w_c
+    r_s = w_s / w_c
+
+    def coin_out(n):
+        n_fee = n * (1 - sF)
+        return x_c * (1 - (x_l / (x_l + n_fee)) ** r_l * (x_s / (x_s + n_fee)) ** r_s)
+
+    def marginal_profit(n):
+        n_fee = n * (1 - sF)
+        ab = (x_l / (x_l + n_fee)) ** r_l * (x_s / (x_s + n_fee)) ** r_s
+        return x_c * ab * (1 - sF) * (r_l / (x_l + n_fee) + r_s / (x_s + n_fee)) - C
+
+    profitable = marginal_profit(np.zeros_like(x_c)) > MIN_MARGIN * C
+    # Bracket optimum by doubling, marginal profit tends to -C
+    hi = np.where(profitable, x_l + x_s, 0.)
+    for _ in range(64):
+        need = profitable & (marginal_profit(hi) > 0)
+        if not np.any(need):
+            break
+        hi = np.where(need, 2 * hi, hi)
+    n = np.where(profitable, _bisect_decreasing(marginal_profit, np.zeros_like(hi), hi, n_iter), 0.)
+    return n, coin_out(n) - n * C
+
+
+def buy_redeem_arbitrage(x_c, x_l, x_s, w_c, w_l, w_s, C, sF=0, n_iter=100):
+    """Optimal number of pairs to buy from pool and redeem, and coin profit
+
+    :return: pairs n (0 where unprofitable), profit
+    """
+    r_l = w_l / w_c
+    r_s = w_s / w_c
+    fee = 1 - sF
+
+    def coin_in(n):
+        # Buy long first, coin balance then includes full coin paid in
+        a = (x_l / (x_l - n)) ** r_l
+        b = (x_s / (x_s - n)) ** r_s
+        return x_c / fee * ((a - 1) + (1 + (a - 1) / fee) * (b - 1))
+
+    def marginal_profit(n):
+        a = (x_l / (x_l - n)) ** r_l
+        b = (x_s / (x_s - n)) ** r_s
+        da = a * r_l / (x_l - n)
+        db = b * r_s / (x_s - n)
+        return C - x_c / fee * (da + da / fee * (b - 1) + (1 + (a - 1) / fee) * db)
+
+    profitable = marginal_profit(np.zeros_like(x_c)) > MIN_MARGIN * C
+    # Marginal cost goes to infinity as n approaches smaller token balance
+    hi = np.where(profitable, np.minimum(x_l, x_s) * (1 - 1e-12), 0.)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.where(profitable, _bisect_decreasing(marginal_profit, np.zeros_like(hi), hi, n_iter), 0.)
+    return n, n * C - coin_in(n)
+
+
+def find_arbitrage_batch(states, oracle_price, coin_per_pair=100, sF=0, directional=True, n_iter=100):
+    """Profit maximizing arbitrage trade for each pool state
+
+    :param states: array of shape (N, 6)
+    :param oracle_price: oracle long token price in coin, shape (N,) or scalar
+        (short token oracle price is coin_per_pair - oracle_price)
+    :param coin_per_pair: coin to mint 1 L + 1 S, shape (N,) or scalar
+    :param sF: swap fee
+    :param directional: include long/short trades to the oracle price, which are
+        marked to oracle rather than risk free
+    :param n_iter: bisection iterations for mint/redeem size
+    :return: dict of arrays of shape (N,)
+        strategy: index into STRATEGIES
+        pairs: pairs minted (> 0) or redeemed (< 0)
+        amount_in: per swap amount in, tokens of each side for mint_sell, coin for
+            buy_redeem, coin (from_coin) or token in for long/short
+        from_coin: True where swaps are coin in for tokens
+        profit: profit in coin
+    """
+    states = np.asarray(states, dtype=float)
+    x_c, x_l, x_s, w_c, w_l, w_s = np.moveaxis(states, -1, 0)
+    oracle_price, C = np.broadcast_arrays(np.asarray(oracle_price, dtype=float), np.asarray(coin_per_pair, dtype=float))
+    oracle_price = np.broadcast_to(oracle_price, x_c.shape)
+    C = np.broadcast_to(C, x_c.shape)
+
+    n_mint, profit_mint = mint_sell_arbitrage(x_c, x_l, x_s, w_c, w_l, w_s, C, sF, n_iter)
+    n_redeem, profit_redeem = buy_redeem_arbitrage(x_c, x_l, x_s, w_c, w_l, w_s, C, sF, n_iter)
+    coin_in_redeem = n_redeem * C - profit_redeem
+
+    candidates = [np.zeros_like(x_c), profit_mint, profit_redeem]
+    amount_in = [np.zeros_like(x_c), n_mint, coin_in_redeem]
+    from_coin = [np.zeros(x_c.shape, dtype=bool), np.zeros(x_c.shape, dtype=bool), np.ones(x_c.shape, dtype=bool)]
+    if directional:
+        for is_long, price in ((True, oracle_price), (False, C - oracle_price)):
+            buy, aI, aO = get_arbitrage_swap_batch(states, price, is_long=is_long, sF=sF)
+            candidates.append(np.where(buy, aO * price - aI, aO - aI * price))
+            amount_in.append(aI)
+            from_coin.append(buy)
+
+    candidates = np.nan_to_num(np.stack(candidates), nan=-np.inf)
+    best = np.argmax(candidates, axis=0)
+
+    def pick(values):
+        return np.take_along_axis(np.stack(values), best[None], axis=0)[0]
+
+    return {
+        'strategy': best,
+        'pairs': np.where(best == 1, n_mint, np.where(best == 2, -n_redeem, 0.)),
+        'amount_in': pick(amount_in),
+        'from_coin': pick(from_coin),
+        'profit': pick(candidates),
+    }
+
+
+def brute_force_directional_profit(states, price, is_long=True, sF=0, n_grid=20_001):
+    """Best profit of swapping long or short token against price by grid search over swap size
+
+    Check for the analytic trade of get_arbitrage_swap_batch, coin in up to the
+    pool coin balance and token in up to the pool token balance.
+
+    :return: array of best profit, 0 if no swap is profitable
+    """
+    states = np.asarray(states, dtype=float)
+    x_c, x_l, x_s, w_c, w_l, w_s = (a[..., np.newaxis] for a in np.moveaxis(states, -1, 0))
+    price = np.asarray(price, dtype=float)[..., np.newaxis]
+    x_t, w_t = (x_l, w_l) if is_long else (x_s, w_s)
+    grid = np.linspace(0., 1., n_grid)
+    coin_in = x_c * grid
+    tok_in = x_t * grid
+    profit_buy = calc_out_given_in(x_t, w_t, x_c, w_c, coin_in, sF) * price - coin_in
+    profit_sell = calc_out_given_in(x_c, w_c, x_t, w_t, tok_in, sF) - tok_in * price
+    return np.maximum(profit_buy.max(axis=-1), profit_sell.max(axis=-1))
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    n = 1000
+    C = 100.
+    states = set_amm_state_batch(
+        rng.uniform(1e5, 1e6, n), rng.uniform(1e3, 1e4, n), rng.uniform(1e3, 1e4, n), rng.uniform(0.2, 0.8, n), C)
+    oracle_price = rng.uniform(20., 80., n)
+    worst = 0.
+    for sF in (0., 0.003, 0.01, 0.05):
+        for is_long, price in ((True, oracle_price), (False, C - oracle_price)):
+            buy, aI, aO = get_arbitrage_swap_batch(states, price, is_long=is_long, sF=sF)
+            profit = np.where(buy, aO * price - aI, aO - aI * price)
+            brute = brute_force_directional_profit(states, price, is_long=is_long, sF=sF)
+            # Analytic trade should be at least as good as any grid point
+            shortfall = np.max((brute - profit) / np.maximum(np.abs(brute), 1.))
+            worst = max(worst, shortfall)
+            print(f"sF={sF:<6} {'long' if is_long else 'short':<6} max relative shortfall vs grid {shortfall:.2e}")
+    assert worst < 1e-9, worst
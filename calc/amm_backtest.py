@@ -0,0 +1,191 @@
+"""Backtest AMM rebalance strategies against historical oracle prices
+
+Oracle prices are streamed in chunks from a CSV file or a memory mapped binary
+file of float64 (timestamp, price) rows, so long histories never need to be
+loaded into memory. Each tick the oracle update re-centres the pool weights
+(as the pool controller does on-chain), synthetic order flow trades against
+the pool and liquidity providers deposit or withdraw using the chosen
+rebalance_type. Results are yielded per chunk.
+
+Example:
+    chunks = iter_price_csv('prices.csv', chunk_size=100_000)
+    results = backtest(chunks, initial_state, coin_per_pair=100, rebalance_type='amm')
+    write_results_csv(results, 'backtest.csv')
+"""
+import csv
+
+import numpy as np
+
+from amm_core import perform_action, set_amm_state, get_amm_balance, get_amm_spot_prices
+
+RESULT_FIELDS = (
+    'timestamp', 'oracle_price', 'lp_value', 'pool_value', 'rebalance_loss', 'net_deposit', 'n_trades'
+)
+
+
+def iter_price_csv(path, price_column='price', time_column='timestamp', chunk_size=100_000):
+    """Read oracle price series from CSV file in chunks
+
+    :return: yields (timestamps, prices) float arrays of up to chunk_size rows
+    """
+    with open(path, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        timestamps = []
+        prices = []
+        for row in reader:
+            timestamps.append(float(row[time_column]))
+            prices.append(float(row[price_column]))
+            if len(prices) == chunk_size:
+                yield np.array(timestamps), np.array(prices)
+                timestamps = []
+                prices = []
+        if prices:
+            yield np.array(timestamps), np.array(prices)
+
+
+def iter_price_binary(path, chunk_size=1_000_000):
+    """Read oracle price series from raw float64 file of (timestamp, price) rows via memory map
+
+    Write such a file with np.column_stack([timestamps, prices]).astype(np.float64).tofile(path)
+
+    :return: yields (timestamps, prices) arrays of up to chunk_size rows
+    """
+    data = np.memmap(path, dtype=np.float64, mode='r').reshape(-1, 2)
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = np.array(data[start:start + chunk_size])
+        yield chunk[:, 0], chunk[:, 1]
+
+
+class RandomOrderFlow(object):
+    """Synthetic order flow: noise traders, informed traders and liquidity providers
+
+    Each tick a trade occurs with probability trade_prob. Informed trades buy the
+    token that the pool prices below the oracle, noise trades pick side and
+    direction at random. Order sizes are log-normal fractions of the pool
+    balance of the traded token. LP deposits and withdrawals occur with the
+    given probabilities.
+    """
+
+    def __init__(self, trade_prob=0.5, informed_fraction=0.2, size_mean=0.001, size_sigma=1.,
+                 deposit_prob=0.001, withdraw_prob=0.001, liquidity_size=0.05):
+        self.trade_prob = trade_prob
+        self.informed_fraction = informed_fraction
+        self.size_mean = size_mean
+        self.size_sigma = size_sigma
+        self.deposit_prob = deposit_prob
+        self.withdraw_prob = withdraw_prob
+        self.liquidity_size = liquidity_size
+
+    def __call__(self, rng, state, oracle_price, coin_per_pair):
+        """Return list of [action, a_c, action_params] for one tick"""
+        actions = []
+        if rng.random() < self.trade_prob:
+            size = self.size_mean * rng.lognormal(0., self.size_sigma)
+            if rng.random() < self.informed_fraction:
+                is_long = rng.random() < 0.5
+                amm_price = get_amm_spot_prices(state)[0 if is_long else 1]
+                tok_oracle = oracle_price if is_long else coin_per_pair - oracle_price
+                buy = amm_price < tok_oracle
+            else:
+                is_long = rng.random() < 0.5
+                buy = rng.random() < 0.5
+            # Size buys and sells by the same fraction of the traded token's pool balance
+            tok_amount = size * state[1 if is_long else 2]
+            if buy:
+                tok_price = get_amm_spot_prices(state)[0 if is_long else 1]
+                actions.append(['swap_from_coin', tok_amount * tok_price, {'to_long': is_long, 'rebalance': True}])
+            else:
+                actions.append(['swap_to_coin', tok_amount, {'from_long': is_long, 'rebalance': True}])
+        u = rng.random()
+        if u < self.deposit_prob:
+            actions.append(['deposit', self.liquidity_size * get_amm_balance(state), {}])
+        elif u < self.deposit_prob + self.withdraw_prob:
+            actions.append(['withdraw', self.liquidity_size * get_amm_balance(state), {}])
+        return actions
+
+
+def backtest(price_chunks, initial_state, coin_per_pair=100, floor=0., cap=None,
+             rebalance_type='oracle', rebalance_on_tick=True, order_flow=None, seed=None):
+    """Run backtest over streamed oracle prices
+
+    :param price_chunks: iterable of (timestamps, prices) e.g. from iter_price_csv
+    :param initial_state: AMM state
+    :param coin_per_pair: coin needed to mint 1 L + 1 S
+    :param floor: oracle price corresponding to long token price 0
+    :param cap: oracle price corresponding to long token price coin_per_pair,
+        default floor + coin_per_pair
+    :param rebalance_type: 'oracle', 'amm' or 'weighted' as for deposit_withdraw
+    :param rebalance_on_tick: re-centre pool weights on oracle price every tick
+    :param order_flow: callable(rng, state, oracle_long_price, coin_per_pair) returning
+        list of actions, default RandomOrderFlow()
+    :param seed: seed for numpy random Generator
+    :return: yields dict of arrays with keys RESULT_FIELDS for each input chunk
+        lp_value: pool value at oracle prices
+        pool_value: pool value at AMM spot prices
+        rebalance_loss: loss in pool value at AMM spot prices caused by re-weighting
+            the pool on deposit, withdraw or oracle update (negative for a gain)
+        n_trades: number of swaps executed in the tick, rejected actions and
+            liquidity events are not counted
+    """
+    cap = floor + coin_per_pair if cap is None else cap
+    order_flow = RandomOrderFlow() if order_flow is None else order_flow
+    rng = np.random.default_rng(seed)
+    state = list(initial_state)
+    net_deposit = 0.
+    eps = 1e-6
+
+    for timestamps, prices in price_chunks:
+        n = len(prices)
+        v = np.clip((prices - floor) / (cap - floor), eps, 1 - eps)
+        long_prices = v * coin_per_pair
+        out = {name: np.empty(n) for name in RESULT_FIELDS}
+        out['timestamp'][:] = timestamps
+        out['oracle_price'][:] = long_prices
+        for i, (v_i, price) in enumerate(zip(v.tolist(), long_prices.tolist())):
+            rebalance_loss = 0.
+            if rebalance_on_tick:
+                value_before = get_amm_balance(state)
+                state = set_amm_state(state[0], state[1], state[2], v_i, coin_per_pair)
+                rebalance_loss += value_before - get_amm_balance(state)
+            actions = order_flow(rng, state, price, coin_per_pair)
+            n_trades = 0
+            for action, a_c, params in actions:
+                is_liquidity = action in {'deposit', 'withdraw'}
+                if is_liquidity:
+                    params = dict(params, oracle_price=price, rebalance_type=rebalance_type)
+                    value_before = get_amm_balance(state)
+                try:
+                    new_state = perform_action(action, state, a_c, coin_per_pair=coin_per_pair, **params)[0]
+                except (ValueError, ZeroDivisionError):
+                    continue
+                if not all(np.isfinite(new_state)) or min(new_state) <= 0:
+                    continue
+                state = new_state
+                if action in {'swap_from_coin', 'swap_to_coin'}:
+                    n_trades += 1
+                if is_liquidity:
+                    deposit = a_c if action == 'deposit' else -a_c
+                    net_deposit += deposit
+                    rebalance_loss += value_before + deposit - get_amm_balance(state)
+            out['lp_value'][i] = state[0] + state[1] * price + state[2] * (coin_per_pair - price)
+            out['pool_value'][i] = get_amm_balance(state)
+            out['rebalance_loss'][i] = rebalance_loss
+            out['net_deposit'][i] = net_deposit
+            out['n_trades'][i] = n_trades
+        yield out
+
+
+def write_results_csv(results, path):
+    """Write backtest result chunks to CSV incrementally
+
+    :param results: iterable of result dicts from backtest
+    :return: number of rows written
+    """
+    n_rows = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_FIELDS)
+        for chunk in results:
+            writer.writerows(zip(*(chunk[name].tolist() for name in RESULT_FIELDS)))
+            n_rows += len(chunk[RESULT_FIELDS[0]])
+    return n_rows
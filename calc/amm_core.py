@@ -0,0 +1,1037 @@
+"""Core AMM math: Balancer formulas, pool state and actions on state
+
+Only depends on NumPy so is cheap to import in simulation worker processes,
+see amm_math for the full interface including plotting.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from amm_state import AMMState, AMMStateBatch
+
+__all__ = [
+    'calc_balancer_invariant',
+    'calc_token_balance',
+    'calc_spot_price',
+    'calc_out_given_in',
+    'calc_in_given_out',
+    'set_amm_state',
+    'get_amm_spot_prices',
+    'get_amm_balance',
+    'get_amm_invariant',
+    'clear_state_cache',
+    'simple_swap_from_coin',
+    'simple_swap_to_coin',
+    'mint_redeem',
+    'deposit_withdraw',
+    'perform_action',
+    'set_amm_state_batch',
+    'get_amm_spot_prices_batch',
+    'get_amm_balance_batch',
+    'simple_swap_from_coin_batch',
+    'simple_swap_to_coin_batch',
+    'mint_redeem_batch',
+    'calc_in_given_spot_price',
+    'get_swap_to_spot_price_batch',
+    'calc_in_given_marginal_price',
+    'get_arbitrage_swap_batch',
+    'calc_weighted_withdraw_v_batch',
+    'SWAP_GRAD_VARS',
+    'STATE_GRAD_VARS',
+    'REBALANCE_GRAD_VARS',
+    'calc_swap_jacobian',
+    'get_swap_jacobian_batch',
+    'set_amm_state_jacobian_batch',
+    'get_orderbook_batch',
+    'get_orderbook',
+    'print_state_change',
+    'iter_action_sequence',
+    'perform_action_sequence',
+]
+
+
+def calc_balancer_invariant(x_c, x_l, x_s, w_c, w_l, w_s):
+    """
+    calcBalancerInvariant - return invariant satisfied by Balancer pool for swaps
+    Uses discrete inputs rather than state vector for ease of vectorized plotting use.
+    To use state vector: calc_balancer_invariant(*state)
+    """
+    return (x_c**w_c)*(x_l**w_l)*(x_s**w_s)
+
+
+def calc_token_balance(x_c, x_o, w_c, w_o, k):
+    """Calculate token balance to lie on curve such that
+    k = invariant(x_c, x_t, x_o, w_c, 1 - w_c - w_o, w_o)
+    Typically would plot x_t vs x_c varying with other parameters fixed
+
+    :return: x_t: token balance e.g. long as function of:
+    :param x_c: coin balance
+    :param x_o: other token balance e.g. short
+    :param w_c: weight coin
+    :param w_o: other token weight
+    :param k: curve invariant
+    """
+    return (k/(x_c**w_c)/(x_o**w_o))**(1/(1 - w_c - w_o))
+
+
+def calc_spot_price(bI, wI, bO, wO, sF=0):
+    """
+    calcSpotPrice                                                                             //
+     sP = spotPrice                                                                            //
+     bI = tokenBalanceIn                ( bI / wI )         1                                  //
+     bO = tokenBalanceOut         sP =  -----------  *  ----------                             //
+     wI = tokenWeightIn                 ( bO / wO )     ( 1 - sF )                             //
+     wO = tokenWeightOut                                                                       //
+     sF = swapFee
+    """
+    return (bI/wI)/(bO/wO)/(1-sF)
+
+
+def calc_out_given_in(bO, wO, bI, wI, aI, sF=0):
+    """
+    calcOutGivenIn                                                                            //
+     aO = tokenAmountOut                                                                       //
+     bO = tokenBalanceOut                                                                      //
+     bI = tokenBalanceIn              /      /            bI             \    (wI / wO) \      //
+     aI = tokenAmountIn    aO = bO * |  1 - | --------------------------  | ^            |     //
+     wI = tokenWeightIn               \      \ ( bI + ( aI * ( 1 - sF )) /              /      //
+     wO = tokenWeightOut                                                                       //
+     sF = swapFee
+    """
+    return bO*(1-(bI/(bI + (aI*(1-sF))))**(wI/wO))
+
+
+def calc_in_given_out(bO, wO, bI, wI, aO, sF=0):
+    """
+    calcInGivenOut                                                                            //
+     aI = tokenAmountIn                                                                        //
+     bO = tokenBalanceOut               /  /     bO      \    (wO / wI)      \                 //
+     bI = tokenBalanceIn          bI * |  | ------------  | ^            - 1  |                //
+     aO = tokenAmountOut    aI =        \  \ ( bO - aO ) /                   /                 //
+     wI = tokenWeightIn           --------------------------------------------                 //
+     wO = tokenWeightOut                          ( 1 - sF )                                   //
+     sF = swapFee
+    """
+    return bI*((bO/(bO - aO))**(wO/wI) - 1)/(1-sF)
+
+
+def set_amm_state(x_c, x_l, x_s, v, C, sF=0):
+    """For fixed token balances calculate the weights needed to achieve at zero imbalance
+    L price = v*C, S price = (1-v)*C where C is the coin needed to mint 1 L + 1 S
+    """
+
+    # Weights
+    if x_l == 0 or x_s == 0:
+        w_c = 1
+        w_l = 0
+        w_s = 0
+    else:
+        denom = C*x_l*x_s - x_c*(v*(x_l - x_s) - x_l)
+        w_c = x_c*(x_l - v*(x_l - x_s))/denom
+        w_l = v*C*x_l*x_s/denom
+        w_s = (1 - v)*C*x_l*x_s/denom
+
+    return [x_c, x_l, x_s, w_c, w_l, w_s]
+
+
+@lru_cache(maxsize=1024)
+def _state_spot_prices(state_key):
+    """Spot prices and balance of list state with zero fee, cached by state tuple"""
+    x_c, x_l, x_s, w_c, w_l, w_s = state_key
+    # Inlined calc_spot_price with sF = 0
+    ltk_price = (x_c/w_c)/(x_l/w_l)
+    stk_price = (x_c/w_c)/(x_s/w_s)
+    return ltk_price, stk_price, x_c + x_l*ltk_price + x_s*stk_price
+
+
+@lru_cache(maxsize=1024)
+def _state_invariant(state_key):
+    return calc_balancer_invariant(*state_key)
+
+
+def _state_cache_key(state):
+    """Cache key of 6 field state of hashable scalars, None for other states e.g. with array fields"""
+    if len(state) != 6:
+        return None
+    key = tuple(state)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def get_amm_spot_prices(state, sF=0):
+    """Return L and S prices in units of coin
+
+    Zero fee prices of scalar states are cached by state so that reporting and
+    rebalancing the same state do not repeat the calculation.
+    """
+    if sF == 0:
+        if isinstance(state, AMMState):
+            return list(state.spot_prices)
+        key = _state_cache_key(state)
+        if key is not None:
+            return list(_state_spot_prices(key)[:2])
+    coin_ind = 0
+    ltk_ind = 1
+    stk_ind = 2
+    n_tok = len(state) // 2
+    ltk_price, stk_price = (
+        calc_spot_price(
+            state[coin_ind], state[coin_ind + n_tok],
+            state[tok_ind], state[tok_ind + n_tok],
+            sF) for tok_ind in [ltk_ind, stk_ind]
+    )
+    return [ltk_price, stk_price]
+
+
+def get_amm_balance(state):
+    """Return pool value in coin at spot prices, cached by state for scalar states"""
+    if isinstance(state, AMMState):
+        return state.balance
+    key = _state_cache_key(state)
+    if key is not None:
+        return _state_spot_prices(key)[2]
+    spot_prices = get_amm_spot_prices(state)
+    return state[0] + state[1]*spot_prices[0] + state[2]*spot_prices[1]
+
+
+def get_amm_invariant(state):
+    """Return Balancer invariant of state, cached by state for scalar states"""
+    if isinstance(state, AMMState):
+        return state.invariant
+    key = _state_cache_key(state)
+    if key is not None:
+        return _state_invariant(key)
+    n_tok = len(state) // 2
+    k = 1
+    for x, w in zip(state[:n_tok], state[n_tok:]):
+        k = k * x**w
+    return k
+
+
+def clear_state_cache():
+    """Clear cached spot prices, balances and invariants of list states"""
+    _state_spot_prices.cache_clear()
+    _state_invariant.cache_clear()
+
+
+def _same_state_type(template, new_state):
+    """Return list form new_state as an AMMState if the input state template was one"""
+    if isinstance(template, AMMState):
+        return AMMState._make(new_state)
+    return new_state
+
+
+def _new_state(template, x_c, x_l, x_s, w_c, w_l, w_s):
+    """Create state from fields, an AMMState if the input state template was one otherwise list form"""
+    if isinstance(template, AMMState):
+        return AMMState._make((x_c, x_l, x_s, w_c, w_l, w_s))
+    return [x_c, x_l, x_s, w_c, w_l, w_s]
+
+
+# Actions that we can perform on state
+def simple_swap_from_coin(state, aI, to_long=True, sF=0, coin_per_pair=1,
+                          rebalance=False, rebalance_fun=set_amm_state):
+    """Swap a_c coins in for specified token (1=L, 2=S)
+    """
+    tok_ind = 1 if to_long else 2
+    coin_ind = 0
+    n_tok = len(state) // 2
+    # calc_out_given_in(bO, wO, bI, wI, aI, sF=0)
+    bO = state[tok_ind]
+    wO = state[tok_ind + n_tok]
+    bI = state[coin_ind]
+    wI = state[coin_ind + n_tok]
+    aO = calc_out_given_in(bO, wO, bI, wI, aI, sF)
+    avg_price = aI / aO  # Price paid to AMM in coin for each position token
+    x_c, x_l, x_s, w_c, w_l, w_s = state
+    if to_long:
+        x_l = x_l - aO
+    else:
+        x_s = x_s - aO
+    x_c = x_c + aI
+    if rebalance:
+        new_spot = get_amm_spot_prices([x_c, x_l, x_s, w_c, w_l, w_s])
+        new_state = _same_state_type(state, rebalance_fun(
+            x_c, x_l, x_s,
+            new_spot[0] / (new_spot[0] + new_spot[1]),
+            coin_per_pair
+        ))
+    else:
+        new_state = _new_state(state, x_c, x_l, x_s, w_c, w_l, w_s)
+
+    return new_state, aO, avg_price
+
+
+def simple_swap_to_coin(
+        state, aI, from_long=True, sF=0,
+        coin_per_pair=1, rebalance=False, rebalance_fun=set_amm_state):
+    """Swap position tokens in for coin
+    """
+    tok_ind = 1 if from_long else 2
+    coin_ind = 0
+    n_tok = len(state) // 2
+    # calc_out_given_in(bO, wO, bI, wI, aI, sF=0)
+    bO = state[coin_ind]
+    wO = state[coin_ind + n_tok]
+    bI = state[tok_ind]
+    wI = state[tok_ind + n_tok]
+    aO = calc_out_given_in(bO, wO, bI, wI, aI, sF)
+    avg_price = aO / aI  # Price in coin paid for input position token
+    x_c, x_l, x_s, w_c, w_l, w_s = state
+    if from_long:
+        x_l = x_l + aI
+    else:
+        x_s = x_s + aI
+    x_c = x_c - aO
+    if rebalance:
+        new_spot = get_amm_spot_prices([x_c, x_l, x_s, w_c, w_l, w_s])
+        new_state = _same_state_type(state, rebalance_fun(
+            x_c, x_l, x_s,
+            new_spot[0] / (new_spot[0] + new_spot[1]),
+            coin_per_pair
+        ))
+    else:
+        new_state = _new_state(state, x_c, x_l, x_s, w_c, w_l, w_s)
+
+    return new_state, aO, avg_price
+
+
+def mint_redeem(state, a_c, coin_per_pair=100, rebalance=False, **kwargs):
+    n_c_0, n_l_0, n_s_0, w_c_0, w_l_0, w_s_0 = state
+    if a_c >= 0:
+        # Mint
+        if n_c_0 < a_c:
+            raise ValueError('Insufficent coin')
+        n_c_1 = n_c_0 - a_c
+        n_l_1 = n_l_0 + a_c / coin_per_pair
+        n_s_1 = n_s_0 + a_c / coin_per_pair
+        tok_out = a_c / coin_per_pair
+    else:
+        # Redeem
+        r_c = -a_c
+        if r_c > min(n_s_0, n_l_0):
+            raise ValueError('Insufficent token')
+        n_c_1 = n_c_0 + r_c * coin_per_pair
+        n_l_1 = n_l_0 - r_c
+        n_s_1 = n_s_0 - r_c
+        tok_out = a_c * coin_per_pair
+
+    avg_price = coin_per_pair / 2
+
+    if rebalance:
+        # Keep same spot price as original
+        # set_amm_state(x_c, x_l, x_s, v, C)
+        v = get_amm_spot_prices(state)[0] / coin_per_pair
+        new_state = _same_state_type(state, set_amm_state(n_c_1, n_l_1, n_s_1, v, coin_per_pair))
+    else:
+        new_state = _new_state(state, n_c_1, n_l_1, n_s_1, w_c_0, w_l_0, w_s_0)
+
+    return new_state, tok_out, avg_price
+
+
+def deposit_withdraw(
+        state, a_c, coin_per_pair=100, oracle_price=50, deposit=True,
+        rebalance=True, rebalance_type='oracle', token_fraction=0.5, **kwargs
+):
+    """
+
+    :param state:
+    :param a_c:
+    :param coin_per_pair:
+    :param oracle_price:
+    :param rebalance:
+    :param rebalance_type:
+    :param token_fraction:
+    :param kwargs:
+    :return:
+    """
+    n_c_0, n_l_0, n_s_0, w_c_0, w_l_0, w_s_0 = state
+    amm_price = get_amm_spot_prices(state)[0]
+
+    if deposit:
+        # Deposit liquidity
+        mid_state = mint_redeem(
+            [n_c_0 + a_c, n_l_0, n_s_0, w_c_0, w_l_0, w_s_0],
+            a_c*token_fraction, coin_per_pair=coin_per_pair
+        )[0]
+        n_c_1, n_l_1, n_s_1, w_c_1, w_l_1, w_s_1 = mid_state
+        tok_out = -a_c
+    else:
+        # Withdraw liquidity
+        # Step 1 convert pairs back to collateral
+        mid_state = mint_redeem(
+            state, -a_c*token_fraction/coin_per_pair, coin_per_pair=coin_per_pair
+        )[0]
+        # Use subscript a, b, c, etc for internal calculations here
+        n_c_a, n_l_1, n_s_1, w_c_1, w_l_1, w_s_1 = mid_state
+        # Step 2 withdraw collateral, this will be from coin in pool
+        # plus redeemed position tokens
+        n_c_1 = n_c_a - a_c
+        tok_out = a_c
+
+    if rebalance:
+        if rebalance_type == 'oracle':
+            new_state = set_amm_state(
+                n_c_1, n_l_1, n_s_1, v=oracle_price/coin_per_pair, C=coin_per_pair
+            )
+            avg_price = oracle_price
+        elif rebalance_type == 'amm':
+            new_state = set_amm_state(
+                n_c_1, n_l_1, n_s_1,
+                v=amm_price/coin_per_pair, C=coin_per_pair
+            )
+            avg_price = amm_price
+        elif rebalance_type == 'weighted':
+            if deposit:
+                # Deposit - average oracle and amm prices
+                # Approximation to exact price change needed to get spot
+                # price correct after removing imbalance
+                balance_0 = n_c_0 + min(n_s_0, n_l_0)*coin_per_pair
+                balance_t = balance_0 + a_c
+                amm_wt = balance_0/balance_t  # Existing liquidity weight
+                oracle_wt = a_c/balance_t   # New liquidity weight
+                avg_price = amm_price*amm_wt + oracle_price*oracle_wt
+                v = avg_price/coin_per_pair
+            else:
+                # Withdraw - amplify distance from oracle price so that the trade
+                # reversing the imbalance in the original pool still returns the
+                # smaller pool to the oracle price
+                v = float(calc_weighted_withdraw_v_batch(
+                    list(state), n_c_1, n_l_1, n_s_1, oracle_price, coin_per_pair))
+                avg_price = v*coin_per_pair
+            new_state = set_amm_state(
+                n_c_1, n_l_1, n_s_1,
+                v=v,
+                C=coin_per_pair
+            )
+        else:
+            raise ValueError('Unknown rebalance type: ', rebalance_type)
+    else:
+        new_state = mid_state
+        avg_price = get_amm_spot_prices(mid_state)[0]
+
+    return _same_state_type(state, new_state), tok_out, avg_price
+
+
+def perform_action(action, s_0, a_c, coin_per_pair=100, **swap_params):
+    """Uniform interface for performing actions on AMM state
+
+    :param action:
+    :param s_0:
+    :param a_c:
+    :param coin_per_pair:
+    :param swap_params:
+    :return:
+    """
+    if action == 'swap_from_coin':
+        s_1, tok_out, avg_price = simple_swap_from_coin(s_0, a_c, coin_per_pair=coin_per_pair, **swap_params)
+    elif action == 'swap_to_coin':
+        s_1, tok_out, avg_price = simple_swap_to_coin(s_0, a_c, coin_per_pair=coin_per_pair, **swap_params)
+    elif action == 'mint_redeem':
+        # Copy from other notebook
+        s_1, tok_out, avg_price = mint_redeem(s_0, a_c, coin_per_pair=coin_per_pair, **swap_params)
+    elif action == 'deposit':
+        s_1, tok_out, avg_price = deposit_withdraw(
+            s_0, a_c, coin_per_pair=coin_per_pair, deposit=True, **swap_params)
+    elif action == 'withdraw':
+        s_1, tok_out, avg_price = deposit_withdraw(
+            s_0, a_c, coin_per_pair=coin_per_pair, deposit=False, **swap_params)
+
+    else:
+        raise ValueError('Unknown action', action)
+    return s_1, tok_out, avg_price
+
+
+# Batched versions of the state functions and actions
+# States are arrays of shape (..., 6) and amounts broadcast against the leading
+# state dimensions e.g. states (N, 6) with amounts (N,) or (N, M)
+def _state_columns(states, amounts=None):
+    """Split array of states into list of 6 columns, with trailing axes added
+    so that each column broadcasts against amounts
+
+    :param states: array of shape (..., 6)
+    :param amounts: optional array of amounts, shape (...) or (..., M)
+    :return: list of [x_c, x_l, x_s, w_c, w_l, w_s] arrays
+    """
+    states = np.asarray(states, dtype=float)
+    cols = [states[..., i] for i in range(states.shape[-1])]
+    if amounts is not None:
+        n_extra = np.ndim(amounts) - cols[0].ndim
+        if n_extra > 0:
+            cols = [c.reshape(c.shape + (1,) * n_extra) for c in cols]
+    return cols
+
+
+def _stack_state(x_c, x_l, x_s, w_c, w_l, w_s):
+    """Stack state columns back into array of shape (..., 6)"""
+    return np.stack(np.broadcast_arrays(x_c, x_l, x_s, w_c, w_l, w_s), axis=-1)
+
+
+def set_amm_state_batch(x_c, x_l, x_s, v, C, sF=0):
+    """Vectorized set_amm_state for arrays of balances and prices
+
+    :return: array of states shape (..., 6)
+    """
+    x_c, x_l, x_s, v, C = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (x_c, x_l, x_s, v, C)))
+    empty = (x_l == 0) | (x_s == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = C*x_l*x_s - x_c*(v*(x_l - x_s) - x_l)
+        w_c = np.where(empty, 1., x_c*(x_l - v*(x_l - x_s))/denom)
+        w_l = np.where(empty, 0., v*C*x_l*x_s/denom)
+        w_s = np.where(empty, 0., (1 - v)*C*x_l*x_s/denom)
+    return _stack_state(x_c, x_l, x_s, w_c, w_l, w_s)
+
+
+def get_amm_spot_prices_batch(states, sF=0):
+    """Return L and S prices in units of coin for array of states
+
+    :param states: array of shape (..., 6)
+    :return: array of shape (..., 2)
+    """
+    x_c, x_l, x_s, w_c, w_l, w_s = _state_columns(states)
+    return np.stack([
+        calc_spot_price(x_c, w_c, x_l, w_l, sF),
+        calc_spot_price(x_c, w_c, x_s, w_s, sF)
+    ], axis=-1)
+
+
+def get_amm_balance_batch(states):
+    states = np.asarray(states, dtype=float)
+    spot_prices = get_amm_spot_prices_batch(states)
+    return states[..., 0] + states[..., 1]*spot_prices[..., 0] + states[..., 2]*spot_prices[..., 1]
+
+
+def _rebalance_batch(x_c, x_l, x_s, w_c, w_l, w_s, coin_per_pair, rebalance_fun):
+    # Keep spot price ratio of the post-swap state, as in the scalar actions
+    ltk_price = calc_spot_price(x_c, w_c, x_l, w_l)
+    stk_price = calc_spot_price(x_c, w_c, x_s, w_s)
+    return rebalance_fun(x_c, x_l, x_s, ltk_price / (ltk_price + stk_price), coin_per_pair)
+
+
+def simple_swap_from_coin_batch(states, aI, to_long=True, sF=0, coin_per_pair=1,
+                                rebalance=False, rebalance_fun=set_amm_state_batch):
+    """Swap aI coins in for specified token for array of states
+
+    :param states: array of shape (N, 6) or (6,)
+    :param aI: coin in, shape (N,) or (N, M)
+    :return: new states (..., 6), tokens out (...), average price (...)
+    """
+    aI = np.asarray(aI, dtype=float)
+    x_c, x_l, x_s, w_c, w_l, w_s = _state_columns(states, aI)
+    if to_long:
+        aO = calc_out_given_in(x_l, w_l, x_c, w_c, aI, sF)
+        x_l = x_l - aO
+    else:
+        aO = calc_out_given_in(x_s, w_s, x_c, w_c, aI, sF)
+        x_s = x_s - aO
+    x_c = x_c + aI
+    avg_price = aI / aO
+    if rebalance:
+        new_states = _rebalance_batch(x_c, x_l, x_s, w_c, w_l, w_s, coin_per_pair, rebalance_fun)
+    else:
+        new_states = _stack_state(x_c, x_l, x_s, w_c, w_l, w_s)
+    return new_states, aO, avg_price
+
+
+def simple_swap_to_coin_batch(states, aI, from_long=True, sF=0, coin_per_pair=1,
+                              rebalance=False, rebalance_fun=set_amm_state_batch):
+    """Swap aI position tokens in for coin for array of states
+
+    :param states: array of shape (N, 6) or (6,)
+    :param aI: position tokens in, shape (N,) or (N, M)
+    :return: new states (..., 6), coin out (...), average price (...)
+    """
+    aI = np.asarray(aI, dtype=float)
+    x_c, x_l, x_s, w_c, w_l, w_s = _state_columns(states, aI)
+    if from_long:
+        aO = calc_out_given_in(x_c, w_c, x_l, w_l, aI, sF)
+        x_l = x_l + aI
+    else:
+        aO = calc_out_given_in(x_c, w_c, x_s, w_s, aI, sF)
+        x_s = x_s + aI
+    x_c = x_c - aO
+    avg_price = aO / aI
+    if rebalance:
+        new_states = _rebalance_batch(x_c, x_l, x_s, w_c, w_l, w_s, coin_per_pair, rebalance_fun)
+    else:
+        new_states = _stack_state(x_c, x_l, x_s, w_c, w_l, w_s)
+    return new_states, aO, avg_price
+
+
+def mint_redeem_batch(states, a_c, coin_per_pair=100, rebalance=False, **kwargs):
+    """Mint (a_c >= 0, coin in) or redeem (a_c < 0, pairs in) for array of states
+
+    :param states: array of shape (N, 6) or (6,)
+    :param a_c: amounts, shape (N,) or (N, M)
+    :return: new states (..., 6), tokens out (...), average price (...)
+    """
+    a_c = np.asarray(a_c, dtype=float)
+    x_c, x_l, x_s, w_c, w_l, w_s = _state_columns(states, a_c)
+    mint = a_c >= 0
+    if np.any(mint & (x_c < a_c)):
+        raise ValueError('Insufficent coin')
+    if np.any(~mint & (-a_c > np.minimum(x_s, x_l))):
+        raise ValueError('Insufficent token')
+    # Change in position tokens: a_c/C for mint, a_c (negative) for redeem
+    d_tok = np.where(mint, a_c / coin_per_pair, a_c)
+    d_coin = np.where(mint, -a_c, -a_c * coin_per_pair)
+    tok_out = np.where(mint, a_c / coin_per_pair, a_c * coin_per_pair)
+    avg_price = np.full_like(tok_out, coin_per_pair / 2)
+
+    if rebalance:
+        # Keep same spot price as original
+        v = calc_spot_price(x_c, w_c, x_l, w_l) / coin_per_pair
+        new_states = set_amm_state_batch(x_c + d_coin, x_l + d_tok, x_s + d_tok, v, coin_per_pair)
+    else:
+        new_states = _stack_state(x_c + d_coin, x_l + d_tok, x_s + d_tok, w_c, w_l, w_s)
+    return new_states, tok_out, avg_price
+
+
+# Trade sizing to move pool to target spot price
+def calc_in_given_spot_price(bI, wI, bO, wO, sP, sF=0, tol=1e-12, max_iter=50):
+    """Amount of token in needed to move spot price sans fee (bI / wI) / (bO / wO) up to sP
+
+    Without fees the balance in after the swap follows from the invariant:
+        bI' = bI * (sP / sP_0) ^ (wO / (wI + wO))
+    With fees the pool receives aI but the invariant only sees aI * (1 - sF) so
+    solve  log((bI + aI) / wI) - log(bO' / wO) = log(sP)  with
+        bO' = bO * (bI / (bI + aI * (1 - sF))) ^ (wI / wO)
+    by Newton iteration started from the no fee solution. The left hand side is
+    increasing and concave in aI and the no fee solution is a lower bound, so the
+    iteration converges monotonically from below.
+    Vectorized over all arguments, returns 0 where sP is below the current spot price.
+
+    :param sP: target spot price sans fee of token out in units of token in
+    :param sF: swap fee
+    :param tol: relative tolerance on aI
+    :param max_iter: maximum number of Newton iterations
+    :return: aI: token amount in
+    """
+    bI, wI, bO, wO, sP = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (bI, wI, bO, wO, sP)))
+    sP_0 = calc_spot_price(bI, wI, bO, wO)
+    ratio = np.maximum(sP / sP_0, 1.)
+    aI = bI * (ratio ** (wO / (wI + wO)) - 1)
+    if np.any(sF != 0):
+        log_target = np.log(ratio)
+        for _ in range(max_iter):
+            b_fee = bI + aI * (1 - sF)
+            f = np.log((bI + aI) / bI) + (wI / wO) * np.log(b_fee / bI) - log_target
+            df = 1 / (bI + aI) + (wI / wO) * (1 - sF) / b_fee
+            step = f / df
+            aI = aI - step
+            if np.all(np.abs(step) <= tol * np.maximum(aI, tol)):
+                break
+    return aI
+
+
+def get_swap_to_spot_price_batch(states, target_price, is_long=True, sF=0, **solver_params):
+    """Swap needed to move long or short spot price to target, for arrays of states and targets
+
+    Spot price is compared as calc_spot_price(x_c, w_c, x_t, w_t, sF) i.e. including
+    the fee when sF is non-zero, and the swap is charged fee sF.
+    Raising the price means swapping coin in for token (simple_swap_from_coin),
+    lowering it means swapping token in for coin (simple_swap_to_coin).
+
+    :param states: array of shape (..., 6)
+    :param target_price: target token price in coin, broadcast against states[..., 0]
+    :param is_long: True to target long token price, False for short
+    :param sF: swap fee
+    :param solver_params: passed to calc_in_given_spot_price
+    :return: from_coin (True for swap coin in for token), aI (coin or token in),
+        aO (token or coin out)
+    """
+    target_price = np.asarray(target_price, dtype=float)
+    x_c, x_l, x_s, w_c, w_l, w_s = _state_columns(states, target_price)
+    x_t, w_t = (x_l, w_l) if is_long else (x_s, w_s)
+    target_sans_fee = target_price * (1 - sF)
+    from_coin = target_sans_fee >= calc_spot_price(x_c, w_c, x_t, w_t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coin_in = calc_in_given_spot_price(x_c, w_c, x_t, w_t, target_sans_fee, sF, **solver_params)
+        # Spot price of coin in units of token is 1 / token price
+        tok_in = calc_in_given_spot_price(x_t, w_t, x_c, w_c, 1 / target_sans_fee, sF, **solver_params)
+    aI = np.where(from_coin, coin_in, tok_in)
+    aO = np.where(
+        from_coin,
+        calc_out_given_in(x_t, w_t, x_c, w_c, aI, sF),
+        calc_out_given_in(x_c, w_c, x_t, w_t, aI, sF)
+    )
+    return from_coin, aI, aO
+
+
+def calc_in_given_marginal_price(bI, wI, bO, wO, mP, sF=0):
+    """Amount of token in at which the marginal price of token out, including fee, reaches mP
+
+    The marginal price is 1 / d(calc_out_given_in)/d(aI). With bI' = bI + aI * (1 - sF)
+    the balance the invariant sees, it equals (bI' / wI) / (bO' / wO) / (1 - sF), so
+        bI' = bI * (mP / sP_0) ^ (wO / (wI + wO))
+    with sP_0 the spot price including fee. Buying token out while its marginal
+    price is below an outside price mP is profitable, so this is the profit
+    maximizing trade. Unlike calc_in_given_spot_price the swap fee kept in the
+    pool does not move the marginal price, so no iteration is needed.
+    Vectorized over all arguments, returns 0 where mP is below the current spot price.
+
+    :param mP: marginal price including fee of token out in units of token in
+    :return: aI: token amount in
+    """
+    bI, wI, bO, wO, mP = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (bI, wI, bO, wO, mP)))
+    sP_0 = calc_spot_price(bI, wI, bO, wO, sF)
+    ratio = np.maximum(mP / sP_0, 1.)
+    return bI * (ratio ** (wO / (wI + wO)) - 1) / (1 - sF)
+
+
+def get_arbitrage_swap_batch(states, price, is_long=True, sF=0):
+    """Profit maximizing swap of long or short token against an outside token price, for arrays of states
+
+    Buys token with coin while its marginal cost including fee is below price and
+    sells token for coin while its marginal proceeds after fee are above price,
+    see calc_in_given_marginal_price. Within the band
+    price * (1 - sF) <= spot price sans fee <= price / (1 - sF) aI is 0.
+    Unlike get_swap_to_spot_price_batch this accounts for the fee kept in the pool.
+
+    :param states: array of shape (..., 6)
+    :param price: outside token price in coin, broadcast against states[..., 0]
+    :param is_long: True to trade long token, False for short
+    :param sF: swap fee
+    :return: from_coin (True for swap coin in for token), aI (coin or token in),
+        aO (token or coin out)
+    """
+    price = np.asarray(price, dtype=float)
+    x_c, x_l, x_s, w_c, w_l, w_s = _state_columns(states, price)
+    x_t, w_t = (x_l, w_l) if is_long else (x_s, w_s)
+    from_coin = price * (1 - sF) >= calc_spot_price(x_c, w_c, x_t, w_t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coin_in = calc_in_given_marginal_price(x_c, w_c, x_t, w_t, price, sF)
+        # Marginal price of coin in units of token is 1 / token price
+        tok_in = calc_in_given_marginal_price(x_t, w_t, x_c, w_c, 1 / price, sF)
+    aI = np.where(from_coin, coin_in, tok_in)
+    aO = np.where(
+        from_coin,
+        calc_out_given_in(x_t, w_t, x_c, w_c, aI, sF),
+        calc_out_given_in(x_c, w_c, x_t, w_t, aI, sF)
+    )
+    return from_coin, aI, aO
+
+
+def calc_weighted_withdraw_v_batch(states, x_c, x_l, x_s, oracle_price, C, tol=1e-12, max_iter=100):
+    """Long price fraction v for the 'weighted' withdraw rebalance, for arrays of states
+
+    The imbalance trade that moves the long spot price of the original pool
+    back to the oracle price is found with get_swap_to_spot_price_batch. v is
+    chosen so that the same trade applied to set_amm_state(x_c, x_l, x_s, v, C)
+    also ends at the oracle price, which amplifies the distance from the oracle
+    as the pool shrinks. With no imbalance the long spot price is the oracle price.
+
+    With N = (1 - v)*x_l + v*x_s the rebalanced long spot price is P = v*C*x_s/N
+    and w_c/w_l = x_c*N/(v*C*x_l*x_s). After coin in a the long spot price is
+    P*(1 + a/x_c)^(1 + w_c/w_l) and after long token in b it is
+    P*(1 + b/x_l)^-(1 + w_l/w_c). The log price error h(v) has at most one
+    turning point, so it is solved by vectorized Newton iteration safeguarded by
+    bisection on the branch where the final price increases with v. Where no v
+    returns the pool exactly to the oracle price the closest end of that branch
+    is used.
+
+    :param states: original pool states, array of shape (..., 6)
+    :param x_c: coin balance after withdrawal
+    :param x_l: long balance after withdrawal
+    :param x_s: short balance after withdrawal
+    :param oracle_price: oracle long price
+    :param C: coin needed to mint 1 L + 1 S
+    :return: v array of shape (...)
+    """
+    states = np.asarray(states, dtype=float)
+    x_c, x_l, x_s, oracle_price, C = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (x_c, x_l, x_s, oracle_price, C)))
+    from_coin, aI, _ = get_swap_to_spot_price_batch(states, oracle_price, is_long=True)
+    log_target = np.log(oracle_price / (C*x_s))
+    log_in = np.where(from_coin, np.log1p(aI / x_c), np.log1p(aI / x_l))
+
+    def err_and_grad(v):
+        N = (1 - v)*x_l + v*x_s
+        # ratio = w_c / w_l and its derivative with respect to v
+        ratio = x_c*N/(v*C*x_l*x_s)
+        d_ratio = -x_c/(C*x_s*v**2)
+        err = np.log(v/N) + np.where(from_coin, log_in*(1 + ratio), -log_in*(1 + 1/ratio)) - log_target
+        d_err = 1/v - (x_s - x_l)/N + np.where(from_coin, log_in*d_ratio, log_in*d_ratio/ratio**2)
+        return err, d_err
+
+    # Turning point of h is where a linear function of v changes sign, h increases
+    # above it for coin in and below it for token in
+    eps = 1e-12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = log_in*x_c/(C*x_s)
+        v_coin = k*x_l/(x_l - k*(x_s - x_l))
+        v_coin = np.where(x_l - k*(x_s - x_l) > 0, v_coin, 1.)
+        slope_tok = x_c*(x_s - x_l) - log_in*C*x_l*x_s
+        v_tok = np.where(slope_tok < 0, -x_c*x_l/slope_tok, 1.)
+    lo = np.where(from_coin, np.clip(v_coin, eps, 1 - eps), eps)
+    hi = np.where(from_coin, 1 - eps, np.clip(v_tok, eps, 1 - eps))
+    err_lo = err_and_grad(lo)[0]
+    err_hi = err_and_grad(hi)[0]
+    v = np.clip(get_amm_spot_prices_batch(states)[..., 0] / C, lo, hi)
+    done = (err_lo >= 0) | (err_hi <= 0)
+    for _ in range(max_iter):
+        err, d_err = err_and_grad(v)
+        lo = np.where(err < 0, v, lo)
+        hi = np.where(err > 0, v, hi)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v_new = v - err / d_err
+        v_new = np.where((v_new > lo) & (v_new < hi), v_new, 0.5 * (lo + hi))
+        converged = np.abs(v_new - v) <= tol * v
+        v = v_new
+        if np.all(done | converged):
+            break
+    return np.where(err_lo >= 0, np.where(from_coin, lo, v), np.where(err_hi <= 0, hi, v))
+
+
+# Analytic sensitivities of the swap and rebalance maps
+SWAP_GRAD_VARS = ('bO', 'wO', 'bI', 'wI', 'aI')
+STATE_GRAD_VARS = ('x_c', 'x_l', 'x_s', 'w_c', 'w_l', 'w_s', 'aI')
+REBALANCE_GRAD_VARS = ('x_c', 'x_l', 'x_s', 'v', 'C')
+
+
+def calc_swap_jacobian(bO, wO, bI, wI, aI, sF=0):
+    """Amount out and post-trade spot price of calc_out_given_in swap with their
+    derivatives with respect to SWAP_GRAD_VARS, for arrays of inputs
+
+    Post-trade spot price is calc_spot_price(bI + aI, wI, bO - aO, wO, sF) i.e.
+    the fee stays in the pool.
+
+    :return: aO (...), sP (...), d_aO (..., 5), d_sP (..., 5)
+    """
+    bO, wO, bI, wI, aI = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (bO, wO, bI, wI, aI)))
+    fee = 1 - sF
+    r = wI / wO
+    d = bI + aI*fee
+    y = bI / d
+    z = y ** r
+    aO = bO*(1 - z)
+    log_y = np.log(y)
+    d_aO = np.stack([
+        1 - z,
+        bO*z*log_y*wI/wO**2,
+        -bO*r*z*aI*fee/(bI*d),
+        -bO*z*log_y/wO,
+        bO*r*z*fee/d,
+    ], axis=-1)
+
+    bI_1 = bI + aI
+    bO_1 = bO - aO
+    sP = calc_spot_price(bI_1, wI, bO_1, wO, sF)
+    # ln(sP) = ln(bI + aI) - ln(wI) - ln(bO - aO) + ln(wO) - ln(1 - sF)
+    d_log_sP = d_aO/bO_1[..., None] + np.stack([-1/bO_1, 1/wO, 1/bI_1, -1/wI, 1/bI_1], axis=-1)
+    return aO, sP, d_aO, sP[..., None]*d_log_sP
+
+
+def get_swap_jacobian_batch(states, aI, from_coin=True, is_long=True, sF=0):
+    """Sensitivities of swap against array of states with respect to STATE_GRAD_VARS
+
+    :param states: array of shape (..., 6)
+    :param aI: amount in, coin if from_coin else token
+    :param from_coin: swap coin in for token (simple_swap_from_coin), else token in for coin
+    :param is_long: swap with long token, else short
+    :param sF: swap fee
+    :return: aO (...), post-trade spot price of out token in units of in token (...),
+        d_aO (..., 7), d_sP (..., 7)
+    """
+    aI = np.asarray(aI, dtype=float)
+    x_c, x_l, x_s, w_c, w_l, w_s = _state_columns(states, aI)
+    x_t, w_t = (x_l, w_l) if is_long else (x_s, w_s)
+    tok = 1 if is_long else 2
+    # Positions of (bO, wO, bI, wI, aI) in STATE_GRAD_VARS
+    if from_coin:
+        inds = (tok, tok + 3, 0, 3, 6)
+        aO, sP, d_aO, d_sP = calc_swap_jacobian(x_t, w_t, x_c, w_c, aI, sF)
+    else:
+        inds = (0, 3, tok, tok + 3, 6)
+        aO, sP, d_aO, d_sP = calc_swap_jacobian(x_c, w_c, x_t, w_t, aI, sF)
+    shape = aO.shape + (len(STATE_GRAD_VARS),)
+    d_aO_state = np.zeros(shape)
+    d_sP_state = np.zeros(shape)
+    for var, ind in enumerate(inds):
+        d_aO_state[..., ind] = d_aO[..., var]
+        d_sP_state[..., ind] = d_sP[..., var]
+    return aO, sP, d_aO_state, d_sP_state
+
+
+def set_amm_state_jacobian_batch(x_c, x_l, x_s, v, C):
+    """Weights from set_amm_state_batch and their derivatives with respect to
+    REBALANCE_GRAD_VARS
+
+    :return: weights (..., 3) as [w_c, w_l, w_s], jacobian (..., 3, 5)
+    """
+    x_c, x_l, x_s, v, C = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (x_c, x_l, x_s, v, C)))
+    zeros = np.zeros_like(x_c)
+    # w_i = n_i / D with D = P + x_c*N, N = (1 - v)*x_l + v*x_s, P = C*x_l*x_s
+    N = (1 - v)*x_l + v*x_s
+    P = C*x_l*x_s
+    D = P + x_c*N
+    n = np.stack([x_c*N, v*P, (1 - v)*P], axis=-1)
+    dN = np.stack([zeros, 1 - v, v, x_s - x_l, zeros], axis=-1)
+    dP = np.stack([zeros, C*x_s, C*x_l, zeros, x_l*x_s], axis=-1)
+    dD = dP + x_c[..., None]*dN + np.stack([N, zeros, zeros, zeros, zeros], axis=-1)
+    dn = np.stack([
+        x_c[..., None]*dN + np.stack([N, zeros, zeros, zeros, zeros], axis=-1),
+        v[..., None]*dP + np.stack([zeros, zeros, zeros, P, zeros], axis=-1),
+        (1 - v)[..., None]*dP - np.stack([zeros, zeros, zeros, P, zeros], axis=-1),
+    ], axis=-2)
+    empty = (x_l == 0) | (x_s == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(empty[..., None], [1., 0., 0.], n/D[..., None])
+        jac = np.where(empty[..., None, None], 0., (dn - weights[..., None]*dD[..., None, :])/D[..., None, None])
+    return weights, jac
+
+
+# Order book depth implied by the pool curve
+def _orderbook_side(x_c, x_tok, w_c, w_tok, levels, sell, sF=0):
+    """Price and token volume for one side of order book, vectorized over leading state axes"""
+    fractions = np.linspace(1. / 1000., 1. / 2., levels)
+    if sell:
+        # Sell position tokens to pool for coin, largest volume first as in plot_orderbook
+        volume = np.flip(fractions) * x_tok[..., None]
+        coin_out = calc_out_given_in(x_c[..., None], w_c[..., None], x_tok[..., None], w_tok[..., None], volume, sF)
+        price = coin_out / volume
+    else:
+        # Buy position tokens from pool with coin
+        coin_in = fractions * x_c[..., None]
+        volume = calc_out_given_in(x_tok[..., None], w_tok[..., None], x_c[..., None], w_c[..., None], coin_in, sF)
+        price = coin_in / volume
+    return price, volume
+
+
+def get_orderbook_batch(states, levels=20, side='both', is_long=True, sF=0):
+    """Order book depth for array of states in one vectorized evaluation of the pool curve
+
+    Uses same volume levels as plot_orderbook: sell volumes from 1/1000 to 1/2
+    of the pool token balance and buy volumes from 1/1000 to 1/2 of the pool coin
+    balance, with no rebalancing after the swap.
+
+    :param states: array of shape (..., 6)
+    :param levels: number of price levels per side
+    :param side: 'sell' (bids: trader sells tokens), 'buy' (asks: trader buys tokens) or 'both'
+    :param is_long: True for long token book, False for short token
+    :param sF: swap fee
+    :return: price (..., n) and token volume (..., n) arrays, for 'both' the sell
+        side followed by the buy side
+    """
+    x_c, x_l, x_s, w_c, w_l, w_s = _state_columns(states)
+    x_tok, w_tok = (x_l, w_l) if is_long else (x_s, w_s)
+    if side == 'sell':
+        return _orderbook_side(x_c, x_tok, w_c, w_tok, levels, True, sF)
+    elif side == 'buy':
+        return _orderbook_side(x_c, x_tok, w_c, w_tok, levels, False, sF)
+    elif side == 'both':
+        sell_price, sell_volume = _orderbook_side(x_c, x_tok, w_c, w_tok, levels, True, sF)
+        buy_price, buy_volume = _orderbook_side(x_c, x_tok, w_c, w_tok, levels, False, sF)
+        return (np.concatenate([sell_price, buy_price], axis=-1),
+                np.concatenate([sell_volume, buy_volume], axis=-1))
+    raise ValueError('Unknown order book side', side)
+
+
+@lru_cache(maxsize=4096)
+def _get_orderbook_cached(state_key, levels, side, is_long, sF):
+    price, volume = get_orderbook_batch(np.array(state_key), levels, side, is_long, sF)
+    price.flags.writeable = False
+    volume.flags.writeable = False
+    return price, volume
+
+
+def get_orderbook(state, levels=20, side='both', is_long=True, sF=0):
+    """Order book depth for single state, cached by state
+
+    See get_orderbook_batch for parameters. Returned arrays are read only as
+    they are shared between calls with the same state.
+    Clear cache with get_orderbook.cache_clear()
+
+    :return: price (levels,) and token volume (levels,) arrays, (2*levels,) for side='both'
+    """
+    return _get_orderbook_cached(tuple(float(x) for x in state), levels, side, is_long, sF)
+
+
+get_orderbook.cache_clear = _get_orderbook_cached.cache_clear
+
+
+def print_state_change(
+        action, s_0, a_c, s_1=None, tok_out=None, avg_price=None,
+        coin_per_pair=None, **action_params):
+    n_c_0, n_l_0, n_s_0, w_c_0, w_l_0, w_s_0 = s_0
+    spot_l_0, spot_s_0 = get_amm_spot_prices(s_0)
+
+    if s_1 is None:
+        s_1, tok_out, avg_price = perform_action(
+            action, s_0, a_c, coin_per_pair=coin_per_pair, **action_params)
+
+    n_c_1, n_l_1, n_s_1, w_c_1, w_l_1, w_s_1 = s_1
+    spot_l_1, spot_s_1 = get_amm_spot_prices(s_1)
+
+    print(
+        f'Action: {action}\n'
+        f'Tokens in: {a_c:0.2f}  Tokens out: {tok_out:0.2f}  Average Price: {avg_price:0.2f}\n'
+        + f'Old balance {get_amm_balance(s_0):0.2f}: {n_c_0:0.2f} Coin  {n_l_0:0.2f} Long  {n_s_0:0.2f}  Short\n'
+        + f'New balance {get_amm_balance(s_1):0.2f}: {n_c_1:0.2f} Coin  {n_l_1:0.2f} Long  {n_s_1:0.2f}  Short\n'
+        + f'Old spot prices: Long {spot_l_0:0.2f}  Short {spot_s_0:0.2f}\n'
+        + f'New spot prices: Long {spot_l_1:0.2f}  Short {spot_s_1:0.2f}\n')
+    return s_1, tok_out, avg_price
+
+
+def iter_action_sequence(initial_state, actions, reporter=None, every=1):
+    """Generator form of perform_action_sequence that does not keep history
+
+    Only the current state is held so memory use is flat however long the
+    sequence, and actions can itself be a generator.
+
+    :param initial_state: AMM state
+    :param actions: iterable of [action, a_c, action_params]
+    :param reporter: optional callable with print_state_change signature
+        reporter(action, s_0, a_c, s_1, tok_out, avg_price) called for reported steps
+    :param every: only yield (and report) every k-th step, final step always included
+    :return: yields (step, action, a_c, state, tok_out, avg_price) starting with
+        (0, 'initial', 0, initial_state, 0, long spot price)
+    """
+    if every < 1:
+        raise ValueError('Reporting interval must be at least 1', every)
+    return _iter_action_sequence(initial_state, actions, reporter, every)
+
+
+def _iter_action_sequence(initial_state, actions, reporter, every):
+    state = initial_state
+    yield 0, 'initial', 0, state, 0, get_amm_spot_prices(state)[0]
+    step = 0
+    pending = None
+    for action in actions:
+        step += 1
+        new_state, tok_out, avg_price = perform_action(
+            action[0],
+            state,
+            action[1], **action[2]
+        )
+        if step % every == 0:
+            if reporter is not None:
+                reporter(action[0], state, action[1], new_state, tok_out, avg_price)
+            yield step, action[0], action[1], new_state, tok_out, avg_price
+            pending = None
+        else:
+            pending = (action, state, new_state, tok_out, avg_price)
+        state = new_state
+    if pending is not None:
+        action, s_0, new_state, tok_out, avg_price = pending
+        if reporter is not None:
+            reporter(action[0], s_0, action[1], new_state, tok_out, avg_price)
+        yield step, action[0], action[1], new_state, tok_out, avg_price
+
+
+def perform_action_sequence(initial_state, actions, reporter=None):
+    print(get_amm_spot_prices(initial_state) + ['initial'])
+    if reporter is None:
+        def reporter(action, s_0, a_c, s_1, tok_out, avg_price):
+            print(get_amm_spot_prices(s_1) + [action, a_c])
+    states = []
+    tok_outs = []
+    avg_prices = []
+    for _, _, _, new_state, tok_out, avg_price in iter_action_sequence(initial_state, actions, reporter):
+        states.append(new_state)
+        tok_outs.append(tok_out)
+        avg_prices.append(avg_price)
+    return states, tok_outs, avg_prices
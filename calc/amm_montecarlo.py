@@ -0,0 +1,168 @@
+"""Monte Carlo simulation of random order flow through the AMM actions
+
+Random paths of swap_from_coin, swap_to_coin, deposit, withdraw and
+mint_redeem actions are evaluated with perform_action across a process pool.
+Paths are split into chunks and each chunk gets its own RNG stream spawned
+from a single seed, so results are reproducible for a given seed whatever the
+number of worker processes.
+
+Example:
+    from amm_core import set_amm_state
+    from amm_montecarlo import run_monte_carlo
+    s_0 = set_amm_state(10000, 100, 100, 0.5, 100)
+    res = run_monte_carlo(s_0, n_paths=100_000, n_steps=100, seed=42)
+    np.percentile(res['pnl'], [5, 50, 95])
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from amm_core import perform_action, get_amm_balance, get_amm_spot_prices
+
+ACTIONS = ('swap_from_coin', 'swap_to_coin', 'deposit', 'withdraw', 'mint_redeem')
+DEFAULT_ACTION_PROBS = (0.35, 0.35, 0.1, 0.1, 0.1)
+
+
+def generate_path(rng, n_steps, action_probs=DEFAULT_ACTION_PROBS,
+                  size_mean=0.01, size_sigma=1., oracle_vol=0.01):
+    """Generate random order flow for one path
+
+    Order sizes are drawn as fractions of the relevant pool balance at the time
+    the order is executed (see path_step_amount) so that paths remain feasible.
+
+    :param rng: numpy Generator
+    :param n_steps: number of actions in path
+    :param action_probs: probability of each action in ACTIONS
+    :param size_mean: median order size as fraction of pool balance
+    :param size_sigma: log-normal sigma of order sizes
+    :param oracle_vol: per step volatility of the log oracle price ratio
+    :return: action indices (n_steps,), order size fractions (n_steps,),
+        long/short side flags (n_steps,), oracle price shocks (n_steps,)
+    """
+    actions = rng.choice(len(ACTIONS), size=n_steps, p=action_probs)
+    sizes = size_mean * rng.lognormal(0., size_sigma, size=n_steps)
+    is_long = rng.random(n_steps) < 0.5
+    oracle_shocks = rng.normal(0., oracle_vol, size=n_steps)
+    return actions, sizes, is_long, oracle_shocks
+
+
+def path_step_amount(action, state, size, is_long, coin_per_pair):
+    """Convert order size fraction to amount for perform_action given current state
+
+    :return: amount a_c and action parameters
+    """
+    if action == 'swap_from_coin':
+        return size * state[0], {'to_long': is_long, 'rebalance': True}
+    elif action == 'swap_to_coin':
+        return size * state[1 if is_long else 2], {'from_long': is_long, 'rebalance': True}
+    elif action == 'mint_redeem':
+        # Long side flag chooses mint, otherwise redeem pairs
+        if is_long:
+            return size * state[0], {'rebalance': True}
+        return -size * min(state[1], state[2]), {'rebalance': True}
+    elif action in {'deposit', 'withdraw'}:
+        return size * get_amm_balance(state), {}
+    raise ValueError('Unknown action', action)
+
+
+def evaluate_path(initial_state, path, coin_per_pair=100, oracle_price=None, rebalance_type='oracle'):
+    """Apply randomly generated path to initial state
+
+    :param initial_state: AMM state
+    :param path: output of generate_path
+    :param coin_per_pair: coin needed to mint 1 L + 1 S
+    :param oracle_price: initial oracle long price, default AMM long spot price
+    :param rebalance_type: rebalance type used for deposit and withdraw
+    :return: final state, LP P&L, number of rejected actions
+    """
+    actions, sizes, is_long, oracle_shocks = path
+    if oracle_price is None:
+        oracle_price = get_amm_spot_prices(initial_state)[0]
+    # Oracle follows random walk in log odds of v = long price / coin_per_pair
+    v = oracle_price / coin_per_pair
+    log_odds = np.log(v / (1 - v)) + np.cumsum(oracle_shocks)
+    oracle_prices = coin_per_pair / (1 + np.exp(-log_odds))
+
+    state = initial_state
+    net_deposit = 0.
+    n_rejected = 0
+    for action_ind, size, long_side, price in zip(actions.tolist(), sizes.tolist(),
+                                                  is_long.tolist(), oracle_prices.tolist()):
+        action = ACTIONS[action_ind]
+        try:
+            a_c, params = path_step_amount(action, state, size, long_side, coin_per_pair)
+            if action in {'deposit', 'withdraw'}:
+                params = dict(params, oracle_price=price, rebalance_type=rebalance_type)
+            new_state = perform_action(action, state, a_c, coin_per_pair=coin_per_pair, **params)[0]
+        except (ValueError, ZeroDivisionError):
+            n_rejected += 1
+            continue
+        if not all(np.isfinite(new_state)) or min(new_state) <= 0:
+            n_rejected += 1
+            continue
+        if action == 'deposit':
+            net_deposit += a_c
+        elif action == 'withdraw':
+            net_deposit -= a_c
+        state = new_state
+
+    pnl = get_amm_balance(state) - get_amm_balance(initial_state) - net_deposit
+    return state, pnl, n_rejected
+
+
+def _run_chunk(args):
+    """Evaluate a chunk of paths with its own RNG stream (runs in worker process)"""
+    initial_state, n_paths, n_steps, seed_seq, path_params, eval_params = args
+    rng = np.random.default_rng(seed_seq)
+    final_states = np.empty((n_paths, len(initial_state)))
+    pnl = np.empty(n_paths)
+    n_rejected = np.empty(n_paths, dtype=int)
+    for i in range(n_paths):
+        path = generate_path(rng, n_steps, **path_params)
+        state, pnl[i], n_rejected[i] = evaluate_path(initial_state, path, **eval_params)
+        final_states[i] = list(state)
+    return final_states, pnl, n_rejected
+
+
+def run_monte_carlo(initial_state, n_paths=10_000, n_steps=100, seed=None, n_workers=None,
+                    chunk_size=500, coin_per_pair=100, oracle_price=None, rebalance_type='oracle',
+                    **path_params):
+    """Run Monte Carlo simulation of LP P&L over random order flow paths
+
+    :param initial_state: AMM state e.g. from set_amm_state
+    :param n_paths: number of paths
+    :param n_steps: number of actions per path
+    :param seed: seed for the root numpy SeedSequence
+    :param n_workers: number of worker processes, default os.cpu_count(),
+        use 1 to run in the current process
+    :param chunk_size: number of paths per task (and per RNG stream)
+    :param coin_per_pair: coin needed to mint 1 L + 1 S
+    :param oracle_price: initial oracle long price, default AMM long spot price
+    :param rebalance_type: rebalance type used for deposit and withdraw
+    :param path_params: passed to generate_path e.g. action_probs, size_mean
+    :return: dict with 'final_states' (n_paths, 6), 'pnl' (n_paths,), 'n_rejected' (n_paths,)
+    """
+    if n_paths < 1:
+        raise ValueError('Number of paths must be at least 1', n_paths)
+    initial_state = list(initial_state)
+    n_workers = n_workers or os.cpu_count()
+    n_chunks = -(-n_paths // chunk_size)
+    seed_seqs = np.random.SeedSequence(seed).spawn(n_chunks)
+    eval_params = {'coin_per_pair': coin_per_pair, 'oracle_price': oracle_price, 'rebalance_type': rebalance_type}
+    tasks = [
+        (initial_state, min(chunk_size, n_paths - i * chunk_size), n_steps, seed_seqs[i], path_params, eval_params)
+        for i in range(n_chunks)
+    ]
+    if n_workers == 1:
+        results = [_run_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_run_chunk, tasks))
+
+    final_states, pnl, n_rejected = zip(*results)
+    return {
+        'final_states': np.concatenate(final_states),
+        'pnl': np.concatenate(pnl),
+        'n_rejected': np.concatenate(n_rejected),
+    }
@@ -0,0 +1,236 @@
+"""Vectorized pool engine for any number of tokens
+
+Generalizes the 3 token coin/long/short pool of amm_core to a pool of one coin
+and P commodity pairs that share it as collateral, N = 1 + 2P tokens in all.
+States use the same layout as amm_core with balances followed by weights,
+arrays of shape (..., 2N):
+
+    [x_c, x_l_0, x_s_0, ..., x_l_P-1, x_s_P-1, w_c, w_l_0, w_s_0, ..., w_l_P-1, w_s_P-1]
+
+so with a single pair a state is the usual [x_c, x_l, x_s, w_c, w_l, w_s]. The
+spot price, invariant and swap functions work for any token count, only the
+rebalance and mint/redeem functions need the coin plus pairs layout. Every
+function works on arrays of states so many multi-commodity pools can be
+simulated at once.
+
+Example:
+    states = set_multi_state_batch(10000, [100, 50], [100, 80], [0.5, 0.3], [100, 10])
+    states, aO, avg_price = swap_multi_batch(states, 200, 0, long_index(1), rebalance=True,
+                                             coin_per_pair=[100, 10])
+"""
+import numpy as np
+
+from amm_core import calc_out_given_in
+
+
+def long_index(pair):
+    """Token index of long token of pair"""
+    return 1 + 2*np.asarray(pair)
+
+
+def short_index(pair):
+    """Token index of short token of pair"""
+    return 2 + 2*np.asarray(pair)
+
+
+def _split_state(states):
+    """Split array of states into balances and weights, both shape (..., N)"""
+    states = np.asarray(states, dtype=float)
+    if states.shape[-1] % 2:
+        raise ValueError('State must have a balance and weight for each token', states.shape)
+    n_tok = states.shape[-1] // 2
+    return states[..., :n_tok], states[..., n_tok:]
+
+
+def _check_pairs(n_tok):
+    if n_tok < 3 or n_tok % 2 == 0:
+        raise ValueError('Pool must have one coin and long/short token pairs', n_tok)
+    return (n_tok - 1) // 2
+
+
+def _take(a, index):
+    """a[..., index] with index per leading element"""
+    return np.take_along_axis(a, index[..., np.newaxis], axis=-1)[..., 0]
+
+
+def _put(a, index, values):
+    np.put_along_axis(a, index[..., np.newaxis], values[..., np.newaxis], axis=-1)
+
+
+def set_multi_state_batch(x_c, x_l, x_s, v, C):
+    """For fixed token balances calculate weights so that each pair is at zero
+    imbalance, as set_amm_state does for a single pair:
+    L_i price = v_i*C_i, S_i price = (1-v_i)*C_i
+
+    :param x_c: coin balance, shape (...)
+    :param x_l: long balances, shape (..., P)
+    :param x_s: short balances, shape (..., P)
+    :param v: long price as fraction of coin_per_pair, shape (..., P)
+    :param C: coin needed to mint 1 L + 1 S of each pair, scalar or shape (P,)
+    :return: array of states shape (..., 2N)
+    """
+    x_c = np.asarray(x_c, dtype=float)[..., np.newaxis]
+    x_c, x_l, x_s, v, C = np.broadcast_arrays(x_c, *(np.asarray(a, dtype=float) for a in (x_l, x_s, v, C)))
+    empty = (x_l == 0) | (x_s == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Weight of each pair relative to coin, zero for pairs with no tokens
+        pair_value = np.where(empty, 0., C*x_l*x_s/((1 - v)*x_l + v*x_s))
+        total = x_c[..., 0] + pair_value.sum(axis=-1)
+        w_c = x_c[..., 0]/total
+        w_l = v*pair_value/total[..., np.newaxis]
+        w_s = (1 - v)*pair_value/total[..., np.newaxis]
+    return _stack_multi_state(x_c[..., 0], x_l, x_s, w_c, w_l, w_s)
+
+
+def _stack_multi_state(x_c, x_l, x_s, w_c, w_l, w_s):
+    """Interleave coin and pair columns into array of states shape (..., 2N)"""
+    n_pairs = x_l.shape[-1]
+    n_tok = 1 + 2*n_pairs
+    states = np.empty(x_l.shape[:-1] + (2*n_tok,))
+    for offset, (coin, longs, shorts) in ((0, (x_c, x_l, x_s)), (n_tok, (w_c, w_l, w_s))):
+        states[..., offset] = coin
+        states[..., offset + 1:offset + n_tok:2] = longs
+        states[..., offset + 2:offset + n_tok:2] = shorts
+    return states
+
+
+def get_multi_spot_prices_batch(states, sF=0, quote=0):
+    """Spot price of every token in units of the quote token, default coin
+
+    :param states: array of shape (..., 2N)
+    :param quote: index of quote token
+    :return: array of shape (..., N), 1 for the quote token
+    """
+    x, w = _split_state(states)
+    quote_value = x[..., quote:quote + 1]/w[..., quote:quote + 1]
+    prices = quote_value/(x/w)/(1 - sF)
+    prices[..., quote] = 1.
+    return prices
+
+
+def get_multi_balance_batch(states):
+    """Pool value in units of coin at spot prices
+
+    :return: array of shape (...)
+    """
+    x, _ = _split_state(states)
+    return np.sum(x*get_multi_spot_prices_batch(states), axis=-1)
+
+
+def get_multi_invariant_batch(states):
+    """Balancer invariant prod(x_i**w_i)
+
+    :return: array of shape (...)
+    """
+    x, w = _split_state(states)
+    return np.prod(x**w, axis=-1)
+
+
+def get_pair_states(states, pair):
+    """Coin and pair tokens of each state as 3 token states
+
+    Spot prices and coin to/from pair token swaps only depend on balance to
+    weight ratios, so the result can be used with the amm_core batch functions
+    (without rebalance) for that pair.
+
+    :return: array of shape (..., 6)
+    """
+    x, w = _split_state(states)
+    index = [0, int(long_index(pair)), int(short_index(pair))]
+    return np.concatenate([x[..., index], w[..., index]], axis=-1)
+
+
+def _rebalance_multi(x, w, coin_per_pair):
+    # Keep spot price ratio of each pair, as in the scalar actions
+    quote_value = x[..., :1]/w[..., :1]
+    ltk_price = quote_value/(x[..., 1::2]/w[..., 1::2])
+    stk_price = quote_value/(x[..., 2::2]/w[..., 2::2])
+    return set_multi_state_batch(x[..., 0], x[..., 1::2], x[..., 2::2],
+                                 ltk_price/(ltk_price + stk_price), coin_per_pair)
+
+
+def swap_multi_batch(states, aI, token_in, token_out, sF=0, coin_per_pair=1, rebalance=False):
+    """Swap aI of token_in for token_out for array of states
+
+    Token indices may differ per state, e.g. to route each state's swap to a
+    different pair, see long_index and short_index.
+
+    :param states: array of shape (..., 2N)
+    :param aI: amount in, broadcast against leading state dimensions
+    :param token_in: index of input token, int or integer array
+    :param token_out: index of output token, int or integer array
+    :param sF: swap fee
+    :param coin_per_pair: scalar or shape (P,), used if rebalance
+    :param rebalance: reset weights to keep the spot price of every pair
+    :return: new states (..., 2N), amount out (...), average price (...) in coin
+        per token for coin swaps, else input per output token
+    """
+    states = np.asarray(states, dtype=float)
+    aI = np.asarray(aI, dtype=float)
+    shape = np.broadcast_shapes(states.shape[:-1], aI.shape, np.shape(token_in), np.shape(token_out))
+    x, w = _split_state(np.broadcast_to(states, shape + states.shape[-1:]))
+    aI = np.broadcast_to(aI, shape)
+    token_in = np.broadcast_to(np.asarray(token_in, dtype=int), shape)
+    token_out = np.broadcast_to(np.asarray(token_out, dtype=int), shape)
+    if np.any(token_in == token_out):
+        raise ValueError('Input and output token must differ')
+
+    bI, wI = _take(x, token_in), _take(w, token_in)
+    bO, wO = _take(x, token_out), _take(w, token_out)
+    aO = calc_out_given_in(bO, wO, bI, wI, aI, sF)
+    x = x.copy()
+    _put(x, token_in, bI + aI)
+    _put(x, token_out, bO - aO)
+    avg_price = np.where(token_out == 0, aO/aI, aI/aO)
+    if rebalance:
+        _check_pairs(x.shape[-1])
+        new_states = _rebalance_multi(x, w, coin_per_pair)
+    else:
+        new_states = np.concatenate([x, w], axis=-1)
+    return new_states, aO, avg_price
+
+
+def mint_redeem_multi_batch(states, a_c, pair, coin_per_pair=100, rebalance=False):
+    """Mint (a_c >= 0, coin in) or redeem (a_c < 0, pairs in) tokens of pair
+
+    :param states: array of shape (..., 2N)
+    :param a_c: amounts, broadcast against leading state dimensions
+    :param pair: pair index, int or integer array
+    :param coin_per_pair: coin needed to mint 1 L + 1 S, scalar or shape (P,)
+    :param rebalance: reset weights to keep the spot price of every pair
+    :return: new states (..., 2N), tokens out (...), average price (...)
+    """
+    states = np.asarray(states, dtype=float)
+    a_c = np.asarray(a_c, dtype=float)
+    shape = np.broadcast_shapes(states.shape[:-1], a_c.shape, np.shape(pair))
+    x, w = _split_state(np.broadcast_to(states, shape + states.shape[-1:]))
+    n_pairs = _check_pairs(x.shape[-1])
+    a_c = np.broadcast_to(a_c, shape)
+    pair = np.broadcast_to(np.asarray(pair, dtype=int), shape)
+    C = _take(np.broadcast_to(np.asarray(coin_per_pair, dtype=float), shape + (n_pairs,)), pair)
+    i_l, i_s = long_index(pair), short_index(pair)
+    x_c, x_l, x_s = x[..., 0], _take(x, i_l), _take(x, i_s)
+
+    mint = a_c >= 0
+    if np.any(mint & (x_c < a_c)):
+        raise ValueError('Insufficent coin')
+    if np.any(~mint & (-a_c > np.minimum(x_s, x_l))):
+        raise ValueError('Insufficent token')
+    # Change in position tokens: a_c/C for mint, a_c (negative) for redeem
+    d_tok = np.where(mint, a_c / C, a_c)
+    d_coin = np.where(mint, -a_c, -a_c * C)
+    tok_out = np.where(mint, a_c / C, a_c * C)
+    avg_price = C / 2
+
+    new_x = x.copy()
+    new_x[..., 0] = x_c + d_coin
+    _put(new_x, i_l, x_l + d_tok)
+    _put(new_x, i_s, x_s + d_tok)
+    if rebalance:
+        # Keep same spot prices as original
+        quote_value = x[..., :1]/w[..., :1]
+        v = (quote_value/(x[..., 1::2]/w[..., 1::2]))/coin_per_pair
+        new_states = set_multi_state_batch(new_x[..., 0], new_x[..., 1::2], new_x[..., 2::2], v, coin_per_pair)
+    else:
+        new_states = np.concatenate([new_x, w], axis=-1)
+    return new_states, tok_out, avg_price
@@ -0,0 +1,126 @@
+"""Headless batch rendering of scenario plots to image files
+
+Scenarios are rendered with the amm_plot functions in worker processes using
+the non-interactive Agg backend. Each task keeps one figure per plot kind,
+clearing and reusing its axes between scenarios instead of creating new figures
+and closing it when done, and output goes straight to PNG or SVG depending on
+the file extension.
+
+Example:
+    from amm_core import set_amm_state
+    s_0 = set_amm_state(10000, 100, 100, 0.5, 100)
+    scenarios = [
+        {'kind': 'action', 'args': (s_0, a_c), 'kwargs': {'rebalance': True}, 'path': f'out/swap_{a_c}.png'}
+        for a_c in range(100, 5000, 100)
+    ]
+    render_scenarios(scenarios)
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+# Plot kind to amm_plot function name and default figure size
+PLOT_KINDS = {
+    'action': ('plot_action', (8, 6)),
+    'action_orderbook': ('plot_action_orderbook', (12, 4)),
+    'swaps_from_coin': ('simulate_swaps_from_coin', (10, 4)),
+}
+
+
+def _init_worker():
+    """Switch to non-interactive backend before any figure is created"""
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+
+def _get_figure(figures, kind, figsize):
+    """Return cleared figure for plot kind, reusing figure and axes from figures dict"""
+    import matplotlib.pyplot as plt
+    fig = figures.get((kind, figsize))
+    if fig is None:
+        fig = figures[(kind, figsize)] = plt.figure(figsize=figsize)
+    else:
+        for ax in fig.axes:
+            ax.cla()
+    plt.figure(fig.number)
+    if fig.axes:
+        plt.sca(fig.axes[0])
+    return fig
+
+
+def _close_figures(figures):
+    import matplotlib.pyplot as plt
+    for fig in figures.values():
+        plt.close(fig)
+    figures.clear()
+
+
+def render_scenario(scenario, dpi=100, figures=None):
+    """Render single scenario to file
+
+    :param scenario: dict with
+        kind: key of PLOT_KINDS
+        args: positional arguments of the plot function
+        kwargs: optional keyword arguments of the plot function
+        path: output file, format from extension e.g. .png or .svg
+        figsize: optional figure size, default from PLOT_KINDS
+    :param dpi: resolution of raster output
+    :param figures: optional dict of figures reused between calls, closed by the
+        caller, by default the figure is closed after rendering
+    :return: output path
+    """
+    import amm_plot
+    if figures is None:
+        figures = {}
+        try:
+            return render_scenario(scenario, dpi, figures)
+        finally:
+            _close_figures(figures)
+    fun_name, default_figsize = PLOT_KINDS[scenario['kind']]
+    fig = _get_figure(figures, scenario['kind'], tuple(scenario.get('figsize', default_figsize)))
+    kwargs = dict(scenario.get('kwargs', {}))
+    if scenario['kind'] == 'swaps_from_coin':
+        # Draw on the reused figure rather than creating a new one
+        kwargs.setdefault('f', fig)
+    getattr(amm_plot, fun_name)(*scenario.get('args', ()), **kwargs)
+    path = scenario['path']
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    return path
+
+
+def _render_chunk(args):
+    """Render scenarios reusing one figure per plot kind, closed at end of chunk"""
+    scenarios, dpi = args
+    figures = {}
+    try:
+        return [render_scenario(scenario, dpi, figures) for scenario in scenarios]
+    finally:
+        _close_figures(figures)
+
+
+def render_scenarios(scenarios, n_workers=None, chunk_size=20, dpi=100):
+    """Render scenarios to files in parallel worker processes
+
+    :param scenarios: list of scenario dicts, see render_scenario
+    :param n_workers: number of worker processes, default os.cpu_count(),
+        use 1 to render in the current process (pyplot backend is switched to
+        Agg for the call and restored afterwards)
+    :param chunk_size: scenarios per task, each task reuses its figures
+    :param dpi: resolution of raster output
+    :return: list of output paths in scenario order
+    """
+    scenarios = list(scenarios)
+    chunks = [(scenarios[i:i + chunk_size], dpi) for i in range(0, len(scenarios), chunk_size)]
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1:
+        import matplotlib.pyplot as plt
+        backend = plt.get_backend()
+        _init_worker()
+        try:
+            results = [_render_chunk(chunk) for chunk in chunks]
+        finally:
+            plt.switch_backend(backend)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as executor:
+            results = list(executor.map(_render_chunk, chunks))
+    return [path for paths in results for path in paths]
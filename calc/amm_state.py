@@ -0,0 +1,207 @@
+from functools import cached_property
+from operator import itemgetter
+
+import numpy as np
+
+
+STATE_FIELDS = ('x_c', 'x_l', 'x_s', 'w_c', 'w_l', 'w_s')
+
+
+class AMMState(tuple):
+    """Pool state with named fields and cached derived quantities
+
+    A tuple of [x_c, x_l, x_s, w_c, w_l, w_s] in the order of the list form used
+    throughout amm_math, so supports the same unpacking, indexing and len() and
+    can be passed to any function expecting the list form.
+    States are immutable: the fields are read-only and actions return a new
+    state rather than modifying an existing one, which keeps the cached
+    quantities valid. Cached quantities are kept in the instance __dict__, tuple
+    subclasses can't have slots for them.
+    """
+
+    x_c = property(itemgetter(0), doc='Coin balance')
+    x_l = property(itemgetter(1), doc='Long token balance')
+    x_s = property(itemgetter(2), doc='Short token balance')
+    w_c = property(itemgetter(3), doc='Coin weight')
+    w_l = property(itemgetter(4), doc='Long token weight')
+    w_s = property(itemgetter(5), doc='Short token weight')
+
+    def __new__(cls, x_c, x_l, x_s, w_c, w_l, w_s):
+        return tuple.__new__(cls, (x_c, x_l, x_s, w_c, w_l, w_s))
+
+    @classmethod
+    def from_list(cls, state):
+        """Create from list form [x_c, x_l, x_s, w_c, w_l, w_s], returns state unchanged if already an AMMState"""
+        if isinstance(state, cls):
+            return state
+        return cls._make(state)
+
+    @classmethod
+    def _make(cls, fields):
+        """Create from sequence of the 6 fields without checking its length"""
+        return tuple.__new__(cls, fields)
+
+    def to_list(self):
+        return list(self)
+
+    def replace(self, **fields):
+        """Return new state with specified fields changed e.g. state.replace(x_c=1000)"""
+        values = list(self)
+        for name, value in fields.items():
+            values[STATE_FIELDS.index(name)] = value
+        return self._make(values)
+
+    @property
+    def balances(self):
+        return self[:3]
+
+    @property
+    def weights(self):
+        return self[3:]
+
+    @cached_property
+    def normalized_weights(self):
+        """Weights scaled to sum to 1"""
+        w_c, w_l, w_s = self[3:]
+        total = w_c + w_l + w_s
+        return w_c / total, w_l / total, w_s / total
+
+    @cached_property
+    def spot_prices(self):
+        """L and S spot prices in units of coin excluding swap fee, as for get_amm_spot_prices"""
+        x_c, x_l, x_s, w_c, w_l, w_s = self
+        coin = x_c / w_c
+        return coin / (x_l / w_l), coin / (x_s / w_s)
+
+    @cached_property
+    def balance(self):
+        """Pool value in units of coin, as for get_amm_balance"""
+        ltk_price, stk_price = self.spot_prices
+        return self[0] + self[1] * ltk_price + self[2] * stk_price
+
+    @cached_property
+    def invariant(self):
+        """Balancer invariant, as for calc_balancer_invariant"""
+        x_c, x_l, x_s, w_c, w_l, w_s = self
+        return (x_c ** w_c) * (x_l ** w_l) * (x_s ** w_s)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'AMMState is immutable, use replace to change {name}')
+
+    def __eq__(self, other):
+        # Compare equal to list form states as well as tuples
+        try:
+            return len(other) == len(self) and all(a == b for a, b in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = tuple.__hash__
+
+    def __reduce__(self):
+        # Pickle the fields only, not the cached quantities
+        return type(self), tuple(self)
+
+    def __repr__(self):
+        return 'AMMState({})'.format(', '.join(f'{name}={value!r}' for name, value in zip(STATE_FIELDS, self)))
+
+
+class AMMStateBatch(object):
+    """Columnar collection of N pool states stored as a single (N, 6) float array
+
+    Can be passed directly to the *_batch functions in amm_math and exposes the
+    same cached derived quantities as AMMState as arrays of length N.
+    """
+    __slots__ = ('data', '_normalized_weights', '_spot_prices', '_balance', '_invariant')
+
+    def __init__(self, data):
+        data = np.asarray(data, dtype=float)
+        if data.ndim != 2 or data.shape[1] != len(STATE_FIELDS):
+            raise ValueError('State batch must have shape (N, 6)', data.shape)
+        self.data = data
+        self._normalized_weights = None
+        self._spot_prices = None
+        self._balance = None
+        self._invariant = None
+
+    @classmethod
+    def from_states(cls, states):
+        """Create from sequence of AMMState or list form states"""
+        return cls(np.array([list(s) for s in states], dtype=float).reshape(-1, len(STATE_FIELDS)))
+
+    def to_states(self):
+        return [AMMState(*row) for row in self.data.tolist()]
+
+    @property
+    def x_c(self):
+        return self.data[:, 0]
+
+    @property
+    def x_l(self):
+        return self.data[:, 1]
+
+    @property
+    def x_s(self):
+        return self.data[:, 2]
+
+    @property
+    def w_c(self):
+        return self.data[:, 3]
+
+    @property
+    def w_l(self):
+        return self.data[:, 4]
+
+    @property
+    def w_s(self):
+        return self.data[:, 5]
+
+    @property
+    def normalized_weights(self):
+        """Array (N, 3) of weights scaled to sum to 1"""
+        if self._normalized_weights is None:
+            weights = self.data[:, 3:]
+            self._normalized_weights = weights / weights.sum(axis=1, keepdims=True)
+        return self._normalized_weights
+
+    @property
+    def spot_prices(self):
+        """Array (N, 2) of L and S spot prices in units of coin"""
+        if self._spot_prices is None:
+            coin = self.x_c / self.w_c
+            self._spot_prices = np.stack([coin / (self.x_l / self.w_l), coin / (self.x_s / self.w_s)], axis=1)
+        return self._spot_prices
+
+    @property
+    def balance(self):
+        """Array (N,) of pool values in units of coin"""
+        if self._balance is None:
+            self._balance = self.x_c + np.sum(self.data[:, 1:3] * self.spot_prices, axis=1)
+        return self._balance
+
+    @property
+    def invariant(self):
+        """Array (N,) of Balancer invariants"""
+        if self._invariant is None:
+            self._invariant = np.prod(self.data[:, :3] ** self.data[:, 3:], axis=1)
+        return self._invariant
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return AMMState(*self.data[item].tolist())
+        return AMMStateBatch(self.data[item])
+
+    def __iter__(self):
+        return iter(self.to_states())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.data if dtype is None else self.data.astype(dtype)
+
+    def __repr__(self):
+        return f'AMMStateBatch(n={len(self)})'
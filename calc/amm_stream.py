@@ -0,0 +1,106 @@
+"""Streaming replay of long action sequences
+
+run_action_sequence consumes iter_action_sequence and hands each (sampled)
+result to sinks that write incrementally to disk, optionally keeping the last
+n results in memory, so peak memory stays flat for arbitrarily long replays.
+
+Example:
+    with CSVSink('replay.csv') as sink:
+        last = run_action_sequence(s_0, actions, sinks=[sink], every=100, keep_last=10)
+"""
+from collections import deque
+import csv
+
+import numpy as np
+
+from amm_core import iter_action_sequence
+from amm_state import STATE_FIELDS
+
+ACTION_CODES = {
+    'initial': 0, 'swap_from_coin': 1, 'swap_to_coin': 2, 'mint_redeem': 3, 'deposit': 4, 'withdraw': 5
+}
+RECORD_FIELDS = ('step', 'action', 'a_c') + STATE_FIELDS + ('tok_out', 'avg_price')
+
+
+class CSVSink(object):
+    """Write results to CSV file with columns RECORD_FIELDS"""
+
+    def __init__(self, path, flush_every=10_000):
+        self.f = open(path, 'w', newline='')
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(RECORD_FIELDS)
+        self.flush_every = flush_every
+        self.n_rows = 0
+
+    def write(self, step, action, a_c, state, tok_out, avg_price):
+        self.writer.writerow([step, action, a_c, *state, tok_out, avg_price])
+        self.n_rows += 1
+        if self.n_rows % self.flush_every == 0:
+            self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BinarySink(object):
+    """Append results as float64 records of RECORD_FIELDS to raw binary file
+
+    Action names are stored as ACTION_CODES. Read back without loading the whole
+    file with read_binary_records.
+    """
+
+    def __init__(self, path, buffer_rows=10_000):
+        self.f = open(path, 'wb')
+        self.buffer = np.empty((buffer_rows, len(RECORD_FIELDS)))
+        self.n_buffered = 0
+
+    def write(self, step, action, a_c, state, tok_out, avg_price):
+        self.buffer[self.n_buffered] = [step, ACTION_CODES[action], a_c, *state, tok_out, avg_price]
+        self.n_buffered += 1
+        if self.n_buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.buffer[:self.n_buffered].tofile(self.f)
+        self.n_buffered = 0
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_binary_records(path):
+    """Memory map file written by BinarySink as (n_rows, len(RECORD_FIELDS)) array"""
+    return np.memmap(path, dtype=np.float64, mode='r').reshape(-1, len(RECORD_FIELDS))
+
+
+def run_action_sequence(initial_state, actions, sinks=(), every=1, keep_last=1, reporter=None):
+    """Replay action sequence writing results to sinks without keeping history
+
+    :param initial_state: AMM state
+    :param actions: iterable of [action, a_c, action_params], may be a generator
+    :param sinks: objects with write(step, action, a_c, state, tok_out, avg_price)
+    :param every: only pass every k-th step to sinks (initial and final always included)
+    :param keep_last: size of ring buffer of most recent results to return
+    :param reporter: optional reporter as for perform_action_sequence
+    :return: deque of last keep_last (step, action, a_c, state, tok_out, avg_price)
+    """
+    last = deque(maxlen=keep_last)
+    for res in iter_action_sequence(initial_state, actions, reporter=reporter, every=every):
+        for sink in sinks:
+            sink.write(*res)
+        last.append(res)
+    return last
@@ -0,0 +1,198 @@
+"""Parameter sweeps over fee, coin_per_pair, token_fraction and rebalance_type
+
+Every combination of the parameter lists and scenario action lists is run with
+perform_action across a process pool. Results are appended to a columnar
+table on disk, see append_table, and each grid point
+is keyed by a hash of its parameters and scenario so that re-running a sweep
+over a widened grid only computes the new points.
+
+Example:
+    scenarios = {'buy_long': [['swap_from_coin', 100, {'to_long': True}]] * 10}
+    table = run_sweep('sweep', scenarios, sF=[0, 0.003], coin_per_pair=[1, 100],
+                      rebalance_type=['oracle', 'amm'])
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import itertools
+import json
+import os
+import shutil
+
+import numpy as np
+
+from amm_core import perform_action, set_amm_state, get_amm_balance, get_amm_spot_prices
+from amm_state import STATE_FIELDS
+
+PARAM_FIELDS = ('scenario', 'sF', 'coin_per_pair', 'token_fraction', 'rebalance_type')
+RESULT_FIELDS = ('key',) + PARAM_FIELDS + STATE_FIELDS + ('ltk_price', 'balance', 'pnl', 'n_rejected')
+
+
+def grid_key(point, actions, initial_balances, initial_v):
+    """Hash identifying grid point, scenario actions and initial state"""
+    spec = {'point': point, 'actions': actions, 'initial_balances': list(initial_balances), 'initial_v': initial_v}
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, default=float).encode()).hexdigest()
+
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _read_manifest(path):
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return {'columns': None, 'chunks': []}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def read_table(path, mmap_mode='r'):
+    """Read columnar table written by append_table
+
+    Only chunks listed in the manifest are read, so a partially written append
+    is ignored. A table with a single chunk is memory mapped, otherwise chunks
+    are concatenated in memory.
+
+    :return: dict of column name to array, empty dict if table does not exist
+    """
+    manifest = _read_manifest(path)
+    if not manifest['chunks']:
+        return {}
+    table = {}
+    for name in manifest['columns']:
+        chunks = [np.load(os.path.join(path, chunk, name + '.npy'), mmap_mode=mmap_mode)
+                  for chunk, _ in manifest['chunks']]
+        table[name] = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+    return table
+
+
+def append_table(path, columns):
+    """Append rows given as dict of equal length column arrays to columnar table
+
+    The table is a directory of chunks, one per append, each a directory with one
+    .npy file per column, and a manifest listing the column names and the chunks
+    with their lengths. A chunk is written to a temporary directory and renamed,
+    then the manifest is replaced, so appends only write the new rows and an
+    interrupted append leaves the table unchanged.
+
+    Used for sweep results (columns RESULT_FIELDS) and for other time series
+    such as amm_valuation output.
+    """
+    columns = {name: np.asarray(values) for name, values in columns.items()}
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) != 1:
+        raise ValueError('Columns must have equal length', {name: len(v) for name, v in columns.items()})
+    n_rows = lengths.pop()
+    os.makedirs(path, exist_ok=True)
+    manifest = _read_manifest(path)
+    if manifest['columns'] is not None and set(manifest['columns']) != set(columns):
+        raise ValueError('Columns do not match existing table', sorted(manifest['columns']), sorted(columns))
+    if manifest['columns'] is None:
+        manifest['columns'] = list(columns)
+
+    chunk = f'chunk-{len(manifest["chunks"]):06d}'
+    tmp_dir = os.path.join(path, chunk + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), values)
+    # Leftover of an append interrupted before the manifest was updated
+    shutil.rmtree(os.path.join(path, chunk), ignore_errors=True)
+    os.replace(tmp_dir, os.path.join(path, chunk))
+
+    manifest['chunks'].append([chunk, n_rows])
+    tmp_manifest = os.path.join(path, MANIFEST_NAME + '.tmp')
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, os.path.join(path, MANIFEST_NAME))
+
+
+def run_scenario(point, actions, initial_balances=(10000, 100, 100), initial_v=0.5):
+    """Run scenario action list for a single grid point
+
+    Swap actions get the grid sF, deposit and withdraw get token_fraction and
+    rebalance_type, and all actions use the grid coin_per_pair. Actions that
+    fail or produce an invalid state are skipped and counted as rejected.
+
+    :param point: dict with keys PARAM_FIELDS
+    :param actions: list of [action, a_c, action_params]
+    :param initial_balances: coin, long and short balances of the initial pool
+    :param initial_v: initial long price as fraction of coin_per_pair
+    :return: final state, pnl, number of rejected actions
+    """
+    C = point['coin_per_pair']
+    state = set_amm_state(*initial_balances, initial_v, C)
+    initial_balance = get_amm_balance(state)
+    net_deposit = 0.
+    n_rejected = 0
+    for action, a_c, params in actions:
+        params = dict(params)
+        if action in {'swap_from_coin', 'swap_to_coin'}:
+            params['sF'] = point['sF']
+        elif action in {'deposit', 'withdraw'}:
+            params.setdefault('oracle_price', initial_v * C)
+            params['token_fraction'] = point['token_fraction']
+            params['rebalance_type'] = point['rebalance_type']
+        try:
+            new_state = perform_action(action, state, a_c, coin_per_pair=C, **params)[0]
+        except (ValueError, ZeroDivisionError):
+            n_rejected += 1
+            continue
+        if not all(np.isfinite(new_state)) or min(new_state) <= 0:
+            n_rejected += 1
+            continue
+        if action == 'deposit':
+            net_deposit += a_c
+        elif action == 'withdraw':
+            net_deposit -= a_c
+        state = new_state
+    pnl = get_amm_balance(state) - initial_balance - net_deposit
+    return state, pnl, n_rejected
+
+
+def _run_point(args):
+    """Run one grid point and return result row (runs in worker process)"""
+    key, point, actions, initial_balances, initial_v = args
+    state, pnl, n_rejected = run_scenario(point, actions, initial_balances, initial_v)
+    row = {'key': key, **point, **dict(zip(STATE_FIELDS, state))}
+    row['ltk_price'] = get_amm_spot_prices(state)[0]
+    row['balance'] = get_amm_balance(state)
+    row['pnl'] = pnl
+    row['n_rejected'] = n_rejected
+    return row
+
+
+def run_sweep(path, scenarios, sF=(0,), coin_per_pair=(100,), token_fraction=(0.5,),
+              rebalance_type=('oracle',), initial_balances=(10000, 100, 100), initial_v=0.5,
+              n_workers=None):
+    """Run scenarios over Cartesian product of parameters, skipping cached grid points
+
+    :param path: directory of columnar results table, created if needed
+    :param scenarios: dict of scenario name to list of [action, a_c, action_params]
+    :param sF: swap fees
+    :param coin_per_pair: coin needed to mint 1 L + 1 S
+    :param token_fraction: fraction of deposits minted into position tokens
+    :param rebalance_type: rebalance types for deposit and withdraw
+    :param initial_balances: coin, long and short balances of the initial pool
+    :param initial_v: initial long price as fraction of coin_per_pair
+    :param n_workers: number of worker processes, default os.cpu_count(),
+        use 1 to run in the current process
+    :return: full results table as dict of column arrays
+    """
+    cached = set(read_table(path).get('key', []))
+    tasks = []
+    for name, values in itertools.product(scenarios, itertools.product(sF, coin_per_pair, token_fraction,
+                                                                        rebalance_type)):
+        point = dict(zip(PARAM_FIELDS, (name,) + values))
+        key = grid_key(point, scenarios[name], initial_balances, initial_v)
+        if key not in cached:
+            cached.add(key)
+            tasks.append((key, point, scenarios[name], initial_balances, initial_v))
+
+    if tasks:
+        n_workers = n_workers or os.cpu_count()
+        if n_workers == 1:
+            rows = [_run_point(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                rows = list(executor.map(_run_point, tasks, chunksize=max(1, len(tasks) // (4 * n_workers))))
+        append_table(path, {name: [row[name] for row in rows] for name in RESULT_FIELDS})
+    return read_table(path)
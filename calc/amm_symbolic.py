@@ -0,0 +1,20 @@
+import sympy as sp
+
+from amm_core import calc_spot_price
+
+
+def set_amm_state_orig(x_c, x_l, x_s, v, C, sF=0):
+    """For fixed token balances calculate the weights needed to achieve a current token balances
+    L price = v*C, S price = (1-v)*C where C is the coin needed to mint 1 L + 1 S
+    """
+
+    # Weights
+    w_c, w_l, w_s = sp.symbols('w_c w_l w_s', positive=True)
+
+    sol = sp.solve(
+    [w_c + w_l + w_s - 1,   # Weights sum to 1
+     calc_spot_price(x_c, w_c, x_l, w_l, sF) - v*C,      # Long token price = v*C
+     calc_spot_price(x_c, w_c, x_s, w_s, sF) - (1-v)*C,  # Short token price = (1-v)*C
+    ]
+     , [w_c, w_l, w_s])
+    return [x_c, x_l, x_s, sol[w_c], sol[w_l], sol[w_s]]
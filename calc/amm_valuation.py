@@ -0,0 +1,143 @@
+"""Vectorized LP valuation and impermanent loss for trajectories of pool states
+
+Trajectories are arrays of records with columns amm_stream.RECORD_FIELDS, as
+written by BinarySink and read back by read_binary_records, or built from
+iter_action_sequence results with records_to_array. Valuation is done for all
+steps at once and long trajectories are processed in chunks, so memory mapped
+records never have to be loaded in full.
+
+The LP holds the whole pool. The hold portfolio is the initial pool balances
+plus net coin deposited, so impermanent loss is lp_value - hold_value and
+excludes the effect of deposits and withdrawals. Deposits and fees are summed
+from the records, so trajectories must include every step: records sampled
+with every > 1 are rejected. Output columns include run_id
+and step so time series from different runs can be stored in one table
+(see amm_sweep.append_table) and joined.
+"""
+import numpy as np
+
+from amm_core import get_amm_spot_prices_batch
+from amm_state import STATE_FIELDS
+from amm_stream import ACTION_CODES, RECORD_FIELDS
+
+VALUATION_FIELDS = (
+    'run_id', 'step', 'ltk_price', 'stk_price', 'lp_value', 'hold_value',
+    'net_deposit', 'impermanent_loss', 'il_fraction', 'fee_income'
+)
+_STATE_COLS = slice(RECORD_FIELDS.index(STATE_FIELDS[0]), RECORD_FIELDS.index(STATE_FIELDS[-1]) + 1)
+
+
+def records_to_array(results):
+    """Convert iterable of (step, action, a_c, state, tok_out, avg_price) to record array
+
+    :return: array of shape (T, len(RECORD_FIELDS))
+    """
+    return np.array([
+        [step, ACTION_CODES[action], a_c, *state, tok_out, avg_price]
+        for step, action, a_c, state, tok_out, avg_price in results
+    ], dtype=float).reshape(-1, len(RECORD_FIELDS))
+
+
+def pool_value_batch(states, ltk_price=None, coin_per_pair=None):
+    """Value of pool balances at AMM spot prices or at given long token price
+
+    :param states: array of shape (..., 6)
+    :param ltk_price: long token price, shape (...), default AMM spot price
+    :param coin_per_pair: required with ltk_price, short token price is coin_per_pair - ltk_price
+    :return: array of shape (...)
+    """
+    states = np.asarray(states, dtype=float)
+    if ltk_price is None:
+        spot_prices = get_amm_spot_prices_batch(states)
+        ltk_price, stk_price = spot_prices[..., 0], spot_prices[..., 1]
+    else:
+        stk_price = coin_per_pair - np.asarray(ltk_price, dtype=float)
+    return states[..., 0] + states[..., 1]*ltk_price + states[..., 2]*stk_price
+
+
+def hold_value_batch(initial_state, ltk_price, stk_price, net_deposit=0.):
+    """Value of holding initial pool balances plus net coin deposited
+
+    :return: array broadcast from prices and net_deposit
+    """
+    x_c, x_l, x_s = initial_state[:3]
+    return x_c + x_l*np.asarray(ltk_price) + x_s*np.asarray(stk_price) + net_deposit
+
+
+def fee_income_batch(action_codes, a_c, avg_price, sF):
+    """Swap fee earned by the pool at each step, in coin
+
+    Fees on coin in swaps are sF * a_c. Fees on token in swaps are sF * a_c
+    tokens valued at the average execution price of the swap.
+
+    :return: array of same shape as a_c
+    """
+    action_codes = np.asarray(action_codes)
+    a_c = np.asarray(a_c, dtype=float)
+    return np.where(
+        action_codes == ACTION_CODES['swap_from_coin'], sF*a_c,
+        np.where(action_codes == ACTION_CODES['swap_to_coin'], sF*a_c*np.asarray(avg_price, dtype=float), 0.)
+    )
+
+
+def iter_valuation(records, sF=0, ltk_price=None, coin_per_pair=None, run_id=0, chunk_size=1_000_000):
+    """Value trajectory in chunks, carrying cumulative deposits and fees between chunks
+
+    :param records: array of shape (T, len(RECORD_FIELDS)), first row the initial state,
+        one row per step (not sampled with every > 1)
+    :param sF: swap fee used in the simulation
+    :param ltk_price: optional external (e.g. oracle) long price per record, shape (T,),
+        default AMM spot prices
+    :param coin_per_pair: required with ltk_price
+    :param run_id: identifier stored in run_id column
+    :param chunk_size: number of records per chunk
+    :return: yields dict of arrays with keys VALUATION_FIELDS
+    """
+    initial_state = np.asarray(records[0, _STATE_COLS], dtype=float)
+    deposit_carry = 0.
+    fee_carry = 0.
+    last_step = records[0, 0] - 1
+    for start in range(0, records.shape[0], chunk_size):
+        chunk = np.asarray(records[start:start + chunk_size], dtype=float)
+        if np.any(np.diff(chunk[:, 0], prepend=last_step) != 1):
+            raise ValueError('Records must include every step, deposits and fees of skipped steps would be lost')
+        last_step = chunk[-1, 0]
+        states = chunk[:, _STATE_COLS]
+        actions = chunk[:, 1]
+        a_c = chunk[:, 2]
+        if ltk_price is None:
+            prices = get_amm_spot_prices_batch(states)
+            ltk, stk = prices[:, 0], prices[:, 1]
+        else:
+            ltk = np.asarray(ltk_price[start:start + chunk_size], dtype=float)
+            stk = coin_per_pair - ltk
+        deposits = np.where(actions == ACTION_CODES['deposit'], a_c,
+                            np.where(actions == ACTION_CODES['withdraw'], -a_c, 0.))
+        net_deposit = deposit_carry + np.cumsum(deposits)
+        fee_income = fee_carry + np.cumsum(fee_income_batch(actions, a_c, chunk[:, -1], sF))
+        deposit_carry = net_deposit[-1]
+        fee_carry = fee_income[-1]
+
+        lp_value = states[:, 0] + states[:, 1]*ltk + states[:, 2]*stk
+        hold_value = hold_value_batch(initial_state, ltk, stk, net_deposit)
+        yield {
+            'run_id': np.full(len(chunk), run_id),
+            'step': chunk[:, 0],
+            'ltk_price': ltk,
+            'stk_price': stk,
+            'lp_value': lp_value,
+            'hold_value': hold_value,
+            'net_deposit': net_deposit,
+            'impermanent_loss': lp_value - hold_value,
+            'il_fraction': lp_value / hold_value - 1,
+            'fee_income': fee_income,
+        }
+
+
+def trajectory_valuation(records, sF=0, ltk_price=None, coin_per_pair=None, run_id=0):
+    """Value whole trajectory, see iter_valuation
+
+    :return: dict of arrays with keys VALUATION_FIELDS
+    """
+    chunks = list(iter_valuation(records, sF, ltk_price, coin_per_pair, run_id))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in VALUATION_FIELDS}
@@ -0,0 +1,261 @@
+"""Benchmarks for the AMM math hot paths with regression check against baselines
+
+Reports ops/sec and peak traced memory for each benchmark and compares with
+baselines. Exits non-zero if any benchmark is slower, or uses more memory, than
+its baseline by more than the threshold.
+
+Baselines are committed in bench_baselines/, one file per machine and Python
+version, recorded with --update. Without a file for this machine the committed
+reference.json is used. Baseline ops/sec are scaled by the ratio of the current
+speed of a fixed pure Python calibration loop to its speed when the baseline
+was recorded, which compensates for a different machine or for the same
+machine running slower overall e.g. on a shared VM.
+
+Sequence lengths of 1M steps and more replay the sequence streaming, keeping
+only the last state (see amm_stream.run_action_sequence), are timed once and
+are not memory traced, as tracing every allocation of the run is too slow.
+
+    python bench_amm.py                         # compare, 20% threshold
+    python bench_amm.py --update                # record baselines for this machine
+    python bench_amm.py --only sequence --steps 10000 100000 1000000
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from amm_core import (
+    calc_out_given_in, set_amm_state, perform_action, perform_action_sequence,
+    get_orderbook, get_orderbook_batch, set_amm_state_batch
+)
+from amm_stream import run_action_sequence
+
+BASELINE_DIR = Path(__file__).parent / 'bench_baselines'
+REFERENCE_BASELINE = BASELINE_DIR / 'reference.json'
+DEFAULT_STEPS = (10_000, 100_000, 1_000_000)
+# perform_action_sequence keeps every state (about 300 bytes per step), longer
+# sequences are streamed
+MAX_HISTORY_STEPS = 100_000
+# Ignore peak memory differences below this, small benchmarks are noisy
+MIN_MEMORY_DIFF = 64 * 1024
+
+C = 100
+STATE = set_amm_state(10000, 100, 100, 0.5, C)
+ACTIONS = {
+    'swap_from_coin': ['swap_from_coin', 20, {'to_long': True, 'rebalance': True}],
+    'swap_to_coin': ['swap_to_coin', 0.4, {'from_long': True, 'rebalance': True}],
+    'mint_redeem': ['mint_redeem', 50, {'rebalance': True}],
+    'deposit': ['deposit', 100, {'oracle_price': 50}],
+    'withdraw': ['withdraw', 100, {'oracle_price': 50}],
+}
+# Balanced cycle so that long sequences stay feasible
+SEQUENCE_CYCLE = [
+    ['swap_from_coin', 20, {'to_long': True, 'rebalance': True, 'coin_per_pair': C}],
+    ['swap_to_coin', 0.4, {'from_long': True, 'rebalance': True, 'coin_per_pair': C}],
+    ['swap_from_coin', 20, {'to_long': False, 'rebalance': True, 'coin_per_pair': C}],
+    ['swap_to_coin', 0.4, {'from_long': False, 'rebalance': True, 'coin_per_pair': C}],
+    ['deposit', 100, {'oracle_price': 50}],
+    ['mint_redeem', 50, {'rebalance': True}],
+    ['mint_redeem', -0.5, {'rebalance': True}],
+    ['withdraw', 100, {'oracle_price': 50}],
+]
+
+
+def _repeat(fn, n):
+    def run():
+        for _ in range(n):
+            fn()
+    return run
+
+
+def _sequence(n_steps):
+    def run():
+        actions = itertools.islice(itertools.cycle(SEQUENCE_CYCLE), n_steps)
+        with contextlib.redirect_stdout(io.StringIO()):
+            perform_action_sequence(STATE, actions, reporter=lambda *args: None)
+    return run
+
+
+def _stream(n_steps):
+    def run():
+        actions = itertools.islice(itertools.cycle(SEQUENCE_CYCLE), n_steps)
+        run_action_sequence(STATE, actions, keep_last=1)
+    return run
+
+
+def _calibration(n):
+    """Fixed pure Python workload used to compare machine speeds"""
+    def run():
+        x = 0.
+        for i in range(n):
+            x = x * 0.5 + i
+        return x
+    return run
+
+
+def _orderbook_uncached(n):
+    def run():
+        for _ in range(n):
+            get_orderbook.cache_clear()
+            get_orderbook(STATE, levels=20)
+    return run
+
+
+def _plot_orderbook(n):
+    def run():
+        # Import on first run so other benchmarks don't need matplotlib
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from amm_plot import plot_orderbook
+
+        fig = plt.figure()
+        try:
+            for _ in range(n):
+                get_orderbook.cache_clear()
+                plot_orderbook(STATE, is_long=True)
+                plot_orderbook(STATE, is_long=False)
+                fig.clear()
+        finally:
+            plt.close(fig)
+    return run
+
+
+def get_benchmarks(steps=DEFAULT_STEPS):
+    """Return dict of benchmark name to (callable, operations per call, traced)
+
+    traced is False for benchmarks that are timed once without memory tracing.
+    """
+    n = 50_000
+    benchmarks = {
+        'calc_out_given_in': (_repeat(lambda: calc_out_given_in(100., 0.25, 10000., 0.5, 20.), n), n, True),
+        'set_amm_state': (_repeat(lambda: set_amm_state(10000., 100., 120., 0.4, C), n), n, True),
+    }
+    for name, (action, a_c, params) in ACTIONS.items():
+        benchmarks[f'perform_action.{name}'] = (
+            _repeat(lambda action=action, a_c=a_c, params=params: perform_action(
+                action, STATE, a_c, coin_per_pair=C, **params), n), n, True)
+    for n_steps in steps:
+        if n_steps <= MAX_HISTORY_STEPS:
+            benchmarks[f'sequence.{n_steps}'] = (_sequence(n_steps), n_steps, True)
+        else:
+            benchmarks[f'sequence.{n_steps}'] = (_stream(n_steps), n_steps, False)
+    benchmarks['orderbook.single'] = (_orderbook_uncached(5000), 5000, True)
+    states = set_amm_state_batch(
+        np.linspace(5000, 20000, 1000), np.full(1000, 100.), np.full(1000, 120.), np.linspace(0.2, 0.8, 1000), C)
+    benchmarks['orderbook.batch_1000'] = (_repeat(lambda: get_orderbook_batch(states, levels=20), 20), 20_000, True)
+    benchmarks['plot_orderbook'] = (_plot_orderbook(50), 50, True)
+    return benchmarks
+
+
+def run_benchmark(fn, n_ops, repeat=5, traced=True):
+    """Time fn, best of repeat runs, then measure peak traced memory of one run
+
+    :param traced: if False fn is timed once and peak memory is not measured
+    :return: dict with ops_per_sec and peak_bytes (None if not traced)
+    """
+    best = float('inf')
+    for _ in range(repeat if traced else 1):
+        t_0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t_0)
+    peak = None
+    if traced:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'ops_per_sec': n_ops / best, 'peak_bytes': peak}
+
+
+def machine_id():
+    """Name of this machine and Python version"""
+    return f'{platform.node()}-{platform.machine()}-py{sys.version_info[0]}{sys.version_info[1]}'
+
+
+def default_baseline_path():
+    """Baseline file for this machine and Python version"""
+    return BASELINE_DIR / f'{machine_id()}.json'
+
+
+def check_regression(result, baseline, threshold, speed_ratio=1.):
+    """Return list of regression messages comparing result with baseline
+
+    :param speed_ratio: speed of this machine relative to the baseline machine,
+        baseline ops/sec are scaled by it
+    """
+    messages = []
+    change = result['ops_per_sec'] / (baseline['ops_per_sec'] * speed_ratio) - 1
+    if change < -threshold:
+        messages.append(f"ops/sec {change:+0.0%}")
+    if result['peak_bytes'] is not None and baseline['peak_bytes'] is not None:
+        if (result['peak_bytes'] > baseline['peak_bytes'] * (1 + threshold)
+                and result['peak_bytes'] - baseline['peak_bytes'] > MIN_MEMORY_DIFF):
+            messages.append(f"peak memory {result['peak_bytes'] / baseline['peak_bytes'] - 1:+0.0%}")
+    return messages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('AMM math benchmarks')
+    parser.add_argument('--only', '-k', default='', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--steps', type=int, nargs='+', default=list(DEFAULT_STEPS),
+                        help='Sequence lengths for sequence benchmarks (default 10000 100000 1000000)')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='Timing runs per benchmark, best is used')
+    parser.add_argument('--threshold', '-t', type=float, default=0.2,
+                        help='Allowed fractional slowdown or memory increase (default 0.2)')
+    parser.add_argument('--baseline', type=Path, default=None,
+                        help='Baseline JSON file, default this machine\'s file in bench_baselines/ '
+                             'if recorded, otherwise reference.json')
+    parser.add_argument('--update', action='store_true', help='Write results to baseline file')
+    args = parser.parse_args()
+
+    if args.baseline is None:
+        machine_baseline = default_baseline_path()
+        args.baseline = machine_baseline if args.update or machine_baseline.exists() else REFERENCE_BASELINE
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if not baselines and not args.update:
+        print(f'No baselines in {args.baseline}, record them with --update')
+
+    # Calibration is always run, to scale baselines recorded on another machine
+    calibration = run_benchmark(_calibration(1_000_000), 1_000_000, args.repeat, traced=False)
+    results = {'calibration': dict(calibration, machine=machine_id())}
+    speed_ratio = 1.
+    base_calibration = baselines.get('calibration')
+    if base_calibration is not None:
+        speed_ratio = calibration['ops_per_sec'] / base_calibration['ops_per_sec']
+        print(f"Baseline {args.baseline.name} recorded on {base_calibration.get('machine')}, "
+              f"ops/sec scaled by calibration speed ratio {speed_ratio:.2f}")
+    failed = []
+    print(f"{'benchmark':<32}{'ops/sec':>14}{'peak MB':>10}{'baseline':>14}{'change':>9}")
+    for name, (fn, n_ops, traced) in get_benchmarks(args.steps).items():
+        if args.only not in name:
+            continue
+        res = results[name] = run_benchmark(fn, n_ops, args.repeat, traced)
+        base = baselines.get(name)
+        peak = '-' if res['peak_bytes'] is None else f"{res['peak_bytes'] / 1e6:.2f}"
+        line = f"{name:<32}{res['ops_per_sec']:>14,.0f}{peak:>10}"
+        if base is not None:
+            base_ops = base['ops_per_sec'] * speed_ratio
+            line += f"{base_ops:>14,.0f}{res['ops_per_sec'] / base_ops - 1:>+9.0%}"
+            messages = check_regression(res, base, args.threshold, speed_ratio)
+            if messages:
+                failed.append(name)
+                line += '  REGRESSION: ' + ', '.join(messages)
+        print(line)
+
+    if args.update:
+        baselines.update(results)
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        print(f'Updated {args.baseline}')
+    elif failed:
+        print(f'FAIL: {len(failed)} benchmarks regressed more than {args.threshold:0.0%}: {failed}')
+        sys.exit(1)
@@ -0,0 +1,68 @@
+"""Cold-start import benchmark for the AMM math core
+
+Times importing a module in fresh interpreter processes and fails if the median
+exceeds the budget or if any of the heavy optional dependencies got imported.
+
+    python bench_import.py                      # amm_core, 0.5s budget
+    python bench_import.py --module amm_math --budget 0.6
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY_MODULES = ['sympy', 'matplotlib', 'seaborn']
+
+# Run in child process: time the import and report which heavy modules were loaded
+_CHILD_CODE = """
+import json, sys, time
+t_0 = time.perf_counter()
+import {module}
+t_1 = time.perf_counter()
+print(json.dumps({{'seconds': t_1 - t_0, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module, n_runs=5):
+    """Import module in n_runs fresh interpreters
+
+    :param module: module name, must be importable from this directory
+    :param n_runs: number of processes to run
+    :return: list of import times in seconds, set of heavy modules loaded
+    """
+    code = _CHILD_CODE.format(module=module, heavy=HEAVY_MODULES)
+    times = []
+    loaded = set()
+    for _ in range(n_runs):
+        out = subprocess.run(
+            [sys.executable, '-c', code], cwd=Path(__file__).parent,
+            check=True, capture_output=True, text=True
+        ).stdout
+        res = json.loads(out.strip().splitlines()[-1])
+        times.append(res['seconds'])
+        loaded.update(res['loaded'])
+    return times, loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('AMM math import benchmark')
+    parser.add_argument('--module', '-m', default='amm_core', help='Module to import (default amm_core)')
+    parser.add_argument('--budget', '-b', type=float, default=0.5, help='Median import time budget in seconds')
+    parser.add_argument('--runs', '-n', type=int, default=5, help='Number of cold imports to time')
+    args = parser.parse_args()
+
+    times, loaded = time_import(args.module, args.runs)
+    median = statistics.median(times)
+    print(f'import {args.module}: median {median * 1000:0.1f} ms over {args.runs} runs '
+          f'(min {min(times) * 1000:0.1f} ms, budget {args.budget * 1000:0.1f} ms)')
+
+    failed = False
+    if loaded:
+        print(f'FAIL: import {args.module} loaded heavy modules {sorted(loaded)}')
+        failed = True
+    if median > args.budget:
+        print(f'FAIL: import {args.module} over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,405 @@
+"""Integer exact port of Balancer BNum/BMath fixed point math
+
+Mirrors mettalex-balancer/contracts/BConst.sol, BNum.sol and BMath.sol so that
+quotes match what BPool returns on chain to the wei. All amounts are integers
+scaled by BONE = 10**18 as in Solidity, and argument order follows the Solidity
+functions e.g. calc_out_given_in(tokenBalanceIn, tokenWeightIn, ...) rather
+than the float versions in amm_core.
+
+Failed require() checks raise ValueError with the Solidity error message.
+"""
+from functools import lru_cache
+import numbers
+
+# BConst
+BONE = 10**18
+
+MIN_BOUND_TOKENS = 2
+MAX_BOUND_TOKENS = 8
+
+MIN_FEE = BONE // 10**6
+MAX_FEE = BONE // 10
+EXIT_FEE = 0
+
+MIN_WEIGHT = BONE
+MAX_WEIGHT = BONE * 50
+MAX_TOTAL_WEIGHT = BONE * 50
+MIN_BALANCE = BONE // 10**12
+
+INIT_POOL_SUPPLY = BONE * 100
+
+MIN_BPOW_BASE = 1
+MAX_BPOW_BASE = (2 * BONE) - 1
+BPOW_PRECISION = BONE // 10**10
+
+MAX_IN_RATIO = BONE // 2
+MAX_OUT_RATIO = (BONE // 3) + 1
+
+MAX_UINT = 2**256 - 1
+
+
+def _require(condition, message):
+    if not condition:
+        raise ValueError(message)
+
+
+def to_bnum(x, decimals=18):
+    """Convert float or int amount to unitless integer with specified decimals"""
+    return int(round(x * 10**decimals))
+
+
+def from_bnum(a, decimals=18):
+    """Convert unitless integer amount to float"""
+    return a / 10**decimals
+
+
+# BNum
+def btoi(a):
+    return a // BONE
+
+
+def bfloor(a):
+    return btoi(a) * BONE
+
+
+def badd(a, b):
+    c = a + b
+    _require(c <= MAX_UINT, 'ERR_ADD_OVERFLOW')
+    return c
+
+
+def bsub(a, b):
+    c, flag = bsub_sign(a, b)
+    _require(not flag, 'ERR_SUB_UNDERFLOW')
+    return c
+
+
+def bsub_sign(a, b):
+    if a >= b:
+        return a - b, False
+    else:
+        return b - a, True
+
+
+def bmul(a, b):
+    c0 = a * b
+    _require(c0 <= MAX_UINT, 'ERR_MUL_OVERFLOW')
+    c1 = c0 + (BONE // 2)
+    _require(c1 <= MAX_UINT, 'ERR_MUL_OVERFLOW')
+    return c1 // BONE
+
+
+def bdiv(a, b):
+    _require(b != 0, 'ERR_DIV_ZERO')
+    c0 = a * BONE
+    _require(c0 <= MAX_UINT, 'ERR_DIV_INTERNAL')  # bmul overflow
+    c1 = c0 + (b // 2)
+    _require(c1 <= MAX_UINT, 'ERR_DIV_INTERNAL')  # badd require
+    return c1 // b
+
+
+@lru_cache(maxsize=65536)
+def bpowi(a, n):
+    """DSMath.wpow, memoized as quotes against the same pool repeat (base, exponent) pairs"""
+    z = a if n % 2 != 0 else BONE
+
+    n //= 2
+    while n != 0:
+        a = bmul(a, a)
+        if n % 2 != 0:
+            z = bmul(z, a)
+        n //= 2
+    return z
+
+
+def bpow(base, exp):
+    """Compute b^(e.w) by splitting it into (b^e)*(b^0.w).
+    Use `bpowi` for `b^e` and `bpow_approx` for k iterations of approximation of b^0.w
+    """
+    _require(base >= MIN_BPOW_BASE, 'ERR_BPOW_BASE_TOO_LOW')
+    _require(base <= MAX_BPOW_BASE, 'ERR_BPOW_BASE_TOO_HIGH')
+
+    whole = bfloor(exp)
+    remain = bsub(exp, whole)
+
+    whole_pow = bpowi(base, btoi(whole))
+
+    if remain == 0:
+        return whole_pow
+
+    partial_result = bpow_approx(base, remain, BPOW_PRECISION)
+    return bmul(whole_pow, partial_result)
+
+
+def bpow_approx(base, exp, precision):
+    # term 0:
+    a = exp
+    x, xneg = bsub_sign(base, BONE)
+    term = BONE
+    total = term
+    negative = False
+
+    # term(k) = numer / denom
+    #         = (product(a - i - 1, i=1-->k) * x^k) / (k!)
+    # each iteration, multiply previous term by (a-(k-1)) * x / k
+    # continue until term is less than precision
+    i = 1
+    while term >= precision:
+        big_k = i * BONE
+        c, cneg = bsub_sign(a, bsub(big_k, BONE))
+        term = bmul(term, bmul(c, x))
+        term = bdiv(term, big_k)
+        if term == 0:
+            break
+
+        if xneg:
+            negative = not negative
+        if cneg:
+            negative = not negative
+        if negative:
+            total = bsub(total, term)
+        else:
+            total = badd(total, term)
+        i += 1
+
+    return total
+
+
+# BMath
+def calc_spot_price(token_balance_in, token_weight_in, token_balance_out, token_weight_out, swap_fee):
+    """
+    calcSpotPrice
+     sP = spotPrice
+     bI = tokenBalanceIn                ( bI / wI )         1
+     bO = tokenBalanceOut         sP =  -----------  *  ----------
+     wI = tokenWeightIn                 ( bO / wO )     ( 1 - sF )
+     wO = tokenWeightOut
+     sF = swapFee
+    """
+    numer = bdiv(token_balance_in, token_weight_in)
+    denom = bdiv(token_balance_out, token_weight_out)
+    ratio = bdiv(numer, denom)
+    scale = bdiv(BONE, bsub(BONE, swap_fee))
+    return bmul(ratio, scale)
+
+
+def calc_out_given_in(token_balance_in, token_weight_in, token_balance_out, token_weight_out,
+                      token_amount_in, swap_fee):
+    """
+    calcOutGivenIn
+     aO = tokenAmountOut
+     bO = tokenBalanceOut
+     bI = tokenBalanceIn              /      /            bI             \\    (wI / wO) \\
+     aI = tokenAmountIn    aO = bO * |  1 - | --------------------------  | ^            |
+     wI = tokenWeightIn               \\      \\ ( bI + ( aI * ( 1 - sF )) /              /
+     wO = tokenWeightOut
+     sF = swapFee
+    """
+    weight_ratio = bdiv(token_weight_in, token_weight_out)
+    adjusted_in = bsub(BONE, swap_fee)
+    adjusted_in = bmul(token_amount_in, adjusted_in)
+    y = bdiv(token_balance_in, badd(token_balance_in, adjusted_in))
+    foo = bpow(y, weight_ratio)
+    bar = bsub(BONE, foo)
+    return bmul(token_balance_out, bar)
+
+
+def calc_in_given_out(token_balance_in, token_weight_in, token_balance_out, token_weight_out,
+                      token_amount_out, swap_fee):
+    """
+    calcInGivenOut
+     aI = tokenAmountIn
+     bO = tokenBalanceOut               /  /     bO      \\    (wO / wI)      \\
+     bI = tokenBalanceIn          bI * |  | ------------  | ^            - 1  |
+     aO = tokenAmountOut    aI =        \\  \\ ( bO - aO ) /                   /
+     wI = tokenWeightIn           --------------------------------------------
+     wO = tokenWeightOut                          ( 1 - sF )
+     sF = swapFee
+    """
+    weight_ratio = bdiv(token_weight_out, token_weight_in)
+    diff = bsub(token_balance_out, token_amount_out)
+    y = bdiv(token_balance_out, diff)
+    foo = bpow(y, weight_ratio)
+    foo = bsub(foo, BONE)
+    token_amount_in = bsub(BONE, swap_fee)
+    return bdiv(bmul(token_balance_in, foo), token_amount_in)
+
+
+def calc_pool_out_given_single_in(token_balance_in, token_weight_in, pool_supply, total_weight,
+                                  token_amount_in, swap_fee):
+    """Pool tokens minted for single asset join (joinswapExternAmountIn)"""
+    # Charge the trading fee for the proportion of tokenAi
+    # which is implicitly traded to the other pool tokens.
+    # That proportion is (1- weightTokenIn)
+    # tokenAiAfterFee = tAi * (1 - (1-weightTi) * poolFee);
+    normalized_weight = bdiv(token_weight_in, total_weight)
+    zaz = bmul(bsub(BONE, normalized_weight), swap_fee)
+    token_amount_in_after_fee = bmul(token_amount_in, bsub(BONE, zaz))
+
+    new_token_balance_in = badd(token_balance_in, token_amount_in_after_fee)
+    token_in_ratio = bdiv(new_token_balance_in, token_balance_in)
+
+    # uint newPoolSupply = (ratioTi ^ weightTi) * poolSupply;
+    pool_ratio = bpow(token_in_ratio, normalized_weight)
+    new_pool_supply = bmul(pool_ratio, pool_supply)
+    return bsub(new_pool_supply, pool_supply)
+
+
+def calc_single_in_given_pool_out(token_balance_in, token_weight_in, pool_supply, total_weight,
+                                  pool_amount_out, swap_fee):
+    """Token amount in for single asset join (joinswapPoolAmountOut)"""
+    normalized_weight = bdiv(token_weight_in, total_weight)
+    new_pool_supply = badd(pool_supply, pool_amount_out)
+    pool_ratio = bdiv(new_pool_supply, pool_supply)
+
+    # uint newBalTi = poolRatio^(1/weightTi) * balTi;
+    boo = bdiv(BONE, normalized_weight)
+    token_in_ratio = bpow(pool_ratio, boo)
+    new_token_balance_in = bmul(token_in_ratio, token_balance_in)
+    token_amount_in_after_fee = bsub(new_token_balance_in, token_balance_in)
+    # Do reverse order of fees charged in joinswap_ExternAmountIn, this way
+    #     ``` pAo == joinswap_ExternAmountIn(Ti, joinswap_PoolAmountOut(pAo, Ti)) ```
+    # uint tAi = tAiAfterFee / (1 - (1-weightTi) * swapFee) ;
+    zar = bmul(bsub(BONE, normalized_weight), swap_fee)
+    return bdiv(token_amount_in_after_fee, bsub(BONE, zar))
+
+
+def calc_single_out_given_pool_in(token_balance_out, token_weight_out, pool_supply, total_weight,
+                                  pool_amount_in, swap_fee):
+    """Token amount out for single asset exit (exitswapPoolAmountIn)"""
+    normalized_weight = bdiv(token_weight_out, total_weight)
+    # charge exit fee on the pool token side
+    # pAiAfterExitFee = pAi*(1-exitFee)
+    pool_amount_in_after_exit_fee = bmul(pool_amount_in, bsub(BONE, EXIT_FEE))
+    new_pool_supply = bsub(pool_supply, pool_amount_in_after_exit_fee)
+    pool_ratio = bdiv(new_pool_supply, pool_supply)
+
+    # newBalTo = poolRatio^(1/weightTo) * balTo;
+    token_out_ratio = bpow(pool_ratio, bdiv(BONE, normalized_weight))
+    new_token_balance_out = bmul(token_out_ratio, token_balance_out)
+
+    token_amount_out_before_swap_fee = bsub(token_balance_out, new_token_balance_out)
+
+    # charge swap fee on the output token side
+    # uint tAo = tAoBeforeSwapFee * (1 - (1-weightTo) * swapFee)
+    zaz = bmul(bsub(BONE, normalized_weight), swap_fee)
+    return bmul(token_amount_out_before_swap_fee, bsub(BONE, zaz))
+
+
+def calc_pool_in_given_single_out(token_balance_out, token_weight_out, pool_supply, total_weight,
+                                  token_amount_out, swap_fee):
+    """Pool tokens burned for single asset exit (exitswapExternAmountOut)"""
+    # charge swap fee on the output token side
+    normalized_weight = bdiv(token_weight_out, total_weight)
+    # uint tAoBeforeSwapFee = tAo / (1 - (1-weightTo) * swapFee) ;
+    zoo = bsub(BONE, normalized_weight)
+    zar = bmul(zoo, swap_fee)
+    token_amount_out_before_swap_fee = bdiv(token_amount_out, bsub(BONE, zar))
+
+    new_token_balance_out = bsub(token_balance_out, token_amount_out_before_swap_fee)
+    token_out_ratio = bdiv(new_token_balance_out, token_balance_out)
+
+    # uint newPoolSupply = (ratioTo ^ weightTo) * poolSupply;
+    pool_ratio = bpow(token_out_ratio, normalized_weight)
+    new_pool_supply = bmul(pool_ratio, pool_supply)
+    pool_amount_in_after_exit_fee = bsub(pool_supply, new_pool_supply)
+
+    # charge exit fee on the pool token side
+    # pAi = pAiAfterExitFee/(1-exitFee)
+    return bdiv(pool_amount_in_after_exit_fee, bsub(BONE, EXIT_FEE))
+
+
+# Batch quoting
+def _broadcast(*args):
+    """Broadcast mix of ints and equal length sequences of ints to lists of Python ints
+
+    NumPy integer scalars and arrays are accepted and converted to int, as
+    fixed point products overflow fixed width integers.
+    """
+    n = max((len(a) for a in args if not isinstance(a, numbers.Integral)), default=1)
+    res = []
+    for a in args:
+        if isinstance(a, numbers.Integral):
+            res.append([int(a)] * n)
+        else:
+            _require(len(a) == n, 'ERR_BATCH_LENGTH')
+            res.append([int(x) for x in a])
+    return res
+
+
+def calc_out_given_in_batch(token_balance_in, token_weight_in, token_balance_out, token_weight_out,
+                            token_amount_in, swap_fee, allow_error=False):
+    """calc_out_given_in over many quotes
+
+    Each argument is either an int shared by all quotes or a sequence with one
+    value per quote. Pool dependent terms (weight ratio, fee adjustment) are
+    computed once per distinct pool rather than once per quote.
+    As in BPool.swapExactAmountIn quotes with amount in above MAX_IN_RATIO of the
+    balance fail with ERR_MAX_IN_RATIO (bpow_approx converges very slowly there).
+
+    :param allow_error: if True return None for quotes that fail a require()
+        rather than raising
+    :return: list of token amounts out
+    """
+    args = _broadcast(
+        token_balance_in, token_weight_in, token_balance_out, token_weight_out, token_amount_in, swap_fee)
+    weight_ratios = {}
+    fee_factors = {}
+    out = []
+    for b_i, w_i, b_o, w_o, a_i, fee in zip(*args):
+        try:
+            _require(a_i <= bmul(b_i, MAX_IN_RATIO), 'ERR_MAX_IN_RATIO')
+            weight_ratio = weight_ratios.get((w_i, w_o))
+            if weight_ratio is None:
+                weight_ratio = weight_ratios[(w_i, w_o)] = bdiv(w_i, w_o)
+            fee_factor = fee_factors.get(fee)
+            if fee_factor is None:
+                fee_factor = fee_factors[fee] = bsub(BONE, fee)
+            y = bdiv(b_i, badd(b_i, bmul(a_i, fee_factor)))
+            out.append(bmul(b_o, bsub(BONE, bpow(y, weight_ratio))))
+        except ValueError:
+            if not allow_error:
+                raise
+            out.append(None)
+    return out
+
+
+def calc_in_given_out_batch(token_balance_in, token_weight_in, token_balance_out, token_weight_out,
+                            token_amount_out, swap_fee, allow_error=False):
+    """calc_in_given_out over many quotes, see calc_out_given_in_batch
+    As in BPool.swapExactAmountOut quotes fail with ERR_MAX_OUT_RATIO above MAX_OUT_RATIO
+
+    :return: list of token amounts in
+    """
+    args = _broadcast(
+        token_balance_in, token_weight_in, token_balance_out, token_weight_out, token_amount_out, swap_fee)
+    weight_ratios = {}
+    fee_factors = {}
+    out = []
+    for b_i, w_i, b_o, w_o, a_o, fee in zip(*args):
+        try:
+            _require(a_o <= bmul(b_o, MAX_OUT_RATIO), 'ERR_MAX_OUT_RATIO')
+            weight_ratio = weight_ratios.get((w_o, w_i))
+            if weight_ratio is None:
+                weight_ratio = weight_ratios[(w_o, w_i)] = bdiv(w_o, w_i)
+            fee_factor = fee_factors.get(fee)
+            if fee_factor is None:
+                fee_factor = fee_factors[fee] = bsub(BONE, fee)
+            y = bdiv(b_o, bsub(b_o, a_o))
+            foo = bsub(bpow(y, weight_ratio), BONE)
+            out.append(bdiv(bmul(b_i, foo), fee_factor))
+        except ValueError:
+            if not allow_error:
+                raise
+            out.append(None)
+    return out
+
+
+def calc_spot_price_batch(token_balance_in, token_weight_in, token_balance_out, token_weight_out,
+                          swap_fee):
+    """calc_spot_price over many quotes, see calc_out_given_in_batch
+
+    :return: list of spot prices
+    """
+    args = _broadcast(token_balance_in, token_weight_in, token_balance_out, token_weight_out, swap_fee)
+    return [calc_spot_price(*quote) for quote in zip(*args)]
@@ -6,6 +6,10 @@ import argparse
 import shutil
 import re
 import time
+import warnings
+import weakref
+
+from token_metadata import TokenMetadata
 
 PRICE_DECIMALS = 1
 PRICE_SCALE = 10 * PRICE_DECIMALS
@@ -157,7 +161,144 @@ def create_contract(w3, build_file):
     return contract
 
 
-def deploy_contract(w3, contract, *args):
+class PendingTransaction(object):
+    """Transaction submitted through a TransactionPipeline, receipt is set by TransactionPipeline.wait"""
+
+    def __init__(self, label, sender, nonce, on_receipt=None):
+        self.label = label
+        self.sender = sender
+        self.nonce = nonce
+        self.on_receipt = on_receipt
+        self.tx_hash = None
+        self.receipt = None
+        self.error = None
+
+    def __repr__(self):
+        tx_hash = self.tx_hash.hex() if self.tx_hash is not None else None
+        return f'PendingTransaction({self.label!r}, nonce={self.nonce}, tx_hash={tx_hash}, error={self.error!r})'
+
+
+class TransactionPipeline(object):
+    """Submit transactions back to back with locally assigned nonces and await their receipts together
+
+    Transactions from the same sender are mined in nonce order, so dependent
+    transactions from one account (e.g. approve then deposit) can share a wave as
+    long as they specify gas (gas estimation runs against the current state).
+    Transactions depending on another account's transaction need a separate wave.
+
+        with TransactionPipeline(w3) as pipeline:
+            set_token_whitelist(w3, ltk, vault.address, pipeline=pipeline)
+            set_token_whitelist(w3, stk, vault.address, pipeline=pipeline)
+    """
+
+    def __init__(self, w3, timeout=120, poll_latency=0.1, nonces=None):
+        """
+        :param nonces: optional account to next nonce, accounts not given start from
+            their pending transaction count
+        """
+        self.w3 = w3
+        self.timeout = timeout
+        self.poll_latency = poll_latency
+        self.pending = []
+        self._nonces = dict(nonces or {})
+
+    def next_nonce(self, account):
+        if account not in self._nonces:
+            self._nonces[account] = self.w3.eth.getTransactionCount(account, 'pending')
+        nonce = self._nonces[account]
+        self._nonces[account] += 1
+        return nonce
+
+    def submit(self, fn, tx_params=None, label=None, on_receipt=None):
+        """Send transaction for contract function or constructor without waiting for receipt
+
+        :param fn: e.g. tok.functions.approve(spender, amount) or contract.constructor(*args)
+        :param tx_params: transaction parameters, 'from' defaults to w3.eth.defaultAccount
+        :param label: name used in failure reports, default function name
+        :param on_receipt: optional callable(tx_receipt) called by wait once mined
+        :return: PendingTransaction
+        """
+        tx_params = dict(tx_params or {})
+        sender = tx_params.setdefault('from', self.w3.eth.defaultAccount)
+        tx_params['nonce'] = self.next_nonce(sender)
+        pending = PendingTransaction(
+            label or getattr(fn, 'fn_name', type(fn).__name__), sender, tx_params['nonce'], on_receipt)
+        try:
+            pending.tx_hash = fn.transact(tx_params)
+        except Exception as e:
+            pending.error = e
+            # Nonce was not used, resynchronise with node for next transaction
+            self._nonces.pop(sender, None)
+        self.pending.append(pending)
+        return pending
+
+    def wait(self, raise_on_failure=True):
+        """Wait for receipts of all submitted transactions
+
+        on_receipt callbacks run here in submission order, once their transaction is
+        mined, so usually after the whole wave has been sent. Callbacks that read
+        contract state should read it at tx_receipt.blockNumber rather than latest.
+        An exception raised by a callback is recorded as that transaction's error.
+
+        :param raise_on_failure: raise ValueError listing failed transactions after all receipts are in
+        :return: list of PendingTransaction in submission order, with receipt or error set
+        """
+        pending, self.pending = self.pending, []
+        failures = []
+        for tx in pending:
+            if tx.error is None:
+                try:
+                    tx.receipt = self.w3.eth.waitForTransactionReceipt(
+                        tx.tx_hash, timeout=self.timeout, poll_latency=self.poll_latency)
+                except Exception as e:
+                    tx.error = e
+                else:
+                    if tx.receipt.status == 0:
+                        tx.error = ValueError('Transaction reverted', tx.tx_hash.hex())
+                    elif tx.on_receipt is not None:
+                        try:
+                            tx.on_receipt(tx.receipt)
+                        except Exception as e:
+                            # Report and carry on collecting the other receipts
+                            tx.error = e
+            if tx.error is not None:
+                failures.append(tx)
+        if failures and raise_on_failure:
+            raise ValueError('Transactions failed', failures)
+        return pending
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.wait()
+
+
+def send_transaction(w3, fn, tx_params=None, pipeline=None, on_receipt=None):
+    """Send transaction and wait for its receipt, or submit it to pipeline
+
+    With a pipeline on_receipt runs from pipeline.wait after the whole wave is mined.
+    The setters below read the old value when submitting and the new value at the
+    receipt block, so a report is exact unless another transaction in the same wave
+    changed the same value.
+
+    :param on_receipt: optional callable(tx_receipt) called once mined
+    :return: receipt, or PendingTransaction if pipeline given
+    """
+    if pipeline is not None:
+        return pipeline.submit(fn, tx_params, on_receipt=on_receipt)
+    tx_hash = fn.transact(tx_params)
+    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
+    if on_receipt is not None:
+        on_receipt(tx_receipt)
+    return tx_receipt
+
+
+def deploy_contract(w3, contract, *args, pipeline=None):
+    """Deploy contract, with pipeline returns PendingTransaction whose receipt has the contract address"""
+    if pipeline is not None:
+        return pipeline.submit(contract.constructor(*args))
     tx_hash = contract.constructor(*args).transact()
     tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
     deployed_contract = w3.eth.contract(
@@ -182,7 +323,236 @@ def connect_contract(w3, contract, address):
     return deployed_contract
 
 
-def connect_deployed(w3, contracts, contract_file_name='contract_address.json', cache_file_name='contract_cache.json'):
+def _vault_args(args, addresses, account):
+    vault_args = args['Vault']
+    tok_version = args['Long'][3]
+    cap = vault_args[0] * PRICE_SCALE
+    floor = vault_args[1] * PRICE_SCALE
+    multiplier = vault_args[2]
+    fee_rate = vault_args[3]
+    vault_name = vault_args[4] if len(vault_args) > 4 else 'Mettalex Vault'
+    oracle = (vault_args[5] if len(vault_args) > 5 else '') or account
+    return [vault_name, tok_version, addresses['Coin'], addresses['Long'], addresses['Short'],
+            oracle, addresses['BPool'], cap, floor, multiplier, fee_rate]
+
+
+def _pool_controller_args(args, addresses, account):
+    # MTLX token defaults to coin if not given
+    mtlx = args['PoolController'][0] if args.get('PoolController') else addresses['Coin']
+    return [addresses['YController'], addresses['Coin'], addresses['BPool'], addresses['Vault'],
+            addresses['Long'], addresses['Short'], mtlx]
+
+
+# Contract name: (dependencies, constructor arguments as function of (args, addresses, account))
+# where args is the contents of args.json and addresses has the address of every dependency.
+# Contracts not listed have no dependencies and take args[name] as constructor arguments.
+DEPLOYMENT_GRAPH = {
+    'BFactory': ((), lambda args, addresses, account: []),
+    # Created by BFactory.newBPool rather than a constructor
+    'BPool': (('BFactory',), None),
+    'USDT': ((), lambda args, addresses, account: args['USDT']),
+    'Coin': ((), lambda args, addresses, account: args['Coin']),
+    'Long': ((), lambda args, addresses, account: args['Long']),
+    'Short': ((), lambda args, addresses, account: args['Short']),
+    'Vault': (('Coin', 'Long', 'Short', 'BPool'), _vault_args),
+    'Bridge': (('USDT', 'Coin'), lambda args, addresses, account: [
+        addresses['USDT'], addresses['Coin'], 100, 10000 * (10 ** 6), 10]),
+    'YController': ((), lambda args, addresses, account: [account]),
+    'YVault': (('Coin', 'YController'), lambda args, addresses, account: [
+        addresses['Coin'], addresses['YController']]),
+    'StrategyHelper': ((), lambda args, addresses, account: []),
+    'PoolController': (('YController', 'Coin', 'BPool', 'Vault', 'Long', 'Short'), _pool_controller_args),
+}
+
+
+# Gas limit of each deployment sent without waiting for earlier receipts
+DEPLOYMENT_GAS = 6_700_000
+
+
+def get_deployment_waves(names, graph=DEPLOYMENT_GRAPH):
+    """Group contracts into waves where each contract only depends on contracts of earlier waves
+
+    :param names: contract names to order
+    :return: list of lists of contract names, in order of names within a wave
+    """
+    names = list(names)
+    dependencies = {k: set(graph[k][0]) & set(names) if k in graph else set() for k in names}
+    waves = []
+    done = set()
+    while len(done) < len(names):
+        wave = [k for k in names if k not in done and dependencies[k] <= done]
+        if not wave:
+            raise ValueError('Circular contract dependencies', sorted(set(names) - done))
+        waves.append(wave)
+        done.update(wave)
+    return waves
+
+
+def _rlp_encode_bytes(b):
+    if len(b) == 1 and b[0] < 0x80:
+        return b
+    if len(b) < 56:
+        return bytes([0x80 + len(b)]) + b
+    length = len(b).to_bytes((len(b).bit_length() + 7) // 8, 'big')
+    return bytes([0xb7 + len(length)]) + length + b
+
+
+def get_create_address(w3, sender, nonce):
+    """Address of contract created by sender (account or contract) with given nonce
+
+    CREATE address is last 20 bytes of keccak256(rlp([sender, nonce])).
+    """
+    payload = _rlp_encode_bytes(bytes.fromhex(sender[2:])) + \
+              _rlp_encode_bytes(nonce.to_bytes((nonce.bit_length() + 7) // 8, 'big'))
+    # Payload is at most 30 bytes so short list encoding
+    digest = w3.keccak(bytes([0xc0 + len(payload)]) + payload)
+    return w3.toChecksumAddress('0x' + bytes(digest[-20:]).hex())
+
+
+def plan_deployment(w3, contracts, contract_cache=None, graph=DEPLOYMENT_GRAPH, nonce=None):
+    """Precompute addresses of contracts not in contract_cache deployed by the default account
+
+    Deployments are ordered by dependency waves and given consecutive nonces of
+    the default account starting from nonce, so the address of every contract is
+    known before any transaction is sent. BPool is created by BFactory, whose
+    contract nonce starts at 1.
+
+    :param nonce: first nonce to deploy with, default pending transaction count
+    :return: list of (contract name, nonce, address) in submission order
+    """
+    account = w3.eth.defaultAccount
+    addresses = {k: v for k, v in (contract_cache or {}).items() if v}
+    if nonce is None:
+        nonce = w3.eth.getTransactionCount(account, 'pending')
+    plan = []
+    for wave in get_deployment_waves(contracts.keys(), graph):
+        for k in wave:
+            if k in addresses:
+                continue
+            missing = [d for d in graph.get(k, ((), None))[0] if d not in addresses]
+            if missing:
+                raise ValueError('Missing contract dependencies', k, missing)
+            if k == 'BPool':
+                factory = addresses['BFactory']
+                new_factory = any(name == 'BFactory' for name, _, _ in plan)
+                factory_nonce = 1 if new_factory else w3.eth.getTransactionCount(factory)
+                address = get_create_address(w3, factory, factory_nonce)
+            else:
+                address = get_create_address(w3, account, nonce)
+            plan.append((k, nonce, address))
+            addresses[k] = address
+            nonce += 1
+    return plan
+
+
+def deploy_contracts(w3, contracts, args, contract_cache=None, cache_file=None, graph=DEPLOYMENT_GRAPH,
+                     precompute_addresses=False, gas=DEPLOYMENT_GAS):
+    """Deploy contracts in dependency waves, connecting to those already in contract_cache
+
+    Contracts of a wave are submitted together without waiting for receipts. The
+    cache file is written after every wave, so a failed deployment can be resumed
+    by calling again with the saved cache.
+
+    With precompute_addresses all addresses are computed in advance (see
+    plan_deployment) and every transaction is sent in a single burst, relying on
+    nonce order for dependencies. The pipeline is seeded with the nonce the plan
+    starts from, so each deployment is sent with its planned nonce and a node
+    rejects it rather than deploying at another address if the account nonce
+    moved in the meantime. Sending stops at the first rejected transaction.
+    Deployed addresses are checked against the plan once receipts arrive and
+    only contracts that match, with all dependencies matching, are cached.
+
+    :param contracts: contract name to contract class, as from get_contracts
+    :param args: constructor arguments from args.json
+    :param contract_cache: contract name to address of already deployed contracts
+    :param cache_file: optional path the contract cache is written to
+    :param precompute_addresses: send all deployments at once using precomputed addresses
+    :param gas: gas limit of each deployment with precompute_addresses, gas can't be
+        estimated for constructors calling contracts that are not yet deployed
+    :return: contract name to deployed contract, for all contracts
+    """
+    contract_cache = dict(contract_cache or {})
+    account = w3.eth.defaultAccount
+    deployed_contracts = {
+        k: connect_contract(w3, contracts[k], contract_cache[k]) for k in contracts if contract_cache.get(k)}
+
+    def on_deployed(k, address):
+        deployed_contracts[k] = connect_contract(w3, contracts[k], address)
+        contract_cache[k] = address
+        print(f'{k} deployed at {address}')
+
+    def submit(pipeline, k, addresses, tx_params):
+        dependencies, get_args = graph.get(k, ((), None))
+        missing = [d for d in dependencies if not addresses.get(d)]
+        if missing:
+            raise ValueError('Missing contract dependencies', k, missing)
+        addresses = {d: addresses[d] for d in dependencies}
+        if k == 'BPool':
+            balancer_factory = connect_contract(w3, contracts['BFactory'], addresses['BFactory'])
+            return pipeline.submit(
+                balancer_factory.functions.newBPool(), dict(tx_params, gas=5_000_000), label=k,
+                on_receipt=lambda tx_receipt: on_deployed(k, get_new_pool_address(balancer_factory, tx_receipt)))
+        constructor_args = args[k] if get_args is None else get_args(args, addresses, account)
+        return pipeline.submit(
+            contracts[k].constructor(*constructor_args), tx_params, label=k,
+            on_receipt=lambda tx_receipt: on_deployed(k, tx_receipt.contractAddress))
+
+    def save_cache():
+        if cache_file is not None:
+            with open(cache_file, 'w') as f:
+                json.dump(contract_cache, f)
+
+    if precompute_addresses:
+        first_nonce = w3.eth.getTransactionCount(account, 'pending')
+        plan = plan_deployment(w3, contracts, contract_cache, graph, nonce=first_nonce)
+        addresses = dict(contract_cache, **{k: address for k, _, address in plan})
+        pipeline = TransactionPipeline(w3, nonces={account: first_nonce})
+        for k, nonce, address in plan:
+            tx = submit(pipeline, k, addresses, {'from': account, 'gas': gas})
+            if tx.error is not None:
+                # Pipeline resynchronises nonce after a failed send, later nonces would not match plan
+                break
+        sent = pipeline.wait(raise_on_failure=False)
+        not_sent = [k for k, _, _ in plan[len(sent):]]
+        failures = []
+        for (k, nonce, address), tx in zip(plan, sent):
+            dependencies = graph.get(k, ((), None))[0]
+            if tx.error is None and tx.nonce != nonce:
+                tx.error = ValueError('Account nonce differs from plan', nonce, tx.nonce)
+            if tx.error is None and contract_cache.get(k) != address:
+                tx.error = ValueError('Deployed address differs from plan', address, contract_cache.get(k))
+            elif tx.error is None and any(d not in contract_cache for d in dependencies):
+                tx.error = ValueError('Dependency deployment failed', k)
+            if tx.error is not None:
+                failures.append(tx)
+                contract_cache.pop(k, None)
+                deployed_contracts.pop(k, None)
+        save_cache()
+        if failures or not_sent:
+            raise ValueError('Contract deployment failed', failures, not_sent)
+        return {k: deployed_contracts[k] for k in contracts}
+
+    for wave in get_deployment_waves(contracts.keys(), graph):
+        to_deploy = [k for k in wave if k not in deployed_contracts]
+        if not to_deploy:
+            continue
+        pipeline = TransactionPipeline(w3)
+        for k in to_deploy:
+            submit(pipeline, k, contract_cache, {'from': account})
+        failures = [tx for tx in pipeline.wait(raise_on_failure=False) if tx.error is not None]
+        save_cache()
+        if failures:
+            raise ValueError('Contract deployment failed', failures)
+
+    return {k: deployed_contracts[k] for k in contracts}
+
+
+def connect_deployed(w3, contracts, contract_file_name='contract_address.json', cache_file_name='contract_cache.json',
+                     precompute_addresses=True):
+    """Connect to contracts in the cache file, deploying any that are missing
+
+    :param precompute_addresses: send missing deployments at once, see deploy_contracts
+    """
     contract_file = Path(__file__).parent / \
                     'contract-cache' / contract_file_name
     cache_file = Path(__file__).parent / 'contract-cache' / cache_file_name
@@ -199,66 +569,19 @@ def connect_deployed(w3, contracts, contract_file_name='contract_address.json',
     with open(cache_file, 'r') as f:
         contract_cache = json.load(f)
 
-    account = w3.eth.defaultAccount
-    deployed_contracts = {}
-
-    for k in contracts.keys():
-        if contract_cache[k]:
-            deployed_contracts[k] = connect_contract(
-                w3, contracts[k], contract_cache[k])
-
-        else:
-            if k == 'BFactory':
-                deployed_contracts[k] = deploy_contract(w3, contracts[k])
-
-            elif k == 'BPool':
-                deployed_contracts[k] = create_balancer_pool(
-                    w3, contracts[k], connect_contract(w3, contracts['BFactory'], contract_cache['BFactory']))
-
-            elif k == 'YController':
-                deployed_contracts[k] = deploy_contract(
-                    w3, contracts[k], w3.eth.defaultAccount)
-
-            elif k == 'Bridge':
-                deployed_contracts[k] = deploy_contract(
-                    w3, contracts[k], contract_cache['USDT'], contract_cache['Coin'], 100, 10000 * (10 ** 6), 10)
-
-            elif k == 'YVault':
-                deployed_contracts[k] = deploy_contract(
-                    w3, contracts[k], contract_cache['Coin'], contract_cache['YController'])
-
-            elif k == 'PoolController':
-                deployed_contracts[k] = deploy_contract(
-                    w3, contracts[k], contract_cache['YController'], contract_cache['Coin'], contract_cache['BPool'],
-                    contract_cache['Vault'], contract_cache['Long'], contract_cache['Short'])
-            elif k == 'Vault':
-                tok_version = args['Long'][3]
-                cap = args['Vault'][0] * PRICE_SCALE
-                floor = args['Vault'][1] * PRICE_SCALE
-                multiplier = args['Vault'][2]
-                fee_rate = args['Vault'][3]
-                vault_name = args['Vault'][4]
-                oracle = args['Vault'][5]
-                if not oracle:
-                    oracle = account
-                deployed_contracts[k] = deploy_contract(w3, contracts[k], vault_name, tok_version,
-                                                        contract_cache['Coin'], contract_cache['Long'],
-                                                        contract_cache['Short'],
-                                                        oracle, contract_cache['BPool'], cap, floor, multiplier,
-                                                        fee_rate)
-            else:
-                deployed_contracts[k] = deploy_contract(
-                    w3, contracts[k], *args[k])
-        contract_cache[k] = deployed_contracts[k].address
+    # Deploys any contracts missing from the cache
+    return deploy_contracts(w3, contracts, args, contract_cache, cache_file,
+                            precompute_addresses=precompute_addresses)
 
-    with open(cache_file, 'w') as f:
-        json.dump(contract_cache, f)
-    return deployed_contracts
 
+def deploy(w3, contracts, cache_file_name='contract_cache.json', resume=False, precompute_addresses=True):
+    """Deploy all contracts
 
-def deploy(w3, contracts, cache_file_name='contract_cache.json'):
+    :param resume: connect to contracts already in the cache file and only deploy
+        the others, e.g. after a failed deployment
+    :param precompute_addresses: send all deployments at once, see deploy_contracts
+    """
     cache_file = Path(__file__).parent / 'contract-cache' / cache_file_name
-    account = w3.eth.defaultAccount
 
     if not os.path.isfile('args.json'):
         print('No args file')
@@ -267,77 +590,13 @@ def deploy(w3, contracts, cache_file_name='contract_cache.json'):
     with open('args.json', 'r') as f:
         args = json.load(f)
 
-    # Balancer
-    balancer_factory = deploy_contract(w3, contracts['BFactory'])
-    balancer = create_balancer_pool(w3, contracts['BPool'], balancer_factory)
+    contract_cache = {}
+    if resume and os.path.isfile(cache_file):
+        with open(cache_file, 'r') as f:
+            contract_cache = json.load(f)
 
-    USDT = deploy_contract(w3, contracts['USDT'], *args['USDT'])
-
-    # Mettalex Coin and Vault
-    coin = deploy_contract(w3, contracts['Coin'], *args['Coin'])
-    ltk = deploy_contract(w3, contracts['Long'], *args['Long'])
-    stk = deploy_contract(w3, contracts['Short'], *args['Short'])
-
-    tok_version = args['Long'][3]
-    cap = args['Vault'][0] * PRICE_SCALE
-    floor = args['Vault'][1] * PRICE_SCALE
-    multiplier = args['Vault'][2]
-    feeRate = args['Vault'][3]
-    vault = deploy_contract(
-        w3, contracts['Vault'],
-        'Mettalex Vault', tok_version, coin.address, ltk.address, stk.address,
-        account, balancer.address, cap, floor, multiplier, feeRate)
-
-    # Bridge
-    bridge = deploy_contract(w3, contracts['Bridge'], USDT.address, coin.address, 100, 10000 * (10 ** 6), 10)
-    # Liquidity Provider
-    y_controller = deploy_contract(w3, contracts['YController'], account)
-    y_vault = deploy_contract(
-        w3, contracts['YVault'], coin.address, y_controller.address)
-
-    strategy_helper = deploy_contract(w3, contracts['StrategyHelper'])
-
-    if (len(args['PoolController'])):
-        strategy = deploy_contract(
-            w3, contracts['PoolController'], y_controller.address, coin.address, balancer.address, vault.address,
-            ltk.address, stk.address, args['PoolController'][0])
-    else:
-        strategy = deploy_contract(
-            w3, contracts['PoolController'], y_controller.address, coin.address, balancer.address, vault.address,
-            ltk.address, stk.address, coin.address)
-
-    contract_addresses = {
-        'BFactory': balancer_factory.address,
-        'BPool': balancer.address,
-        'Coin': coin.address,
-        'Long': ltk.address,
-        'Short': stk.address,
-        'Vault': vault.address,
-        'YVault': y_vault.address,
-        'YController': y_controller.address,
-        'PoolController': strategy.address,
-        'Bridge': bridge.address,
-        'USDT': USDT.address,
-        "StrategyHelper": strategy_helper.address
-    }
-    with open(cache_file, 'w') as f:
-        json.dump(contract_addresses, f)
-
-    deployed_contracts = {
-        'BFactory': balancer_factory,
-        'BPool': balancer,
-        'Coin': coin,
-        'Long': ltk,
-        'Short': stk,
-        'Vault': vault,
-        'YVault': y_vault,
-        'YController': y_controller,
-        'PoolController': strategy,
-        'USDT': USDT,
-        'Bridge': bridge,
-        "StrategyHelper": strategy_helper
-    }
-    return deployed_contracts
+    return deploy_contracts(w3, contracts, args, contract_cache, cache_file,
+                            precompute_addresses=precompute_addresses)
 
 
 def create_balancer_pool(w3, pool_contract, balancer_factory):
@@ -346,9 +605,7 @@ def create_balancer_pool(w3, pool_contract, balancer_factory):
         {'from': acct, 'gas': 5_000_000}
     )
     tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    # Find pool address from contract event
-    receipt = balancer_factory.events.LOG_NEW_POOL().getLogs()
-    pool_address = receipt[0]['args']['pool']
+    pool_address = get_new_pool_address(balancer_factory, tx_receipt)
     balancer = w3.eth.contract(
         address=pool_address,
         abi=pool_contract.abi
@@ -356,6 +613,12 @@ def create_balancer_pool(w3, pool_contract, balancer_factory):
     return balancer
 
 
+def get_new_pool_address(balancer_factory, tx_receipt):
+    # Find pool address from contract event in newBPool receipt
+    logs = balancer_factory.events.LOG_NEW_POOL().processReceipt(tx_receipt)
+    return logs[0]['args']['pool']
+
+
 def connect_balancer(w3):
     build_file = Path(__file__).parent / ".." / \
                  'mettalex-balancer' / 'build' / 'contracts' / 'BPool.json'
@@ -444,121 +707,251 @@ def connect_strategy(w3, address):
     return strategy
 
 
-def set_strategy_helper(w3, strategy, strategy_helper, acct=None):
-    strategy.functions.setStrategyHelper(str(strategy_helper.address)).transact(
-        {'from': acct, 'gas': 1_000_000})
+def set_strategy_helper(w3, strategy, strategy_helper, acct=None, pipeline=None):
+    acct = getattr(acct, 'address', acct) or w3.eth.defaultAccount
+    return send_transaction(
+        w3, strategy.functions.setStrategyHelper(str(strategy_helper.address)),
+        {'from': acct, 'gas': 1_000_000}, pipeline)
 
 
 def full_setup(w3, admin, deployed_contracts=None, price=None, contracts=None):
     if deployed_contracts is None:
         print('Deploying contracts')
         deployed_contracts = deploy(w3, contracts)
-    print('Whitelisting Mettalex vault to mint position tokens')
-    whitelist_vault(
-        w3, deployed_contracts['Vault'], deployed_contracts['Long'], deployed_contracts['Short'])
-    print('Setting strategy')
-    set_strategy(
-        w3, deployed_contracts['YController'], deployed_contracts['Coin'], deployed_contracts['PoolController'])
-    print('Setting y-vault controller')
-    set_yvault_controller(
-        w3, deployed_contracts['YController'], deployed_contracts['YVault'].address, deployed_contracts['Coin'].address)
-    print('Setting balancer controller')
-    set_balancer_controller(
-        w3, deployed_contracts['BPool'], deployed_contracts['PoolController'])
-    print('Setting Mettalex vault AMM')
-    set_autonomous_market_maker(
-        w3, deployed_contracts['Vault'], deployed_contracts['PoolController'])  # Zero fees for AMM
-    # Connect strategy helper to strategy
-    set_strategy_helper(
-        w3, deployed_contracts['PoolController'], deployed_contracts['StrategyHelper'], acct=admin
-    )
-    if price is not None:
-        # May be connecting to existing vault, if not then can set tht price here
-        set_price(w3, deployed_contracts['Vault'], price)
+    # Setup transactions are independent so are submitted together and mined in a few blocks
+    with TransactionPipeline(w3) as pipeline:
+        print('Whitelisting Mettalex vault to mint position tokens')
+        whitelist_vault(
+            w3, deployed_contracts['Vault'], deployed_contracts['Long'], deployed_contracts['Short'],
+            pipeline=pipeline)
+        print('Setting strategy')
+        set_strategy(
+            w3, deployed_contracts['YController'], deployed_contracts['Coin'], deployed_contracts['PoolController'],
+            pipeline=pipeline)
+        print('Setting y-vault controller')
+        set_yvault_controller(
+            w3, deployed_contracts['YController'], deployed_contracts['YVault'].address,
+            deployed_contracts['Coin'].address, pipeline=pipeline)
+        print('Setting balancer controller')
+        set_balancer_controller(
+            w3, deployed_contracts['BPool'], deployed_contracts['PoolController'], pipeline=pipeline)
+        print('Setting Mettalex vault AMM')
+        set_autonomous_market_maker(
+            w3, deployed_contracts['Vault'], deployed_contracts['PoolController'],
+            pipeline=pipeline)  # Zero fees for AMM
+        # Connect strategy helper to strategy
+        set_strategy_helper(
+            w3, deployed_contracts['PoolController'], deployed_contracts['StrategyHelper'], acct=admin,
+            pipeline=pipeline
+        )
+        if price is not None:
+            # May be connecting to existing vault, if not then can set tht price here
+            set_price(w3, deployed_contracts['Vault'], price, pipeline=pipeline)
     return w3, admin, deployed_contracts
 
 
-def whitelist_vault(w3, vault, ltk, stk):
-    set_token_whitelist(w3, ltk, vault.address, True)
-    set_token_whitelist(w3, stk, vault.address, True)
+def whitelist_vault(w3, vault, ltk, stk, pipeline=None):
+    set_token_whitelist(w3, ltk, vault.address, True, pipeline=pipeline)
+    set_token_whitelist(w3, stk, vault.address, True, pipeline=pipeline)
 
 
-def set_token_whitelist(w3, tok, address, state=True):
+def set_token_whitelist(w3, tok, address, state=True, pipeline=None):
     acct = w3.eth.defaultAccount
     old_state = tok.functions.whitelist(address).call()
-    tx_hash = tok.functions.setWhitelist(address, state).transact(
-        {'from': acct, 'gas': 1_000_000}
-    )
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    new_state = tok.functions.whitelist(address).call()
-    tok_name = tok.functions.name().call()
-    print(f'{tok_name} whitelist state for {address} changed from {old_state} to {new_state}')
+
+    def report(tx_receipt):
+        new_state = tok.functions.whitelist(address).call(block_identifier=tx_receipt.blockNumber)
+        tok_name = token_metadata.name(tok)
+        print(f'{tok_name} whitelist state for {address} changed from {old_state} to {new_state}')
+
+    return send_transaction(
+        w3, tok.functions.setWhitelist(address, state), {'from': acct, 'gas': 1_000_000}, pipeline, report)
 
 
-def set_strategy(w3, y_controller, tok, strategy):
+def set_strategy(w3, y_controller, tok, strategy, pipeline=None):
     acct = w3.eth.defaultAccount
     old_strategy = y_controller.functions.strategies(tok.address).call()
-    tx_hash = y_controller.functions.setStrategy(tok.address, strategy.address).transact(
-        {'from': acct, 'gas': 1_000_000}
-    )
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    new_strategy = y_controller.functions.strategies(tok.address).call()
-    tok_name = tok.functions.name().call()
-    print(f'{tok_name} strategy changed from {old_strategy} to {new_strategy}')
 
+    def report(tx_receipt):
+        new_strategy = y_controller.functions.strategies(tok.address).call(block_identifier=tx_receipt.blockNumber)
+        tok_name = token_metadata.name(tok)
+        print(f'{tok_name} strategy changed from {old_strategy} to {new_strategy}')
+
+    return send_transaction(
+        w3, y_controller.functions.setStrategy(tok.address, strategy.address),
+        {'from': acct, 'gas': 1_000_000}, pipeline, report)
 
-def update_pool_controller(w3, balancer, strategy, new_strategy):
+
+def update_pool_controller(w3, balancer, strategy, new_strategy, pipeline=None):
     acct = w3.eth.defaultAccount
     old_balancer_controller = balancer.functions.getController().call()
-    tx_hash = strategy.functions.updatePoolController(new_strategy.address).transact({
-        'from': acct, 'gas': 1_000_000})
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    new_balancer_controller = balancer.functions.getController().call()
-    print(
-        f'BPool controller changed from {old_balancer_controller} to {new_balancer_controller}')
+
+    def report(tx_receipt):
+        new_balancer_controller = balancer.functions.getController().call(block_identifier=tx_receipt.blockNumber)
+        print(
+            f'BPool controller changed from {old_balancer_controller} to {new_balancer_controller}')
+
+    return send_transaction(
+        w3, strategy.functions.updatePoolController(new_strategy.address),
+        {'from': acct, 'gas': 1_000_000}, pipeline, report)
 
 
-def set_yvault_controller(w3, y_controller, y_vault_address, token_address):
+def set_yvault_controller(w3, y_controller, y_vault_address, token_address, pipeline=None):
     acct = w3.eth.defaultAccount
-    tx_hash = y_controller.functions.setVault(
-        token_address, y_vault_address).transact({'from': acct, 'gas': 1_000_000})
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    print('yVault added in yController')
+    return send_transaction(
+        w3, y_controller.functions.setVault(token_address, y_vault_address),
+        {'from': acct, 'gas': 1_000_000}, pipeline,
+        lambda tx_receipt: print('yVault added in yController'))
 
 
-def set_balancer_controller(w3, balancer, strategy, controller_address=None):
+def set_balancer_controller(w3, balancer, strategy, controller_address=None, pipeline=None):
     acct = w3.eth.defaultAccount
     if controller_address is None:
         controller_address = strategy.address
-    tx_hash = balancer.functions.setController(controller_address).transact({
-        'from': acct, 'gas': 1_000_000})
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    balancer_controller = balancer.functions.getController().call()
-    print(f'Balancer controller {balancer_controller}')
 
+    def report(tx_receipt):
+        balancer_controller = balancer.functions.getController().call(block_identifier=tx_receipt.blockNumber)
+        print(f'Balancer controller {balancer_controller}')
+
+    return send_transaction(
+        w3, balancer.functions.setController(controller_address),
+        {'from': acct, 'gas': 1_000_000}, pipeline, report)
 
-def set_autonomous_market_maker(w3, vault, strategy):
+
+def set_autonomous_market_maker(w3, vault, strategy, pipeline=None):
     acct = w3.eth.defaultAccount
     old_amm = vault.functions.ammPoolController().call()
-    tx_hash = vault.functions.updateAMMPoolController(strategy.address).transact(
-        {'from': acct, 'gas': 1_000_000}
-    )
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    new_amm = vault.functions.ammPoolController().call()
-    vault_name = vault.functions.contractName().call()
-    print(f'{vault_name} strategy changed from {old_amm} to {new_amm}')
 
+    def report(tx_receipt):
+        new_amm = vault.functions.ammPoolController().call(block_identifier=tx_receipt.blockNumber)
+        vault_name = vault.functions.contractName().call()
+        print(f'{vault_name} strategy changed from {old_amm} to {new_amm}')
 
-def set_price(w3, vault, price):
+    return send_transaction(
+        w3, vault.functions.updateAMMPoolController(strategy.address),
+        {'from': acct, 'gas': 1_000_000}, pipeline, report)
+
+
+def set_price(w3, vault, price, pipeline=None):
     acct = w3.eth.defaultAccount
     old_spot = vault.functions.priceSpot().call()
-    tx_hash = vault.functions.updateSpot(price).transact(
-        {'from': acct, 'gas': 1_000_000}
-    )
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    new_spot = vault.functions.priceSpot().call()
-    vault_name = vault.functions.contractName().call()
-    print(f'{vault_name} spot changed from {old_spot} to {new_spot}')
+
+    def report(tx_receipt):
+        new_spot = vault.functions.priceSpot().call(block_identifier=tx_receipt.blockNumber)
+        vault_name = vault.functions.contractName().call()
+        print(f'{vault_name} spot changed from {old_spot} to {new_spot}')
+
+    return send_transaction(
+        w3, vault.functions.updateSpot(price), {'from': acct, 'gas': 1_000_000}, pipeline, report)
+
+
+# Multicall3 aggregator, deployed at the same address on BSC, Ethereum and most other chains
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+MULTICALL3_ABI = [{
+    'name': 'aggregate3', 'type': 'function', 'stateMutability': 'payable',
+    'inputs': [{'name': 'calls', 'type': 'tuple[]', 'components': [
+        {'name': 'target', 'type': 'address'},
+        {'name': 'allowFailure', 'type': 'bool'},
+        {'name': 'callData', 'type': 'bytes'},
+    ]}],
+    'outputs': [{'name': 'returnData', 'type': 'tuple[]', 'components': [
+        {'name': 'success', 'type': 'bool'},
+        {'name': 'returnData', 'type': 'bytes'},
+    ]}],
+}]
+
+
+class MulticallBatch(object):
+    """Collect contract view calls and execute them as a single eth_call to a Multicall3 aggregator
+
+    The aggregated call goes through the provider and middleware like any other
+    contract call, and all calls run in the same block so results form a
+    consistent snapshot. Calls are made by the aggregator contract, so views
+    that depend on msg.sender can't be batched. Results are normalized as by
+    ContractFunction.call (e.g. checksum addresses).
+
+    Chains without the aggregator (e.g. a local ganache) fall back to sequential
+    calls pinned to one block, with a warning.
+
+        batch = MulticallBatch(w3)
+        batch.add(coin.functions.balanceOf(address))
+        batch.add(coin.functions.decimals())
+        balance, decimals = batch.execute()
+    """
+    # Whether aggregator is deployed, per Web3 instance
+    _deployed = weakref.WeakKeyDictionary()
+
+    def __init__(self, w3, block_identifier='latest', multicall_address=MULTICALL3_ADDRESS):
+        self.w3 = w3
+        self.block_identifier = block_identifier
+        self.multicall_address = multicall_address
+        self.calls = []
+
+    def add(self, contract_function):
+        """Add call e.g. tok.functions.balanceOf(address), returns index of its result"""
+        self.calls.append(contract_function)
+        return len(self.calls) - 1
+
+    def _is_deployed(self):
+        deployed = self._deployed.setdefault(self.w3, {})
+        if self.multicall_address not in deployed:
+            deployed[self.multicall_address] = len(self.w3.eth.getCode(self.multicall_address)) > 0
+        return deployed[self.multicall_address]
+
+    def execute(self):
+        """Execute all calls in one round trip
+
+        :return: list of decoded results in order added, single output values are unwrapped
+        """
+        from web3._utils.abi import get_abi_output_types, map_abi_data
+        from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+        calls, self.calls = self.calls, []
+        if not calls:
+            return []
+        block = self.block_identifier
+        if not self._is_deployed():
+            warnings.warn(f'No Multicall3 contract at {self.multicall_address}, making {len(calls)} '
+                          f'sequential calls instead of one batch', RuntimeWarning)
+            if block == 'latest':
+                block = self.w3.eth.blockNumber
+            return [fn.call(block_identifier=block) for fn in calls]
+
+        encoders = {}
+        aggregated = []
+        for fn in calls:
+            abi_key = id(fn.contract_abi)
+            if abi_key not in encoders:
+                encoders[abi_key] = self.w3.eth.contract(abi=fn.contract_abi)
+            call_data = encoders[abi_key].encodeABI(fn_name=fn.fn_name, args=fn.args, kwargs=fn.kwargs)
+            aggregated.append((fn.address, True, call_data))
+        multicall = self.w3.eth.contract(address=self.multicall_address, abi=MULTICALL3_ABI)
+        responses = multicall.functions.aggregate3(aggregated).call(block_identifier=block)
+
+        results = []
+        for fn, (success, return_data) in zip(calls, responses):
+            if not success:
+                raise ValueError('Batched call failed', fn.fn_name, return_data)
+            # Decode and normalize as ContractFunction.call does
+            output_types = get_abi_output_types(fn.abi)
+            values = self.w3.codec.decode_abi(output_types, return_data)
+            values = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, values)
+            results.append(values[0] if len(values) == 1 else values)
+        return results
+
+
+def batch_call(w3, contract_functions, block_identifier='latest'):
+    """Execute list of contract view calls in one round trip, see MulticallBatch
+
+    :return: list of results
+    """
+    batch = MulticallBatch(w3, block_identifier)
+    for fn in contract_functions:
+        batch.add(fn)
+    return batch.execute()
+
+
+token_metadata = TokenMetadata(batch_call=batch_call)
 
 
 def get_vault_details(w3, contracts, address=None):
@@ -568,33 +961,32 @@ def get_vault_details(w3, contracts, address=None):
 
     vault = w3.eth.contract(address=address, abi=vault_contract.abi)
 
-    coin_address = vault.functions.collateralToken().call()
+    # Vault fields in one batch, then token details once token addresses are known
+    (coin_address, ltok_address, stok_address, name, oracle,
+     vault_floor, vault_cap, collateral_per_unit, vault_spot) = batch_call(w3, [
+        vault.functions.collateralToken(),
+        vault.functions.longPositionToken(),
+        vault.functions.shortPositionToken(),
+        vault.functions.contractName(),
+        vault.functions.oracle(),
+        vault.functions.priceFloor(),
+        vault.functions.priceCap(),
+        vault.functions.collateralPerUnit(),
+        vault.functions.priceSpot(),
+    ])
     coin = w3.eth.contract(address=coin_address, abi=contracts['Coin'].abi)
-    ltok_address = vault.functions.longPositionToken().call()
     ltok = w3.eth.contract(address=ltok_address, abi=contracts['Long'].abi)
-    stok_address = vault.functions.shortPositionToken().call()
     stok = w3.eth.contract(address=stok_address, abi=contracts['Short'].abi)
 
-    def token_details(tok):
-        return {
-            'adress': tok.address,
-            'name': tok.functions.name().call(),
-            'symbol': tok.functions.symbol().call(),
-            'decimals': tok.functions.decimals().call()
-        }
-
-    name = vault.functions.contractName().call()
-    vault_floor = vault.functions.priceFloor().call()
-    vault_cap = vault.functions.priceCap().call()
-    collateral_per_unit = vault.functions.collateralPerUnit().call()
-    vault_spot = vault.functions.priceSpot().call()
+    token_metadata.prefetch([coin, ltok, stok])
+
     vault_details = {
         'vault': vault,
-        'coin': token_details(coin),
-        'ltok': token_details(ltok),
-        'stok': token_details(stok),
+        'coin': token_metadata.details(coin),
+        'ltok': token_metadata.details(ltok),
+        'stok': token_metadata.details(stok),
         'name': name,
-        'oracle': vault.functions.oracle().call(),
+        'oracle': oracle,
         'floor': vault_floor,
         'cap': vault_cap,
         'spot': vault_spot,
@@ -607,14 +999,14 @@ def print_mettalex_vault(w3, contracts, address=None):
     res = get_vault_details(w3, contracts, address)
 
     print(f'{res["name"]}')
-    print(f'Coin: {res["coin"].address}')
-    print(f'Long: {res["ltok"].address}')
-    print(f'Short: {res["stok"].address}')
+    print(f'Coin: {res["coin"]["adress"]}')
+    print(f'Long: {res["ltok"]["adress"]}')
+    print(f'Short: {res["stok"]["adress"]}')
     print(f'Vault: {res["vault"].address}')
     print(
         f'Floor: {res["floor"]}, Cap: {res["cap"]} -> Collateral Per Unit {res["cpu"]}')
-    coin_dp = res["coin"].functions.decimals().call()
-    ltok_dp = res["ltok"].functions.decimals().call()
+    coin_dp = res["coin"]["decimals"]
+    ltok_dp = res["ltok"]["decimals"]
     cpu_ticks = res["cpu"] * 10 ** (ltok_dp - coin_dp)
     print(f'Dollar value of 1 position token pair = {cpu_ticks}')
     print(f'Current spot price: {res["spot"]}')
@@ -635,48 +1027,52 @@ class BalanceReporter(object):
         self.y_vault_scale = 10 ** 6
 
     def get_balances(self, address):
-        coin_balance = self.coin.functions.balanceOf(address).call()
-        ltk_balance = self.ltk.functions.balanceOf(address).call()
-        stk_balance = self.stk.functions.balanceOf(address).call()
-        y_vault_balance = self.y_vault.functions.balanceOf(address).call()
-        return coin_balance, ltk_balance, stk_balance, y_vault_balance
+        return self.get_balances_batch([address])[0]
+
+    def get_balances_batch(self, addresses):
+        """Coin, long, short and y-vault balances of all addresses in one batched request
+
+        :return: list of (coin_balance, ltk_balance, stk_balance, y_vault_balance)
+        """
+        toks = [self.coin, self.ltk, self.stk, self.y_vault]
+        values = batch_call(self.w3, [
+            tok.functions.balanceOf(address) for address in addresses for tok in toks
+        ])
+        return [tuple(values[i:i + len(toks)]) for i in range(0, len(values), len(toks))]
 
     def print_balances(self, address, name):
-        coin_balance, ltk_balance, stk_balance, y_vault_balance = self.get_balances(
-            address)
-        print(
-            f'\n{name} ({address}) has {y_vault_balance / 10 ** 6:0.2f} vault shares')
-        print(
-            f'  {coin_balance / 10 ** 6:0.2f} coin, {ltk_balance / 10 ** 5:0.2f} LTK, {stk_balance / 10 ** 5:0.2f} STK\n')
+        self.print_all_balances([(address, name)])
 
+    def print_all_balances(self, named_addresses):
+        """Print balances of list of (address, name) from a single snapshot"""
+        balances = self.get_balances_batch([address for address, _ in named_addresses])
+        for (address, name), (coin_balance, ltk_balance, stk_balance, y_vault_balance) in zip(
+                named_addresses, balances):
+            print(
+                f'\n{name} ({address}) has {y_vault_balance / 10 ** 6:0.2f} vault shares')
+            print(
+                f'  {coin_balance / 10 ** 6:0.2f} coin, {ltk_balance / 10 ** 5:0.2f} LTK, {stk_balance / 10 ** 5:0.2f} STK\n')
 
-def deposit(w3, y_vault, coin, amount, customAccount=None):
+
+def deposit(w3, y_vault, coin, amount, customAccount=None, pipeline=None):
     acct = w3.eth.defaultAccount
     if customAccount:
         acct = customAccount
-    amount_unitless = int(amount * 10 ** (coin.functions.decimals().call()))
-    tx_hash = coin.functions.approve(y_vault.address, amount_unitless).transact(
-        {'from': acct, 'gas': 1_000_000}
-    )
-    # time.sleep(5)
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    print('approved')
-    tx_hash = y_vault.functions.deposit(amount_unitless).transact(
-        {'from': acct, 'gas': 1_000_000}
-    )
-    # time.sleep(5)
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    print(f'Deposit in YVault. Amount: {amount} coin. Depositer: {acct}')
+    amount_unitless = int(amount * 10 ** (token_metadata.decimals(coin)))
+    # Approve and deposit from same account so deposit is mined after approval
+    send_transaction(
+        w3, coin.functions.approve(y_vault.address, amount_unitless), {'from': acct, 'gas': 1_000_000}, pipeline,
+        lambda tx_receipt: print('approved'))
+    return send_transaction(
+        w3, y_vault.functions.deposit(amount_unitless), {'from': acct, 'gas': 1_000_000}, pipeline,
+        lambda tx_receipt: print(f'Deposit in YVault. Amount: {amount} coin. Depositer: {acct}'))
 
 
-def earn(w3, y_vault):
+def earn(w3, y_vault, pipeline=None):
     acct = w3.eth.defaultAccount
-    tx_hash = y_vault.functions.earn().transact(
-        {'from': acct, 'gas': 5_000_000}
-    )
-    # time.sleep(5)
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    print(f'Liquidity supplied to AMM balancer. Earn Function Caller: {acct}')
+    return send_transaction(
+        w3, y_vault.functions.earn(), {'from': acct, 'gas': 5_000_000}, pipeline,
+        lambda tx_receipt: print(f'Liquidity supplied to AMM balancer. Earn Function Caller: {acct}'))
 
 
 def swap_amount_in(w3, balancer, tok_in, qty_in, tok_out, customAccount=None, min_qty_out=None, max_price=None):
@@ -684,8 +1080,8 @@ def swap_amount_in(w3, balancer, tok_in, qty_in, tok_out, customAccount=None, mi
     if customAccount:
         acct = customAccount
     print(
-        f'User: {acct} making a swap in balancer. Token_in: ${tok_in.functions.symbol().call()} Token_out: ${tok_out.functions.symbol().call()}')
-    qty_in_unitless = int(qty_in * 10 ** (tok_in.functions.decimals().call()))
+        f'User: {acct} making a swap in balancer. Token_in: ${token_metadata.symbol(tok_in)} Token_out: ${token_metadata.symbol(tok_out)}')
+    qty_in_unitless = int(qty_in * 10 ** (token_metadata.decimals(tok_in)))
 
     if qty_in_unitless > tok_in.functions.allowance(acct, balancer.address).call():
         tx_hash = tok_in.functions.approve(balancer.address, qty_in_unitless).transact(
@@ -709,7 +1105,7 @@ def swap_amount_in(w3, balancer, tok_in, qty_in, tok_out, customAccount=None, mi
         print(f'Max price not specified: using {max_price}')
 
     min_qty_out_unitless = int(
-        min_qty_out * 10 ** (tok_out.functions.decimals().call()))
+        min_qty_out * 10 ** (token_metadata.decimals(tok_out)))
 
     tx_hash = balancer.functions.swapExactAmountIn(
         tok_in.address, qty_in_unitless,
@@ -750,54 +1146,47 @@ def get_spot_price(w3, balancer, tok_in, tok_out, unitless=False, include_fee=Fa
     if not unitless:
         # Take decimals into account
         spot_price = spot_price * 10 ** (
-                tok_out.functions.decimals().call()
-                - tok_in.functions.decimals().call()
+                token_metadata.decimals(tok_out)
+                - token_metadata.decimals(tok_in)
                 - 18)
     return spot_price
 
 
-def withdraw(w3, y_vault, amount, customAccount=None):
+def withdraw(w3, y_vault, amount, customAccount=None, pipeline=None):
     acct = w3.eth.defaultAccount
     if customAccount:
         acct = customAccount
-    amount_unitless = amount * 10 ** (y_vault.functions.decimals().call())
-    tx_hash = y_vault.functions.withdraw(amount_unitless).transact(
-        {'from': acct, 'gas': 5_000_000}
-    )
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    print(f'Withdraw from YVault. Amount: {amount} shares. Withdrawer: {acct}')
+    amount_unitless = amount * 10 ** (token_metadata.decimals(y_vault))
+    return send_transaction(
+        w3, y_vault.functions.withdraw(amount_unitless), {'from': acct, 'gas': 5_000_000}, pipeline,
+        lambda tx_receipt: print(f'Withdraw from YVault. Amount: {amount} shares. Withdrawer: {acct}'))
 
 
-def distribute_coin(w3, coin, amount=200000, customAccount=None):
+def distribute_coin(w3, coin, amount=200000, customAccount=None, pipeline=None):
     acct = w3.eth.defaultAccount
     if customAccount:
         acct = customAccount
-    transfer_amount = amount * 10 ** (coin.functions.decimals().call())
-    tx_hash = coin.functions.transfer(acct, transfer_amount).transact(
-        {'from': w3.eth.defaultAccount, 'gas': 5_000_000}
-    )
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    print(
-        f'Coin distribution successful. From = {w3.eth.defaultAccount} To = {acct} Amount = {amount}')
+    transfer_amount = amount * 10 ** (token_metadata.decimals(coin))
+    return send_transaction(
+        w3, coin.functions.transfer(acct, transfer_amount), {'from': w3.eth.defaultAccount, 'gas': 5_000_000},
+        pipeline,
+        lambda tx_receipt: print(
+            f'Coin distribution successful. From = {w3.eth.defaultAccount} To = {acct} Amount = {amount}'))
 
 
-def mintPositionTokens(w3, vault, coin, collateralAmount=20000, customAccount=None):
+def mintPositionTokens(w3, vault, coin, collateralAmount=20000, customAccount=None, pipeline=None):
     acct = w3.eth.defaultAccount
     if customAccount:
         acct = customAccount
     collateralAmount_unitless = collateralAmount * \
-                                10 ** (coin.functions.decimals().call())
-    tx_hash = coin.functions.approve(vault.address, collateralAmount_unitless).transact(
-        {'from': acct, 'gas': 5_000_000}
-    )
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-
-    tx_hash = vault.functions.mintFromCollateralAmount(collateralAmount_unitless).transact(
-        {'from': acct, 'gas': 5_000_000}
-    )
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
-    print(
-        f'Position tokens minted. Locked Coin: {collateralAmount} Minter: {acct}')
+                                10 ** (token_metadata.decimals(coin))
+    send_transaction(
+        w3, coin.functions.approve(vault.address, collateralAmount_unitless), {'from': acct, 'gas': 5_000_000},
+        pipeline)
+    return send_transaction(
+        w3, vault.functions.mintFromCollateralAmount(collateralAmount_unitless), {'from': acct, 'gas': 5_000_000},
+        pipeline,
+        lambda tx_receipt: print(f'Position tokens minted. Locked Coin: {collateralAmount} Minter: {acct}'))
 
 
 def simulate_scenario(w3, admin, deployed_contracts=None):
@@ -825,59 +1214,74 @@ def simulate_scenario(w3, admin, deployed_contracts=None):
     user3 = w3.eth.accounts[3]
     user4 = w3.eth.accounts[4]
 
-    distribute_coin(w3, coin, 200000, user1)
-    distribute_coin(w3, coin, 200000, user2)
-    distribute_coin(w3, coin, 200000, user3)
-    distribute_coin(w3, coin, 200000, user4)
-
-    mintPositionTokens(w3, vault, coin, 100000, user2)
-    mintPositionTokens(w3, vault, coin, 100000, user3)
-    mintPositionTokens(w3, vault, coin, 100000, user4)
-
-    reporter.print_balances(w3.eth.defaultAccount, 'User 0')
-    reporter.print_balances(user1, 'User 1')
-    reporter.print_balances(user2, 'User 2')
-    reporter.print_balances(user3, 'User 3')
-    reporter.print_balances(user4, 'User 4')
-
-    deposit(w3, y_vault, coin, 200000, user1)
-    deposit(w3, y_vault, coin, 100000, user2)
-    deposit(w3, y_vault, coin, 100000, user3)
-    deposit(w3, y_vault, coin, 100000, user4)
-    deposit(w3, y_vault, coin, 200000)
-    earn(w3, y_vault)
-
-    reporter.print_balances(y_vault.address, 'Y Vault')
-    reporter.print_balances(balancer.address, 'Balancer AMM')
-    reporter.print_balances(w3.eth.defaultAccount, 'User 0')
-    reporter.print_balances(user1, 'User 1')
-    reporter.print_balances(user2, 'User 2')
-    reporter.print_balances(user3, 'User 3')
-    reporter.print_balances(user4, 'User 4')
+    # Transactions are submitted in waves: each wave is sent without waiting for
+    # receipts and only transactions of later waves depend on other accounts' ones.
+    # Dependencies within an account are ordered by nonce.
+    with TransactionPipeline(w3) as pipeline:
+        for user in (user1, user2, user3, user4):
+            distribute_coin(w3, coin, 200000, user, pipeline=pipeline)
+
+    with TransactionPipeline(w3) as pipeline:
+        for user in (user2, user3, user4):
+            mintPositionTokens(w3, vault, coin, 100000, user, pipeline=pipeline)
+
+    reporter.print_all_balances([
+        (w3.eth.defaultAccount, 'User 0'),
+        (user1, 'User 1'),
+        (user2, 'User 2'),
+        (user3, 'User 3'),
+        (user4, 'User 4'),
+    ])
+
+    with TransactionPipeline(w3) as pipeline:
+        deposit(w3, y_vault, coin, 200000, user1, pipeline=pipeline)
+        deposit(w3, y_vault, coin, 100000, user2, pipeline=pipeline)
+        deposit(w3, y_vault, coin, 100000, user3, pipeline=pipeline)
+        deposit(w3, y_vault, coin, 100000, user4, pipeline=pipeline)
+    # Default account deposit and earn ordered by nonce, after other deposits
+    with TransactionPipeline(w3) as pipeline:
+        deposit(w3, y_vault, coin, 200000, pipeline=pipeline)
+        earn(w3, y_vault, pipeline=pipeline)
+
+    reporter.print_all_balances([
+        (y_vault.address, 'Y Vault'),
+        (balancer.address, 'Balancer AMM'),
+        (w3.eth.defaultAccount, 'User 0'),
+        (user1, 'User 1'),
+        (user2, 'User 2'),
+        (user3, 'User 3'),
+        (user4, 'User 4'),
+    ])
 
     # swap_amount_in(w3, balancer, ltk, 500, stk, user2, 100)
     # swap_amount_in(w3, balancer, stk, 500, ltk, user3, 100)
     # swap_amount_in(w3, balancer, ltk, 500, stk, user4, 100)
 
-    swap(w3, strategy, ltk, int(500000), stk, user=user2)
-    swap(w3, strategy, stk, int(500000), ltk, user=user3)
-    swap(w3, strategy, ltk, int(500000), stk, user=user4)
-
-    reporter.print_balances(y_vault.address, 'Y Vault')
-    reporter.print_balances(balancer.address, 'Balancer AMM')
-    reporter.print_balances(w3.eth.defaultAccount, 'User 0')
-    reporter.print_balances(user1, 'User 1')
-    reporter.print_balances(user2, 'User 2')
-    reporter.print_balances(user3, 'User 3')
-    reporter.print_balances(user4, 'User 4')
-
-    withdraw(w3, y_vault, 200000)
-    withdraw(w3, y_vault, 200000, user1)
-
-    reporter.print_balances(y_vault.address, 'Y Vault')
-    reporter.print_balances(balancer.address, 'Balancer AMM')
-    reporter.print_balances(w3.eth.defaultAccount, 'User 0')
-    reporter.print_balances(user1, 'User 1')
+    with TransactionPipeline(w3) as pipeline:
+        swap(w3, strategy, ltk, int(500000), stk, user=user2, pipeline=pipeline)
+        swap(w3, strategy, stk, int(500000), ltk, user=user3, pipeline=pipeline)
+        swap(w3, strategy, ltk, int(500000), stk, user=user4, pipeline=pipeline)
+
+    reporter.print_all_balances([
+        (y_vault.address, 'Y Vault'),
+        (balancer.address, 'Balancer AMM'),
+        (w3.eth.defaultAccount, 'User 0'),
+        (user1, 'User 1'),
+        (user2, 'User 2'),
+        (user3, 'User 3'),
+        (user4, 'User 4'),
+    ])
+
+    with TransactionPipeline(w3) as pipeline:
+        withdraw(w3, y_vault, 200000, pipeline=pipeline)
+        withdraw(w3, y_vault, 200000, user1, pipeline=pipeline)
+
+    reporter.print_all_balances([
+        (y_vault.address, 'Y Vault'),
+        (balancer.address, 'Balancer AMM'),
+        (w3.eth.defaultAccount, 'User 0'),
+        (user1, 'User 1'),
+    ])
 
 
 def update_oracle(w3, admin, vault, oracle, vault_address=None):
@@ -890,33 +1294,29 @@ def update_oracle(w3, admin, vault, oracle, vault_address=None):
     print(vault.functions.oracle().call())
 
 
-def swap(w3, strategy, tokenIn, amountIn, tokenOut, amountOut=1, user=None):
+def swap(w3, strategy, tokenIn, amountIn, tokenOut, amountOut=1, user=None, pipeline=None):
     if user == None:
         print('swapping using default user')
         user = w3.eth.defaultAccount
 
     # approve
-    tx_hash = tokenIn.functions.approve(strategy.address, amountIn).transact(
-        {'from': user, 'gas': 1_000_000}
-    )
-
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
+    send_transaction(
+        w3, tokenIn.functions.approve(strategy.address, amountIn), {'from': user, 'gas': 1_000_000}, pipeline)
 
     # swap
     MAX_UINT_VALUE = 2 ** 256 - 1
 
-    tx_hash = strategy.functions.swapExactAmountIn(tokenIn.address, amountIn, tokenOut.address, amountOut,
-                                                   MAX_UINT_VALUE).transact(
-        {'from': user, 'gas': 5_000_000}
-    )
-
-    tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
+    def report(tx_receipt):
+        # amount of tokens received, from this transaction's logs rather than latest block
+        logs = strategy.events.LOG_SWAP().processReceipt(tx_receipt)
+        amount_out = logs[0]['args']['tokenAmountOut']
+        print(
+            f'Swap successful from {tokenIn.address} to {tokenOut.address} with received amount = {amount_out}')
 
-    # amount of tokens received
-    logs = strategy.events.LOG_SWAP.getLogs()
-    amount_out = logs[0]['args']['tokenAmountOut']
-    print(
-        f'Swap successful from {tokenIn.address} to {tokenOut.address} with received amount = {amount_out}')
+    return send_transaction(
+        w3, strategy.functions.swapExactAmountIn(tokenIn.address, amountIn, tokenOut.address, amountOut,
+                                                 MAX_UINT_VALUE),
+        {'from': user, 'gas': 5_000_000}, pipeline, report)
 
 
 def get_balance(address, coin, ltk, stk):
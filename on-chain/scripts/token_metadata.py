@@ -0,0 +1,92 @@
+import os
+import json
+import weakref
+from pathlib import Path
+
+
+class TokenMetadata(object):
+    """Registry of immutable token fields (name, symbol, decimals)
+
+    Fields are fetched once per (chain id, token address), kept in memory and
+    persisted to a JSON file shared by mettalex_contract_setup and
+    setup_testnet_pool. Local development chains are not persisted as
+    redeployments there reuse addresses.
+    """
+    FIELDS = ('name', 'symbol', 'decimals')
+    # ganache-cli and Ganache UI chain ids
+    DEV_CHAIN_IDS = {1337, 5777}
+
+    def __init__(self, path=os.path.expanduser('~/.mettalex/token_metadata.json'), batch_call=None):
+        """
+        :param path: JSON file fields are persisted to
+        :param batch_call: optional callable(w3, contract_functions) returning list of
+            results, used by prefetch, default sequential calls
+        """
+        self.path = Path(path)
+        self.batch_call = batch_call
+        self._data = None
+        # Chain id per Web3 instance, dropped with the instance so a new provider is queried again
+        self._chain_ids = weakref.WeakKeyDictionary()
+
+    def _load(self):
+        if self._data is None:
+            self._data = {}
+            if self.path.is_file():
+                with open(self.path, 'r') as f:
+                    self._data = json.load(f)
+        return self._data
+
+    def _save(self):
+        persistent = {
+            key: value for key, value in self._data.items()
+            if int(key.split(':')[0]) not in self.DEV_CHAIN_IDS
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(persistent, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, tok):
+        w3 = tok.web3
+        if w3 not in self._chain_ids:
+            self._chain_ids[w3] = w3.eth.chainId
+        return f'{self._chain_ids[w3]}:{tok.address}'
+
+    def prefetch(self, toks):
+        """Fetch all missing fields of tokens, in one batched request if batch_call given"""
+        data = self._load()
+        missing = []
+        for tok in toks:
+            entry = data.setdefault(self._key(tok), {})
+            missing.extend((tok, entry, field) for field in self.FIELDS if field not in entry)
+        if not missing:
+            return
+        fns = [getattr(tok.functions, field)() for tok, _, field in missing]
+        if self.batch_call is not None:
+            values = self.batch_call(missing[0][0].web3, fns)
+        else:
+            values = [fn.call() for fn in fns]
+        for (_, entry, field), value in zip(missing, values):
+            entry[field] = value
+        self._save()
+
+    def get(self, tok, field):
+        entry = self._load().setdefault(self._key(tok), {})
+        if field not in entry:
+            entry[field] = getattr(tok.functions, field)().call()
+            self._save()
+        return entry[field]
+
+    def details(self, tok):
+        self.prefetch([tok])
+        return {'adress': tok.address, **self._load()[self._key(tok)]}
+
+    def decimals(self, tok):
+        return self.get(tok, 'decimals')
+
+    def symbol(self, tok):
+        return self.get(tok, 'symbol')
+
+    def name(self, tok):
+        return self.get(tok, 'name')
@@ -1,10 +1,18 @@
 import os
+import sys
 import json
 from web3.middleware import construct_sign_and_send_raw_middleware
 from pathlib import Path
 from glob import glob
 import argparse
 
+# Token metadata registry shared with on-chain/scripts/mettalex_contract_setup
+sys.path.append(str(Path(__file__).parent / 'on-chain' / 'scripts'))
+from token_metadata import TokenMetadata  # noqa: E402
+
+
+token_metadata = TokenMetadata()
+
 
 def read_config(contracts=None, get_related=True):
     # Read configuration from local file system
@@ -82,9 +90,9 @@ def print_token_balance(name, tok, holder_address):
     :return: None, prints balance
     """
     tok_address = tok.address
-    tok_decimals = tok.functions.decimals().call()
+    tok_decimals = token_metadata.decimals(tok)
     tok_balance = tok.functions.balanceOf(holder_address).call()/ 10 ** tok_decimals
-    tok_symbol = tok.functions.symbol().call()
+    tok_symbol = token_metadata.symbol(tok)
     print(f'{name:20} ({tok_address}): {tok_balance:8} {tok_symbol}')
 
 
@@ -141,8 +149,8 @@ def approve_pool(w3, pool, tok, balance):
     )
     tx_receipt = w3.eth.waitForTransactionReceipt(tx_hash)
     owner, spender, value = tok.events.Approval().processReceipt(tx_receipt)[0]['args'].values()
-    value_scaled = value / (10 ** int(tok.functions.decimals().call()))
-    tok_symbol = tok.functions.symbol().call()
+    value_scaled = value / (10 ** token_metadata.decimals(tok))
+    tok_symbol = token_metadata.symbol(tok)
     print(f'{owner} approved {spender} to spend {value_scaled} {tok_symbol}')
 
 
@@ -255,7 +263,7 @@ def bind_pool(
         # from Balancer Bankless article is use percentage divided by 2
         denorm_wt = int(tok_wt * 10**18 / 2)
         tok = contracts[tok_name]
-        tok_decimals = tok.functions.decimals().call()
+        tok_decimals = token_metadata.decimals(tok)
         tok_qty = int(tok_wt / 100 * amount_collateral / tok_price * (10 ** tok_decimals))
         tok_qty_unit = tok_qty / (10**tok_decimals)
         print(f'{tok_name}: weight {tok_wt} = {denorm_wt}, qty {tok_qty_unit} = {tok_qty}')
@@ -334,7 +342,7 @@ def get_pool_balance(w3, contracts, pool_name='SS_BPOOL', tokens=None):
     for token_name in tokens:
         tok = contracts[token_name]
         wt = pool.functions.getNormalizedWeight(contracts[token_name].address).call() / 10**18
-        balance = pool.functions.getBalance(tok.address).call() / 10 ** (tok.functions.decimals().call())
+        balance = pool.functions.getBalance(tok.address).call() / 10 ** (token_metadata.decimals(tok))
         print(f'Pool at {pool.address} has {token_name} weight {wt} and balance {balance} ')
 
 
@@ -364,8 +372,8 @@ def get_spot_price(w3, pool, tok_in, tok_out, unitless=True, include_fee=True):
     if not unitless:
         # Take decimals into account
         spot_price = spot_price * 10**(
-                tok_out.functions.decimals().call()
-                - tok_in.functions.decimals().call()
+                token_metadata.decimals(tok_out)
+                - token_metadata.decimals(tok_in)
                 - 18)
     return spot_price
 
@@ -377,7 +385,7 @@ def calc_out_given_in(w3, pool, tok_in, tok_out, qty_in, unitless=True):
     balance_out = pool.functions.getBalance(tok_out.address).call()
     wt_out = pool.functions.getDenormalizedWeight(tok_out.address).call()
 
-    qty_in_unitless = int(qty_in * 10**(tok_in.functions.decimals().call()))
+    qty_in_unitless = int(qty_in * 10**(token_metadata.decimals(tok_in)))
 
     fee = pool.functions.getSwapFee().call()
 
@@ -385,7 +393,7 @@ def calc_out_given_in(w3, pool, tok_in, tok_out, qty_in, unitless=True):
         balance_in, wt_in, balance_out, wt_out, qty_in_unitless, fee
     ).call()
     if not unitless:
-        out_tokens /= 10**(tok_out.functions.decimals().call())
+        out_tokens /= 10**(token_metadata.decimals(tok_out))
     return out_tokens
 
 
@@ -418,7 +426,7 @@ def get_public_swap(w3, pool):
 def swap_amount_in(w3, pool, tok_in, qty_in, tok_out, min_qty_out=None, max_price=None):
     acct = w3.eth.defaultAccount
 
-    qty_in_unitless = int(qty_in * 10**(tok_in.functions.decimals().call()))
+    qty_in_unitless = int(qty_in * 10**(token_metadata.decimals(tok_in)))
 
     if qty_in_unitless > tok_in.functions.allowance(acct, pool.address).call():
         approve_pool(w3, pool, tok_in, qty_in_unitless)
@@ -434,7 +442,7 @@ def swap_amount_in(w3, pool, tok_in, qty_in, tok_out, min_qty_out=None, max_pric
         max_price = int(spot_price_unitless * 1/0.9)
         print(f'Max price not specified: using {max_price}')
 
-    min_qty_out_unitless = int(min_qty_out * 10**(tok_out.functions.decimals().call()))
+    min_qty_out_unitless = int(min_qty_out * 10**(token_metadata.decimals(tok_out)))
 
     tx_hash = pool.functions.swapExactAmountIn(
         tok_in.address, qty_in_unitless,